@@ -12,7 +12,8 @@ import gevent
 # -- own --
 from client.core.common import ForcedKill
 from endpoint import Endpoint
-from game.base import Gamedata
+from game.base import Gamedata, GamedataInbox
+from utils import Packet
 
 
 # -- code --
@@ -23,6 +24,7 @@ class Server(Endpoint, Greenlet):
     '''
     Used at client side, to represent server
     '''
+    wire_format = Endpoint.FMT_PACKED
 
     def __init__(self, sock, addr):
         Endpoint.__init__(self, sock, addr)
@@ -49,14 +51,14 @@ class Server(Endpoint, Greenlet):
 
     def gwrite(self, tag, data):
         log.debug('GAME_WRITE: %s', repr([tag, data]))
-        encoded = self.encode(['gamedata', [tag, data]])
+        encoded = Gamedata.encode(tag, data, self.wire_format)
         self.raw_write(encoded)
 
     def wait_till_live(self):
         self.gamedata.wait_empty()
 
     def gamedata_piled(self):
-        return len(self.gamedata.gdqueue) > 60
+        return len(self.gamedata.inbox) > 60
 
     def shutdown(self):
         self.kill()
@@ -67,26 +69,44 @@ class Server(Endpoint, Greenlet):
 
 class ReplayEndpoint(object):
     def __init__(self, replay, game):
-        self.gdlist = list(replay.gamedata)
+        self.replay = replay
+        self.gdstream = iter(replay.gamedata)
+        self.inbox = GamedataInbox()
         self.game = game
+        self.consumed = 0
+        self.seek_to = 0
 
-    def gexpect(self, tag):
-        if not self.gdlist:
-            gevent.sleep(3)
-            raise ForcedKill
+    def seek(self, synctag):
+        '''
+        Fast forward to synctag: playback runs without delays until the
+        packet at synctag (found with the replay index) is reached.
+        Game state can't be restored, so only forward seeking works.
+        '''
+        self.seek_to = max(self.seek_to, self.replay.locate(synctag))
+
+    @property
+    def seeking(self):
+        return self.consumed < self.seek_to
 
+    def gexpect(self, tag):
         glob = False
         if tag.endswith('*'):
             tag = tag[:-1]
             glob = True
 
-        for i, d in enumerate(self.gdlist):
-            if d[0] == tag or (glob and d[0].startswith(tag)):
-                del self.gdlist[i]
-                return d
+        inbox = self.inbox
+        while True:
+            packet = inbox.take(tag, glob)
+            if packet is not None:
+                return packet
+
+            d = next(self.gdstream, None)
+            if d is None:
+                gevent.sleep(3)
+                raise ForcedKill
 
-        gevent.sleep(3)
-        raise ForcedKill
+            self.consumed += 1
+            inbox.put(Packet(d))
 
     def gwrite(self, tag, data):
         pass
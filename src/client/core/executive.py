@@ -15,6 +15,7 @@ from autoupdate import Autoupdate
 from client.core.common import ForcedKill
 from client.core.endpoint import ReplayEndpoint, Server
 from client.core.replay import Replay
+from endpoint import Endpoint
 from utils import BatchList, instantiate
 
 
@@ -35,6 +36,9 @@ class GameManager(Greenlet):
         self.last_replay    = None
         self.event_cb       = event_cb
         self.server_name    = 'OFFLINE'
+        self.lobby_version  = None
+        self.lobby_games    = {}  # gid -> game info
+        self.lobby_users    = {}  # uid -> user info
 
     def _run(self):
         self.link_exception(lambda *a: self.event_cb('server_dropped'))
@@ -214,8 +218,63 @@ class GameManager(Greenlet):
                 Executive.disconnect()
             else:
                 self.server_name = name
+                # servers knowing FMT_COMPACT answer with a wire_format
+                Executive.server.write(['wire_format', [Endpoint.FMT_COMPACT, Endpoint.compact_schema()]])
+                Executive.server.write(['sync_batch', [True]])
                 self.event_cb('server_connected', self)
 
+        @handler(None, None)
+        def wire_format(self, data):
+            fmt, schema = data
+            if fmt == Endpoint.FMT_COMPACT and schema == Endpoint.compact_schema():
+                Executive.server.wire_format = Endpoint.FMT_COMPACT
+
+        def lobby_games_changed():
+            # ui code mutates what it gets
+            self.event_cb('current_games', [dict(i) for i in self.lobby_games.values()])
+
+        def lobby_users_changed():
+            self.event_cb('current_users', [dict(i) for i in self.lobby_users.values()])
+
+        @handler(None, None)
+        def lobby_version(self, ver):
+            self.lobby_version = ver
+
+        @handler(None, None)
+        def current_games(self, games):
+            self.lobby_games = {gi['id']: gi for gi in games}
+            lobby_games_changed()
+
+        @handler(None, None)
+        def current_users(self, users):
+            self.lobby_users = {Account.parse(u['account']).userid: u for u in users}
+            lobby_users_changed()
+
+        @handler(None, None)
+        def lobby_delta(self, data):
+            base, ver, games, removed_games, users, removed_users = data
+            if base != self.lobby_version:
+                # missed something, ask for a snapshot
+                self.lobby_version = None
+                Executive.get_lobbyinfo()
+                return
+
+            self.lobby_version = ver
+
+            if games or removed_games:
+                for gid in removed_games:
+                    self.lobby_games.pop(gid, None)
+
+                self.lobby_games.update((gi['id'], gi) for gi in games)
+                lobby_games_changed()
+
+            if users or removed_users:
+                for uid in removed_users:
+                    self.lobby_users.pop(uid, None)
+
+                self.lobby_users.update((Account.parse(u['account']).userid, u) for u in users)
+                lobby_users_changed()
+
         @handler(None, None)
         def ping(self, _):
             Executive.pong()
@@ -142,13 +142,28 @@ class TheChosenOne(game.base.AbstractPlayer):
 
     def __init__(self, server):
         self.server = server
+        self.synced = {}  # synctag -> data, from batched reveals
         game.base.AbstractPlayer.__init__(self)
 
+    def expect_sync(self, st):
+        # server sends 'Sync:<st>', or 'Sync:<first>:<last>' batching
+        # [[st, data], ...] for several reveals, see server flush_reveals
+        synced = self.synced
+        while st not in synced:
+            tag, data = self.server.gexpect('Sync:*')
+            l = tag.split(':')
+            if len(l) == 2:
+                synced[int(l[1])] = data
+            else:
+                synced.update(data)
+
+        return synced.pop(st)
+
     def reveal(self, obj_list):
         # It's me, server will tell me what the hell these is.
         g = Game.getgame()
         st = g.get_synctag()
-        _, raw_data = self.server.gexpect('Sync:%d' % st)
+        raw_data = self.expect_sync(st)
         if isinstance(obj_list, (list, tuple)):
             for o, rd in zip(obj_list, raw_data):
                 o.sync(rd)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 # -- stdlib --
+import bisect
+import struct
 import zlib
 
 # -- third party --
@@ -10,7 +12,113 @@ import msgpack
 
 
 # -- code --
+REPLAY_MAGIC = 'THBREP2\n'
+
+
+def _pack(o):
+    return zlib.compress(msgpack.packb(o, use_bin_type=True))
+
+
+def _unpack(s):
+    return msgpack.unpackb(zlib.decompress(s), encoding='utf-8')
+
+
+def _synctag(tag):
+    # 'Sync:123', 'RI:ChooseOption:123' -> 123
+    try:
+        return int(tag[tag.rfind(':') + 1:])
+    except ValueError:
+        return None
+
+
+class ReplayGamedata(object):
+    '''
+    Lazily decoded game data of a replay file.
+    Only the chunks actually touched get inflated.
+
+    index: [[offset, length, count, first_synctag, last_synctag], ...]
+    '''
+
+    def __init__(self, data, index):
+        self.data = data
+        self.index = index
+        self.starts = []
+        n = 0
+        for entry in index:
+            self.starts.append(n)
+            n += entry[2]
+
+        self.count = n
+        self._cached = (None, None)
+
+    def __len__(self):
+        return self.count
+
+    def chunk(self, i):
+        ci, packets = self._cached
+        if ci == i:
+            return packets
+
+        offset, length = self.index[i][:2]
+        packets = _unpack(self.data[offset:offset + length])
+        self._cached = (i, packets)
+        return packets
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+
+        ci = bisect.bisect_right(self.starts, i) - 1
+        return self.chunk(ci)[i - self.starts[ci]]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        for ci, base in enumerate(self.starts):
+            count = self.index[ci][2]
+            if base + count <= start:
+                continue
+
+            for p in self.chunk(ci)[max(0, start - base):]:
+                yield p
+
+    def locate(self, synctag):
+        '''
+        Index of the first packet at or after synctag,
+        found through the chunk index.
+        '''
+        for ci, entry in enumerate(self.index):
+            last = entry[4]
+            if last is None or last < synctag:
+                continue
+
+            base = self.starts[ci]
+            for i, p in enumerate(self.chunk(ci)):
+                st = _synctag(p[0])
+                if st is not None and st >= synctag:
+                    return base + i
+
+        return self.count
+
+
 class Replay(object):
+    '''
+    Replay container.
+
+    REPLAY_MAGIC, then a length prefixed compressed meta dict, followed
+    by compressed chunks of CHUNK_SIZE gamedata packets, the chunk index
+    and finally the (offset, length) of the index.
+    Chunks double as checkpoints: the index records the synctag range of
+    each one, so packets can be streamed or located without inflating
+    the whole file.
+
+    Replays in the old format (one zlib compressed msgpack blob) are
+    converted on load, dumps() always writes the current format.
+    '''
+
+    CHUNK_SIZE = 256
+
     __slots__ = (
         'version',
         'client_version',
@@ -24,7 +132,7 @@ class Replay(object):
     )
 
     def __init__(self):
-        self.version = 1
+        self.version = 2
         self.client_version = None
         self.game_mode = None
         self.game_params = {}
@@ -35,28 +143,91 @@ class Replay(object):
         self.track_info = None
 
     def dumps(self):
-        return zlib.compress(msgpack.packb({
-            'ver':        self.version,
+        meta = _pack({
+            'ver':        2,
             'cliver':     self.client_version,
             'mode':       self.game_mode,
             'params':     self.game_params,
             'items':      self.game_items,
-            'data':       self.gamedata,
             'users':      self.users,
             'index':      self.me_index,
             'track_info': self.track_info,
-        }, use_bin_type=True))
+        })
+
+        out = [REPLAY_MAGIC, struct.pack('>I', len(meta)), meta]
+        offset = len(REPLAY_MAGIC) + 4 + len(meta)
+        index = []
+
+        gamedata = list(self.gamedata)
+        n = self.CHUNK_SIZE
+        for i in xrange(0, len(gamedata), n):
+            packets = gamedata[i:i + n]
+            synctags = [_synctag(p[0]) for p in packets]
+            synctags = [st for st in synctags if st is not None]
+            chunk = _pack(packets)
+            index.append([
+                offset, len(chunk), len(packets),
+                min(synctags) if synctags else None,
+                max(synctags) if synctags else None,
+            ])
+            out.append(chunk)
+            offset += len(chunk)
+
+        index = _pack(index)
+        out.append(index)
+        out.append(struct.pack('>II', offset, len(index)))
+
+        return ''.join(out)
+
+    def locate(self, synctag):
+        '''
+        Index of the first gamedata packet at or after synctag.
+        '''
+        gd = self.gamedata
+        if isinstance(gd, ReplayGamedata):
+            return gd.locate(synctag)
+
+        for i, p in enumerate(gd):
+            st = _synctag(p[0])
+            if st is not None and st >= synctag:
+                return i
+
+        return len(gd)
 
     @classmethod
     def loads(cls, replay_data):
+        if not replay_data.startswith(REPLAY_MAGIC):
+            return cls.loads_legacy(replay_data)
+
+        pos = len(REPLAY_MAGIC)
+        l, = struct.unpack_from('>I', replay_data, pos)
+        pos += 4
+        data = _unpack(replay_data[pos:pos + l])
+
+        offset, l = struct.unpack_from('>II', replay_data, len(replay_data) - 8)
+        index = _unpack(replay_data[offset:offset + l])
+
+        o = cls._from_meta(data)
+        o.gamedata = ReplayGamedata(replay_data, index)
+
+        return o
+
+    @classmethod
+    def loads_legacy(cls, replay_data):
         data = msgpack.unpackb(zlib.decompress(replay_data), encoding='utf-8')
+        o = cls._from_meta(data)
+        o.gamedata = data['data']
+
+        return o
+
+    @classmethod
+    def _from_meta(cls, data):
         o = cls()
         o.version        = data['ver']
         o.client_version = data['cliver']
         o.game_mode      = data['mode']
         o.game_params    = data['params']
         o.game_items     = data['items']
-        o.gamedata       = data['data']
         o.users          = data['users']
         o.me_index       = data['index']
         o.track_info     = data['track_info']
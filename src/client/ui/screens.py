@@ -1576,10 +1576,14 @@ class ReplayScreen(Screen):
                 anchor_x='left', anchor_y='bottom',
             )
 
+            self.txt_seek = TextBox(text=u'', parent=self, x=110, y=102, width=45, height=22)
+            self.btn_seek = Button(u'跳转', parent=self, x=160, y=101, width=30, height=24)
+
             self.btn_start.event('on_click')(self.start)
             self.btn_pause.event('on_click')(self.pause)
             self.btn_brake.event('on_click')(self.brake)
             self.btn_accel.event('on_click')(self.accel)
+            self.btn_seek.event('on_click')(self.seek)
 
         def start(self):
             self.parent.start_replay()
@@ -1605,7 +1609,18 @@ class ReplayScreen(Screen):
             self.delay = max(self.delay - 0.1, 0.2)
             self.delay_lbl.text = u'当前延迟：%s秒' % self.delay
 
+        def seek(self):
+            try:
+                synctag = int(self.txt_seek.text)
+            except ValueError:
+                return
+
+            self.parent.game.me.server.seek(synctag)
+
         def handle_delay(self, evt, _):
+            if self.parent.game.me.server.seeking:
+                return
+
             gevent.sleep(self.delay)
             self.running.wait()
 
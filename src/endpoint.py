@@ -3,16 +3,20 @@ from __future__ import absolute_import
 
 # -- stdlib --
 from collections import deque
+import hashlib
 import json
 import logging
+import time
 import zlib
 
 # -- third party --
-from gevent import socket
-from gevent.lock import RLock
+from gevent import getcurrent, socket
+import gevent
 import msgpack
 
 # -- own --
+from utils.metrics import metrics
+
 
 # -- code --
 log = logging.getLogger("Endpoint")
@@ -26,6 +30,65 @@ class DecodeError(Exception):
     pass
 
 
+class CompactTable(object):
+    '''
+    Name <-> small int table for FMT_COMPACT ext types,
+    built from `names` on first use.
+    '''
+
+    def __init__(self, names):
+        self.names_func = names
+        self.names      = None
+        self.ids        = None
+
+    def build(self):
+        self.names = list(self.names_func())
+        self.ids = {n: i for i, n in enumerate(self.names)}
+        return self.ids
+
+    def id_or_name(self, name):
+        return (self.ids or self.build()).get(name, name)
+
+    def id_of(self, name):
+        self.ids is None and self.build()
+        return self.ids[name]
+
+    def name_of(self, i):
+        self.names is None and self.build()
+        return self.names[i]
+
+    def digest(self):
+        self.names is None and self.build()
+        return self.names
+
+
+def _default(o):
+    return o.__data__() if hasattr(o, '__data__') else repr(o)
+
+
+def _compact(o):
+    # objects come inline as [mark, field, ...], see register_compact
+    f = getattr(o, '__compact__', None)
+    return f() if f else _default(o)
+
+
+class CompactValue(object):
+    '''
+    Inline FMT_COMPACT form of an object, see Endpoint.snapshot.
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __compact__(self):
+        return self.value
+
+    def __data__(self):
+        v = self.value
+        return Endpoint.compact_decoders[v[0].code](v[1:])
+
+
 class Endpoint(object):
 
     ENDPOINT_DEBUG = False
@@ -33,18 +96,48 @@ class Endpoint(object):
     FMT_PACKED          = 1
     FMT_BULK_COMPRESSED = 2
     FMT_RAW_JSON        = 3
+    FMT_COMPACT         = 4
+
+    # FMT_COMPACT ext types, see register_compact
+    compact_decoders = {}
+    compact_tables   = {}
+    compact_marks    = {}  # code -> empty ext, heading inline objects
+
+    SEND_QUEUE_LIMIT    = 4 * 1024 * 1024  # bytes a peer may fall behind before dropped, None for no limit
+    SEND_BATCH_BYTES    = 256 * 1024       # coalesce queued frames up to this much per send
+    BULK_COMPRESS_BYTES = None             # send bigger bursts as one FMT_BULK_COMPRESSED frame
+    CLOSE_FLUSH_TIMEOUT = 3
+    MAX_PACKET_BYTES    = 8 * 1024 * 1024  # bigger frames, packed or inflated, kill the link
+
+    # filled by recv_into and fed to the unpacker right away without
+    # yielding to the hub, so one buffer serves every endpoint
+    _recv_buffer = bytearray(64 * 1024)
+
+    # encode([fmt, p]) is one of these followed by packed p
+    _COMPACT_PREFIX  = '\x92\x04'
+    _PACKED_PREFIXES = ('\x92\x01', _COMPACT_PREFIX)
 
     def __init__(self, sock, address):
-        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         sock.read       = sock.recv
         sock.write      = sock.sendall
 
         self.sock       = sock
-        self.unpacker   = msgpack.Unpacker(sock, encoding='utf-8')
-        self.writelock  = RLock()
+        self.unpacker   = msgpack.Unpacker(
+            encoding='utf-8',
+            ext_hook=Endpoint.compact_ext_hook,
+            list_hook=Endpoint.compact_list_hook,
+            max_buffer_size=self.MAX_PACKET_BYTES,
+        )
         self.address    = address
         self.link_state = 'connected'  # or disconnected
         self.recv_buf   = deque()
+        self.send_queue = deque()
+        self.send_bytes = 0
+        self.sender     = None
+        self.closer     = None
 
     def __repr__(self):
         return '%s:%s:%s' % (
@@ -55,23 +148,24 @@ class Endpoint(object):
 
     @staticmethod
     def encode(p, format=FMT_PACKED):
-        def default(o):
-            return o.__data__() if hasattr(o, '__data__') else repr(o)
-
         if format == Endpoint.FMT_PACKED:
-            return msgpack.packb([Endpoint.FMT_PACKED, p], default=default, use_bin_type=True)
+            return msgpack.packb([Endpoint.FMT_PACKED, p], default=_default, use_bin_type=True)
+        elif format == Endpoint.FMT_COMPACT:
+            return msgpack.packb([Endpoint.FMT_COMPACT, p], default=_compact, use_bin_type=True)
         elif format == Endpoint.FMT_BULK_COMPRESSED:
             assert isinstance(p, list)
-            data = msgpack.packb(p, default=default, use_bin_type=True)
+            data = msgpack.packb(p, default=_default, use_bin_type=True)
             return msgpack.packb([Endpoint.FMT_BULK_COMPRESSED, zlib.compress(data)], use_bin_type=True)
         elif format == Endpoint.FMT_RAW_JSON:
-            return json.dumps(p, default=default)
+            return json.dumps(p, default=_default)
         else:
             raise Exception('WTF?!')
 
     @classmethod
     def decode(cls, s):
-        return cls.decode_packet(msgpack.unpackb(s, encoding='utf-8'))[1]
+        return cls.decode_packet(msgpack.unpackb(
+            s, encoding='utf-8', ext_hook=cls.compact_ext_hook, list_hook=cls.compact_list_hook,
+        ))[1]
 
     @staticmethod
     def decode_packet(p):
@@ -80,32 +174,199 @@ class Endpoint(object):
                 raise DecodeError
 
             fmt, data = p
-            if fmt == Endpoint.FMT_PACKED:
+            if fmt in (Endpoint.FMT_PACKED, Endpoint.FMT_COMPACT):
                 return fmt, data
             elif fmt == Endpoint.FMT_BULK_COMPRESSED:
                 try:
-                    inflated = zlib.decompress(data)
+                    d = zlib.decompressobj()
+                    inflated = d.decompress(data, Endpoint.MAX_PACKET_BYTES)
                 except Exception:
                     raise DecodeError
 
-                return fmt, msgpack.unpackb(inflated, encoding='utf-8', ext_hook=lambda code, data: None)
+                if d.unconsumed_tail:
+                    log.error('Bulk frame inflates to more than %d bytes', Endpoint.MAX_PACKET_BYTES)
+                    raise DecodeError
+
+                return fmt, msgpack.unpackb(
+                    inflated, encoding='utf-8',
+                    ext_hook=Endpoint.compact_ext_hook,
+                    list_hook=Endpoint.compact_list_hook,
+                )
             else:
                 raise DecodeError
         except (ValueError, msgpack.UnpackValueError):
             raise DecodeError
 
+    # -- FMT_COMPACT --
+    @classmethod
+    def register_compact(cls, code, decode, table=None):
+        '''
+        Returns the mark of ext type `code`, an empty msgpack ext.
+        Objects with __compact__() returning [mark, fields ...] are sent
+        inline like that in FMT_COMPACT, with no nested packing, and decoded
+        back by decode([fields ...]) to what their __data__() would give.
+        Name <-> id tables used go into compact_schema().
+        '''
+        assert code not in cls.compact_decoders, 'Duplicated compact code %s' % code
+        cls.compact_decoders[code] = decode
+        cls.compact_marks[code] = mark = msgpack.ExtType(code, b'')
+        if table:
+            cls.compact_tables[code] = table
+
+        return mark
+
+    @classmethod
+    def compact_schema(cls):
+        '''
+        Digest of registered ext types, peers agreeing on it can talk FMT_COMPACT.
+        '''
+        tables = cls.compact_tables
+        l = ['inline'] + [(code, code in tables and tables[code].digest()) for code in sorted(cls.compact_decoders)]
+        return hashlib.md5(repr(l)).hexdigest()
+
+    @classmethod
+    def snapshot(cls, o):
+        '''
+        o as it would be encoded right now, later changes to o don't show.
+        '''
+        if hasattr(o, '__compact__'):
+            v = o.__compact__()
+            return CompactValue([v[0]] + cls.snapshot(v[1:]))
+        elif hasattr(o, '__data__'):
+            return cls.snapshot(o.__data__())
+        elif isinstance(o, (list, tuple)):
+            return [cls.snapshot(i) for i in o]
+        elif isinstance(o, dict):
+            return {k: cls.snapshot(v) for k, v in o.iteritems()}
+
+        return o
+
+    @staticmethod
+    def compact_ext_hook(code, data):
+        if not data:  # mark of an inline object, see compact_list_hook
+            return Endpoint.compact_marks.get(code) or msgpack.ExtType(code, data)
+
+        # objects packed into the ext itself, as older peers do
+        decode = Endpoint.compact_decoders.get(code)
+        if not decode:
+            return None
+
+        try:
+            return decode(msgpack.unpackb(
+                data, encoding='utf-8',
+                ext_hook=Endpoint.compact_ext_hook,
+                list_hook=Endpoint.compact_list_hook,
+            ))
+        except (ValueError, TypeError, LookupError):
+            return None
+
+    @staticmethod
+    def compact_list_hook(l):
+        if not l or l[0].__class__ is not msgpack.ExtType:
+            return l
+
+        decode = Endpoint.compact_decoders.get(l[0].code)
+        if not decode:
+            return None
+
+        try:
+            return decode(l[1:])
+        except (ValueError, TypeError, LookupError):
+            return None
+
     def raw_write(self, s):
-        if self.link_state == 'connected':
-            if Endpoint.ENDPOINT_DEBUG:
-                log.debug("SEND>> %s" % self.decode(s))
-            try:
-                with self.writelock:
-                    self.sock.sendall(s)
-            except IOError:
-                self.close()
-        else:
+        '''
+        Send encoded data, without blocking the caller. See queue_write.
+        '''
+        return self.queue_write(s)
+
+    def queue_write(self, s):
+        '''
+        Queue encoded data for the sender greenlet.
+        Peers falling more than SEND_QUEUE_LIMIT bytes behind are dropped.
+        '''
+        if self.link_state != 'connected':
+            return False
+
+        limit = self.SEND_QUEUE_LIMIT
+        if limit is not None and self.send_bytes + len(s) > limit:
+            log.info('%r falls behind, dropping', self)
+            self.send_queue.clear()
+            self.send_bytes = 0
+            self.link_state = 'dropping'
+            gevent.spawn(self.close)
             return False
 
+        self.send_queue.append(s)
+        self.send_bytes += len(s)
+        if not self.sender:
+            self.sender = gevent.spawn(self._drain_send_queue)
+
+        return True
+
+    def _drain_send_queue(self):
+        q = self.send_queue
+        try:
+            while q and self.link_state == 'connected':
+                frames, size = [], 0
+                while q and size < self.SEND_BATCH_BYTES:
+                    s = q.popleft()
+                    frames.append(s)
+                    size += len(s)
+
+                self.send_bytes -= size
+                if Endpoint.ENDPOINT_DEBUG:
+                    for s in frames:
+                        log.debug("SEND>> %s" % self.decode(s))
+
+                data = self.coalesce(frames, size)
+                if metrics.enabled:
+                    begin = time.time()
+                    self.sock.sendall(data)
+                    metrics.observe('socket_write', self.__class__.__name__, (time.time() - begin) * 1000)
+                else:
+                    self.sock.sendall(data)
+
+        except IOError:
+            self.close()
+
+        finally:
+            self.sender = None
+
+    def coalesce(self, frames, size):
+        '''
+        Join encoded frames for a single send. Bursts of FMT_PACKED/COMPACT frames
+        bigger than BULK_COMPRESS_BYTES become one FMT_BULK_COMPRESSED frame,
+        made without decoding them again.
+        '''
+        if len(frames) == 1:
+            return frames[0]
+
+        threshold = self.BULK_COMPRESS_BYTES
+        prefixes = self._PACKED_PREFIXES
+        if threshold and size >= threshold and all(s[:2] in prefixes for s in frames):
+            data = msgpack.Packer().pack_array_header(len(frames)) + ''.join(s[2:] for s in frames)
+            return msgpack.packb([Endpoint.FMT_BULK_COMPRESSED, zlib.compress(data)], use_bin_type=True)
+
+        return ''.join(frames)
+
+    def flush(self, timeout=None):
+        '''
+        Wait until queued data is sent.
+        '''
+        sender = self.sender
+        if sender and sender is not getcurrent():
+            sender.join(timeout)
+
+    @staticmethod
+    def broadcast(endpoints, s):
+        '''
+        Queue one encoded buffer to many endpoints, e.g. observers.
+        Slow endpoints are dropped instead of stalling the caller.
+        '''
+        for ep in endpoints:
+            ep.queue_write(s)
+
     def write(self, p, format=FMT_PACKED):
         '''
         Send json encoded packet
@@ -113,10 +374,50 @@ class Endpoint(object):
         self.raw_write(self.encode(p, format))
 
     def close(self):
-        if not self.link_state == 'disconnected':
+        '''
+        Close the link once queued data is sent, giving up after
+        CLOSE_FLUSH_TIMEOUT. Never blocks the caller: the lobby closes
+        clients inline, one slow peer must not hold up the rest.
+        '''
+        if self.link_state == 'disconnected':
+            return
+
+        sender = self.sender
+        if sender and sender is not getcurrent():
+            if not self.closer:
+                self.closer = gevent.spawn(self._close_after_flush)
+
+            return
+
+        self._close()
+
+    def _close_after_flush(self):
+        self.flush(self.CLOSE_FLUSH_TIMEOUT)
+        self._close()
+
+    def _close(self):
+        if self.link_state != 'disconnected':
             self.link_state = 'disconnected'
             self.sock.close()
 
+    def _recv(self):
+        buf = self._recv_buffer
+        try:
+            n = self.sock.recv_into(buf)
+        except IOError:
+            n = 0
+
+        if not n:
+            self.close()
+            raise EndpointDied
+
+        try:
+            self.unpacker.feed(memoryview(buf)[:n])
+        except msgpack.BufferFull:
+            log.error('%r sent a frame bigger than %d bytes, closing', self, self.MAX_PACKET_BYTES)
+            self.close()
+            raise EndpointDied
+
     def read(self):
         if self.link_state != 'connected':
             raise EndpointDied
@@ -131,9 +432,9 @@ class Endpoint(object):
                     packet = u.next()
                 except msgpack.UnpackValueError:
                     raise DecodeError
-                except (StopIteration, IOError):
-                    self.close()
-                    raise EndpointDied
+                except StopIteration:
+                    self._recv()
+                    continue
 
                 fmt, d = self.decode_packet(packet)
                 if fmt == Endpoint.FMT_BULK_COMPRESSED:
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+import gzip
+import json
+import logging
+import struct
+import time
+import zlib
+
+# -- third party --
+from gevent.hub import get_hub
+from gevent.queue import Empty, Queue
+import gevent
+import msgpack
+
+# -- own --
+from endpoint import Endpoint
+from utils import ObjectDict
+
+
+# -- code --
+log = logging.getLogger('game.archive')
+
+ARCHIVE_MAGIC = 'THBARC1\n'
+
+
+class ArchiveWriter(object):
+    '''
+    Server side game archive.
+
+    A gzip file made of several gzip members, each one a chunk of the
+    record stream. The decompressed stream is ARCHIVE_MAGIC followed by
+    length prefixed (4 bytes, big endian) msgpack records:
+
+        ['header', {...}]             once, at the beginning
+        ['gd', idx, frame]            encoded ['gamedata', [tag, data]] frame
+                                      sent to users[idx]
+        ['ugd', idx, tag, data]       game data sent by users[idx], packed
+        ['end', {...}]                once, when the game is archived
+
+    Chunks are compressed and appended in the hub threadpool as the game
+    runs, at least every FLUSH_INTERVAL seconds even if the game stalls,
+    so a crashed server still leaves everything but the last few seconds.
+    A missing 'end' record means the archive was not finalized.
+    '''
+    FLUSH_SIZE     = 64 * 1024
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, path, header):
+        self.path       = path
+        self.buf        = [ARCHIVE_MAGIC]
+        self.buf_size   = len(ARCHIVE_MAGIC)
+        self.last_flush = time.time()
+        self.closed     = False
+        self.chunks     = Queue()
+        self.writer     = gevent.spawn(self._drain)
+        self.writer.gr_name = 'ArchiveWriter: %s' % path
+
+        self.append(['header', header])
+        self.flush()
+
+    def append(self, record):
+        if self.closed:
+            return
+
+        s = msgpack.packb(record, use_bin_type=True)
+        self.buf.append(struct.pack('>I', len(s)))
+        self.buf.append(s)
+        self.buf_size += len(s) + 4
+
+        if self.buf_size >= self.FLUSH_SIZE or time.time() - self.last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def record_gamedata(self, idx, frame):
+        self.append(['gd', idx, frame])
+
+    def record_user_gamedata(self, idx, tag, data):
+        self.append(['ugd', idx, tag, data])
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.buf:
+            return
+
+        self.chunks.put(''.join(self.buf))
+        self.buf = []
+        self.buf_size = 0
+
+    def close(self, trailer):
+        if self.closed:
+            return
+
+        self.append(['end', trailer])
+        self.closed = True
+        self.flush()
+        self.chunks.put(None)
+
+    def join(self, timeout=None):
+        self.writer.join(timeout)
+
+    def _drain(self):
+        pool = get_hub().threadpool
+        while True:
+            try:
+                chunk = self.chunks.get(timeout=self.FLUSH_INTERVAL)
+            except Empty:
+                # nothing recorded lately, write out what's buffered
+                self.flush()
+                continue
+
+            if chunk is None:
+                break
+
+            try:
+                # compression and disk io off the event loop
+                pool.apply(self._write_chunk, (chunk,))
+            except Exception:
+                log.exception('Error writing archive %s', self.path)
+
+    def _write_chunk(self, chunk):
+        with open(self.path, 'ab') as f:
+            gz = gzip.GzipFile(fileobj=f, mode='wb')
+            gz.write(chunk)
+            gz.close()
+
+
+def _inflate(raw):
+    # concatenated gzip members, tolerating a truncated tail
+    out = []
+    while raw:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            out.append(d.decompress(raw))
+        except zlib.error:
+            break
+
+        raw = d.unused_data
+
+    return ''.join(out)
+
+
+def iter_records(stream):
+    stream = stream[len(ARCHIVE_MAGIC):]
+    pos, n = 0, len(stream)
+    while pos + 4 <= n:
+        l, = struct.unpack_from('>I', stream, pos)
+        pos += 4
+        if pos + l > n:
+            break  # truncated
+
+        yield msgpack.unpackb(stream[pos:pos + l], encoding='utf-8')
+        pos += l
+
+
+def load_archive(path):
+    '''
+    Load a server side game archive, either written by ArchiveWriter
+    or the old plain text format.
+    '''
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    stream = _inflate(raw) if raw.startswith('\x1f\x8b') else raw
+
+    if stream.startswith(ARCHIVE_MAGIC):
+        return _load_records(stream)
+    else:
+        return _load_legacy(stream)
+
+
+def _load_records(stream):
+    arc = None
+
+    for rec in iter_records(stream):
+        t = rec[0]
+        if t == 'header':
+            arc = ObjectDict(rec[1])
+            arc.setdefault('uids', None)
+            arc.end = None
+            arc.usergdhistory = []
+            arc.gdhistory = [[] for _ in arc.names]
+        elif t == 'gd':
+            _, idx, frame = rec
+            arc.gdhistory[idx].append(Endpoint.decode(frame)[1])
+        elif t == 'ugd':
+            _, idx, tag, data = rec
+            arc.usergdhistory.append([idx, tag, Endpoint.decode(data)])
+        elif t == 'end':
+            arc.end = rec[1]['end']
+        else:
+            log.warning('Unknown archive record %r', t)
+
+    if arc is None:
+        raise ValueError('Archive header missing')
+
+    return arc
+
+
+def _load_legacy(stream):
+    data = stream.decode('utf-8').split('\n')
+    arc = ObjectDict()
+    arc.names = data.pop(0)[2:].split(', ')
+    arc.uids = None
+    arc.version = data.pop(0).split(': ', 1)[-1]
+    arc.gameid = int(data.pop(0).split()[-1])
+    times = dict(i.split(' = ') for i in data.pop(0).split(': ', 1)[-1].split(', '))
+    arc.start, arc.end = int(times['start']), int(times['end'])
+
+    mode, params, items, seed, usergdhist, gdhist = data
+    arc.mode = mode
+    arc.params = json.loads(params)
+    arc['items'] = json.loads(items)
+    arc.seed = long(seed)
+    arc.usergdhistory = json.loads(usergdhist)
+    arc.gdhistory = json.loads(gdhist)
+
+    return arc
+
@@ -6,6 +6,7 @@ from collections import defaultdict, deque
 from contextlib import contextmanager
 import logging
 import random
+import time
 
 # -- third party --
 from gevent import Timeout, getcurrent
@@ -13,8 +14,10 @@ from gevent.event import Event
 import gevent
 
 # -- own --
-from endpoint import EndpointDied
+from endpoint import CompactTable, Endpoint, EndpointDied
 from utils import Packet, exceptions, instantiate
+from utils.metrics import metrics
+from utils.trace import TraceBuffer
 
 
 # -- code --
@@ -24,6 +27,15 @@ intern('action_shootdown')
 intern('action_before')
 intern('action_apply')
 intern('action_after')
+intern('action_done')
+
+ACTION_EVENTS = frozenset([
+    'action_shootdown',
+    'action_before',
+    'action_apply',
+    'action_after',
+    'action_done',
+])
 
 all_gameobjects = set()
 game_objects_hierarchy = set()
@@ -113,6 +125,7 @@ class EventHandler(GameObject):
     execute_after = ()
     group = None
     interested = None
+    interested_actions = None
 
     def handle(self, evt_type, data):
         raise GameError('Override handle function to implement EventHandler logics!')
@@ -122,6 +135,19 @@ class EventHandler(GameObject):
         assert isinstance(interested, (list, tuple)), "Should specify interested events! %r" % self.__class__
         return list(interested)
 
+    def get_interested_actions(self):
+        '''
+        Action classes this handler reacts to in action events
+        (see ACTION_EVENTS), None means all of them.
+        Other events are not affected.
+        '''
+        interested = self.interested_actions
+        if interested is None:
+            return None
+
+        assert isinstance(interested, (list, tuple)), "interested_actions should be a tuple! %r" % self.__class__
+        return tuple(interested)
+
     @staticmethod
     def make_list(eh_classes, fold_group=True):
         table = {}
@@ -308,11 +334,14 @@ class Game(GameObject):
     IS_DEBUG = False
     params_def = {}
     npc_players = []
+    YIELD_EVERY = 0  # events between cooperative yields, 0 for never, see _emit_event
 
     def __init__(self):
         self.event_handlers = []
         self.adhoc_ehs      = []
         self.ehs_cache      = {}
+        self.action_ehs     = {}
+        self.dispatch_table = {}
         self.action_stack   = []
         self.hybrid_stack   = []
         self.action_types   = {}
@@ -321,12 +350,25 @@ class Game(GameObject):
         self.winners        = []
         self.turn_count     = 0
         self.event_observer = None
+        self.event_count    = 0
+        self.trace          = TraceBuffer(log)  # recent engine events, for post-mortem
 
     def set_event_handlers(self, ehs):
         self.event_handlers = ehs[:]
         self.ehs_cache = {}
         self.adhoc_ehs = []
 
+        # (seq, eh, interested_actions) for every action event,
+        # narrowed down per action class lazily in _get_dispatch_table
+        self.action_ehs = {
+            tag: [
+                (i, eh, eh.get_interested_actions())
+                for i, eh in enumerate(self.event_handlers)
+                if tag in eh.get_interested()
+            ] for tag in ACTION_EVENTS
+        }
+        self.dispatch_table = {}
+
     def add_adhoc_event_handler(self, eh):
         self.adhoc_ehs.insert(0, eh)
 
@@ -357,7 +399,7 @@ class Game(GameObject):
             winner = None
 
         log.info(u'>> Winner: %s', winner)
-        gevent.sleep(2)
+        self.pause(2)
 
         raise GameEnded
 
@@ -374,17 +416,47 @@ class Game(GameObject):
 
         return ehs
 
+    def _get_dispatch_table(self, tag, cls):
+        key = (tag, cls)
+        table = self.dispatch_table.get(key)
+        if table is not None:
+            return table
+
+        table = [
+            (i, eh) for i, eh, actions in self.action_ehs.get(tag, ())
+            if actions is None or issubclass(cls, actions)
+        ]
+        self.dispatch_table[key] = table
+
+        return table
+
     def emit_event(self, evt_type, data):
         '''
         Fire an event, all relevant event handlers will see this,
         data can be modified.
         '''
-        random.random() < 0.01 and gevent.sleep(0.00001)  # prevent buggy logic code blocking scheduling
+        if metrics.enabled and metrics.sample():
+            begin = time.time()
+            try:
+                return self._emit_event(evt_type, data)
+            finally:
+                metrics.observe('event', evt_type, (time.time() - begin) * 1000)
+
+        return self._emit_event(evt_type, data)
+
+    def _emit_event(self, evt_type, data):
+        # cooperative yield point, so a long chain of events
+        # can't starve other games sharing the hub. Off unless
+        # the server asks for it, yielding changes scheduling
+        self.event_count += 1
+        if self.YIELD_EVERY and not self.event_count % self.YIELD_EVERY:
+            gevent.sleep(0)
+
         if isinstance(data, (list, tuple, str, unicode)):
             s = data
         else:
             s = data.__class__.__name__
-        log.debug('emit_event: %s %s' % (evt_type, s))
+        self.trace('emit_event: %s %s', evt_type, s)
 
         if evt_type in ('action_before', 'action_apply', 'action_after'):
             action_event = True
@@ -396,14 +468,38 @@ class Game(GameObject):
         if ob:
             data = ob.handle(evt_type, data)
 
-        adhoc = self.adhoc_ehs
-        ehs = self._get_relevant_eh(evt_type)
+        if evt_type not in ACTION_EVENTS:
+            for eh in self.adhoc_ehs:
+                data = self.handle_single_event(eh, evt_type, data)
 
-        for l in adhoc, ehs:
-            for eh in l:
+            for eh in self._get_relevant_eh(evt_type):
                 data = self.handle_single_event(eh, evt_type, data)
-                if action_event and data.cancelled:
-                    break
+
+            return data
+
+        for eh in self.adhoc_ehs:
+            data = self.handle_single_event(eh, evt_type, data)
+            if action_event and data.cancelled:
+                break
+
+        cls = data.__class__
+        table = self._get_dispatch_table(evt_type, cls)
+        i, n = 0, len(table)
+        while i < n:
+            seq, eh = table[i]
+            i += 1
+            data = self.handle_single_event(eh, evt_type, data)
+            if action_event and data.cancelled:
+                break
+
+            if data.__class__ is not cls:
+                # handler replaced or transformed the action,
+                # continue with handlers interested in the new one
+                cls = data.__class__
+                table = self._get_dispatch_table(evt_type, cls)
+                i, n = 0, len(table)
+                while i < n and table[i][0] <= seq:
+                    i += 1
 
         return data
 
@@ -415,7 +511,7 @@ class Game(GameObject):
             assert eh is self.hybrid_stack.pop()
 
         if data is None:
-            log.debug('EventHandler %s returned None' % eh.__class__.__name__)
+            log.debug('EventHandler %s returned None', eh.__class__.__name__)
 
         return data
 
@@ -428,18 +524,32 @@ class Game(GameObject):
         '''
         Process an action
         '''
+        if not metrics.enabled:
+            return self._process_action(action)
+
+        begin = time.time()
+        depth = len(self.action_stack)
+        try:
+            return self._process_action(action)
+        finally:
+            key = action.__class__.__name__
+            metrics.observe('action', key, (time.time() - begin) * 1000)
+            metrics.observe('action_depth', key, depth)
+
+    def _process_action(self, action):
         if self.ended:
             return False
 
+        trace = self.trace
         if action.done:
-            log.debug('action already done %s' % action.__class__.__name__)
+            trace('action already done %s', action.__class__.__name__)
             return action.succeeded
         elif action.cancelled or action.invalid:
-            log.debug('action cancelled/invalid %s' % action.__class__.__name__)
+            trace('action cancelled/invalid %s', action.__class__.__name__)
             return False
 
         if not action.can_fire():
-            log.debug('action invalid %s' % action.__class__.__name__)
+            trace('action invalid %s', action.__class__.__name__)
             return False
 
         try:
@@ -449,17 +559,17 @@ class Game(GameObject):
 
         action = self.emit_event('action_before', action)
         if action.done:
-            log.debug('action already done %s' % action.__class__.__name__)
+            trace('action already done %s', action.__class__.__name__)
             rst = action.succeeded
         elif action.cancelled:
-            log.debug('action cancelled, not firing: %s' % action.__class__.__name__)
+            trace('action cancelled, not firing: %s', action.__class__.__name__)
             rst = False
         elif not action.can_fire():
-            log.debug('action invalid, not firing: %s' % action.__class__.__name__)
+            trace('action invalid, not firing: %s', action.__class__.__name__)
             action.invalid = True
             rst = False
         else:
-            log.debug('applying action %s, current hybrid_stack: %r' % (action.__class__.__name__, self.hybrid_stack))
+            trace('applying action %s, depth %d', action.__class__.__name__, len(self.hybrid_stack))
             action = self.emit_event('action_apply', action)
             assert not action.cancelled
             try:
@@ -513,6 +623,21 @@ class Game(GameObject):
     def get_synctag(self):
         raise GameError('Abstract')
 
+    def get_synctags(self, n):
+        '''
+        Allocate n consecutive sync tags in one go,
+        same numbers as n get_synctag() calls. Returns the first one.
+        '''
+        if n <= 0:
+            return None
+
+        base = self.get_synctag()
+        if base is None:  # server game being killed, see its get_synctag
+            raise GameError('No sync tags for a game being killed')
+
+        self.synctag += n - 1
+        return base
+
     @contextmanager
     def action_hook(self, hook):
         ''' Dark art, do not use '''
@@ -667,6 +792,177 @@ class InputTransaction(object):
         return '<T:{}>'.format(self.name)
 
 
+class GamedataInbox(object):
+    '''
+    Pending game data packets, indexed by exact tag and by tag stem
+    (tag up to the last ':', e.g. 'RI&:ChooseOption:'), so lookups
+    don't depend on how many packets are piled up.
+    Packets are handed out oldest first, as a plain queue would do.
+    '''
+    def __init__(self, maxlen=100000):
+        self.maxlen  = maxlen
+        self.pending = {}  # seq -> packet
+        self.by_tag  = {}  # tag -> deque([seq, ...])
+        self.by_stem = {}  # stem -> deque([seq, ...])
+        self.seq     = 0
+        self.oldest  = 0
+        self.died    = None  # (seq, EndpointDied)
+
+    def __len__(self):
+        return len(self.pending)
+
+    @staticmethod
+    def stem(tag):
+        return tag[:tag.rfind(':') + 1]
+
+    def put(self, packet):
+        if isinstance(packet, EndpointDied):
+            if not self.died:
+                self.died = (self.seq, packet)
+
+            self.seq += 1
+            return
+
+        tag = packet[0]
+        if not isinstance(tag, basestring):
+            log.debug('Malformed game data: %r', packet)
+            return
+
+        seq = self.seq
+        self.seq += 1
+        self.pending[seq] = packet
+        self.by_tag.setdefault(tag, deque()).append(seq)
+        self.by_stem.setdefault(self.stem(tag), deque()).append(seq)
+
+        if len(self.pending) > self.maxlen:
+            self._evict()
+
+    def take(self, tag, glob=False):
+        '''
+        Remove and return the oldest packet with tag `tag`
+        (or starting with `tag` if glob), None if not present.
+        Raises EndpointDied if the endpoint died before such packet arrived.
+        '''
+        if glob:
+            seq = self._first_glob(tag)
+        else:
+            seq = self._first(self.by_tag, tag)
+
+        died = self.died
+        if died and (seq is None or died[0] < seq):
+            raise died[1]
+
+        if seq is None:
+            return None
+
+        packet = self.pending.pop(seq)
+        tag = packet[0]
+        self._first(self.by_tag, tag)
+        self._first(self.by_stem, self.stem(tag))
+        return packet
+
+    def _first(self, index, key):
+        # drop entries already taken through the other index
+        q = index.get(key)
+        if q is None:
+            return None
+
+        pending = self.pending
+        while q and q[0] not in pending:
+            q.popleft()
+
+        if not q:
+            del index[key]
+            return None
+
+        return q[0]
+
+    def _first_glob(self, prefix):
+        # tags starting with `prefix` all have stems starting with stem(prefix)
+        base = self.stem(prefix)
+        candidates = []
+        for s in [s for s in self.by_stem if s.startswith(base)]:
+            if s.startswith(prefix):
+                seq = self._first(self.by_stem, s)
+            else:
+                # prefix stops in the middle of a segment, e.g. 'RI:Choose' vs 'RI:ChooseOption:'
+                seq = self._first_prefixed(self.by_stem[s], prefix)
+
+            seq is not None and candidates.append(seq)
+
+        return min(candidates) if candidates else None
+
+    def _first_prefixed(self, q, prefix):
+        pending = self.pending
+        for seq in q:
+            if seq in pending and pending[seq][0].startswith(prefix):
+                return seq
+
+        return None
+
+    def _evict(self):
+        pending = self.pending
+        while self.oldest not in pending:
+            self.oldest += 1
+
+        packet = pending.pop(self.oldest)
+        log.debug('GAME_DATA_EVICTED: %r', packet)
+
+
+def _all_inputlet_tags():
+    tags, l = set(), [Inputlet]
+    while l:
+        cls = l.pop()
+        l.extend(cls.__subclasses__())
+        cls is not Inputlet and tags.add(cls.tag())
+
+    return sorted(tags)
+
+
+class GamedataTag(object):
+    '''
+    Gamedata tags like 'RI&:ChooseOption:2345' or 'Sync:12',
+    sent inline as [mark, kind, inputlet, synctag] in FMT_COMPACT.
+    '''
+    KINDS = ['Sync', 'I', 'I&', 'I|', 'RI', 'RI&', 'RI|']
+    TABLE = CompactTable(_all_inputlet_tags)
+    MARK  = None  # see register_compact below
+
+    @classmethod
+    def wrap(cls, tag):
+        '''
+        Compact form of tag, or tag as is if it can't be.
+        '''
+        l = tag.split(':')
+        if len(l) == 2:
+            l.insert(1, None)
+
+        if len(l) != 3:
+            return tag
+
+        kind, name, synctag = l
+        if kind not in cls.KINDS or not synctag.isdigit() or (name is None) != (kind == 'Sync'):
+            return tag
+
+        try:
+            name = name and cls.TABLE.id_of(name)
+        except KeyError:
+            return tag
+
+        return [cls.MARK, cls.KINDS.index(kind), name, int(synctag)]
+
+    @classmethod
+    def decode(cls, v):
+        kind, name, synctag = v
+        if name is None:
+            return '%s:%d' % (cls.KINDS[kind], synctag)
+
+        return '%s:%s:%d' % (cls.KINDS[kind], cls.TABLE.name_of(name), synctag)
+
+
+GamedataTag.MARK = Endpoint.register_compact(3, GamedataTag.decode, GamedataTag.TABLE)
+
+
 class Gamedata(object):
     @instantiate
     class NODATA(object):
@@ -674,7 +970,7 @@ class Gamedata(object):
             return 'NODATA'
 
     def __init__(self, recording=False):
-        self.gdqueue = deque(maxlen=100000)
+        self.inbox = GamedataInbox(maxlen=100000)
         self.gdevent = Event()
         self.gdempty = Event()
         self.recording = recording
@@ -682,9 +978,42 @@ class Gamedata(object):
         self._in_gexpect = False
         self.gdempty.set()
 
+    @staticmethod
+    def encode(tag, data, format=Endpoint.FMT_PACKED):
+        '''
+        Encode a ['gamedata', [tag, data]] frame.
+        '''
+        if format == Endpoint.FMT_COMPACT:
+            tag = GamedataTag.wrap(tag)
+
+        return Endpoint.encode(['gamedata', [tag, data]], format)
+
+    # encode(tag, ...) is [fmt, ['gamedata', [tag, ...]]], tag at offset 14
+    _FRAME_HEAD = '\x92\xc4\x08gamedata\x92'
+
+    @staticmethod
+    def is_sync_batch(frame):
+        '''
+        Tells if an encoded frame is batched reveals, 'Sync:<first>:<last>',
+        without decoding it.
+        '''
+        if frame[2:14] != Gamedata._FRAME_HEAD:
+            return False
+
+        h = ord(frame[14])
+        if h == 0xc4:  # bin 8
+            n, i = ord(frame[15]), 16
+        elif 0xa0 <= h <= 0xbf:  # fixstr
+            n, i = h & 0x1f, 15
+        else:
+            return False
+
+        tag = frame[i:i + n]
+        return tag.startswith('Sync:') and tag.count(':') == 2
+
     def feed(self, data):
         p = Packet(data)
-        self.gdqueue.append(p)
+        self.inbox.put(p)
         self.gdevent.set()
         self.gdempty.clear()
 
@@ -692,8 +1021,8 @@ class Gamedata(object):
         try:
             assert not self._in_gexpect, 'NOT REENTRANT'
             self._in_gexpect = True
-            blocking and log.debug('GAME_EXPECT: %s', repr(tag))
-            l = self.gdqueue
+            blocking and log.debug('GAME_EXPECT: %r', tag)
+            inbox = self.inbox
             e = self.gdevent
             ee = self.gdempty
             e.clear()
@@ -704,19 +1033,15 @@ class Gamedata(object):
                 glob = True
 
             while True:
-                for i, packet in enumerate(l):
-                    if isinstance(packet, EndpointDied):
-                        raise packet
-
-                    if packet[0] == tag or (glob and packet[0].startswith(tag)):
-                        log.debug('GAME_READ: %s', repr(packet))
-                        del l[i]
-                        self.recording and self.history.append(packet)
-                        return packet
+                packet = inbox.take(tag, glob)
+                if packet is not None:
+                    log.debug('GAME_READ: %r', packet)
+                    self.recording and self.history.append(packet)
+                    return packet
 
-                    else:
-                        log.debug('GAME_DATA_MISS: %s', repr(packet))
-                        log.debug('EXPECTS: %s, GAME: %s', tag, getcurrent())
+                if inbox:
+                    log.debug('GAME_DATA_MISS: %d packets pending', len(inbox))
+                    log.debug('EXPECTS: %s, GAME: %s', tag, getcurrent())
 
                 ee.set()
                 if blocking:
@@ -738,7 +1063,7 @@ class Gamedata(object):
         # Well, when sb. exit game in input state,
         # the others must wait until his timeout exceeded.
         # called by lobby.exit_game to break such condition.
-        self.gdqueue.append(EndpointDied())
+        self.inbox.put(EndpointDied())
         self.gdevent.set()
 
 
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from weakref import WeakSet
+import time
+
+# -- third party --
+# -- own --
+from utils.metrics import Histogram, metrics
+
+
+# -- code --
+class Command(object):
+    '''
+    A registered command handler, with its contract and call statistics.
+    '''
+    __slots__ = (
+        'name', 'handler', 'states', 'argstypes', 'nargs',
+        'calls', 'rejected', 'failed', 'latency',
+    )
+
+    def __init__(self, name, handler, states=None, argstypes=None, nargs=None):
+        self.name      = name
+        self.handler   = handler
+        self.states    = frozenset(states) if states else None
+        self.argstypes = tuple(argstypes) if argstypes is not None else None
+        self.nargs     = len(self.argstypes) if argstypes is not None else nargs
+        self.calls     = 0
+        self.rejected  = 0
+        self.failed    = 0
+        self.latency   = Histogram()
+
+    def check(self, state, args):
+        '''
+        None if the command may be called in state with args,
+        otherwise 'state' or 'args' telling what's wrong.
+        '''
+        if self.states is not None and state not in self.states:
+            self.rejected += 1
+            return 'state'
+
+        if self.nargs is not None:
+            if not isinstance(args, (list, tuple)) or len(args) != self.nargs:
+                self.rejected += 1
+                return 'args'
+
+        types = self.argstypes
+        if types:
+            for t, v in zip(types, args):
+                if not isinstance(v, t):
+                    self.rejected += 1
+                    return 'args'
+
+        return None
+
+    def __call__(self, *args):
+        begin = time.time()
+        try:
+            return self.handler(*args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.calls += 1
+            self.latency.add((time.time() - begin) * 1000)
+
+    def stats(self):
+        return {
+            'name':     self.name,
+            'calls':    self.calls,
+            'rejected': self.rejected,
+            'failed':   self.failed,
+            'latency':  self.latency.dump(),
+        }
+
+
+class CommandTable(object):
+    '''
+    Command name -> Command, built once when the owner is set up,
+    so dispatching a message is a dict lookup plus the contract check.
+    '''
+
+    def __init__(self, name):
+        self.name     = name
+        self.commands = {}
+
+    def __contains__(self, cmd):
+        return cmd in self.commands
+
+    def add(self, name, handler, states=None, argstypes=None, nargs=None):
+        assert name not in self.commands, 'Command %s already registered' % name
+        self.commands[name] = cmd = Command(name, handler, states, argstypes, nargs)
+        return cmd
+
+    def get(self, name):
+        try:
+            return self.commands.get(name)
+        except TypeError:  # unhashable name from the wire
+            return None
+
+    def stats(self):
+        '''
+        Per command statistics, busiest first.
+        '''
+        l = [c.stats() for c in self.commands.values()]
+        l.sort(key=lambda s: -s['latency']['count'] * s['latency']['avg'])
+        return l
+
+
+all_tables = WeakSet()
+metrics.add_source('commands', lambda: {t.name: t.stats() for t in all_tables})
+
+
+def command_table(name):
+    '''
+    Make a CommandTable, listed in all_tables for inspection.
+    '''
+    t = CommandTable(name)
+    all_tables.add(t)
+    return t
+
+
+def method_table(name, cls, prefix='command_'):
+    '''
+    CommandTable of cls's `prefix`-named methods, arity taken from their
+    signatures. Handlers are plain functions, call them with the instance.
+    '''
+    t = command_table(name)
+    for attr in sorted(dir(cls)):
+        if not attr.startswith(prefix):
+            continue
+
+        f = getattr(cls, attr).__func__
+        t.add(attr[len(prefix):], f, nargs=f.__code__.co_argcount - 1)
+
+    return t
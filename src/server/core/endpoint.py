@@ -5,28 +5,32 @@ from __future__ import absolute_import
 from collections import defaultdict
 from weakref import WeakSet
 import logging
+import time
 
 # -- third party --
-from gevent import Timeout, getcurrent
+from gevent import getcurrent
 from gevent.queue import Queue
+import gevent
 
 # -- own --
 from account import Account
 from endpoint import Endpoint, EndpointDied
 from game.base import Gamedata
 from options import options
+from server.command import method_table
 from server.subsystem import Subsystem
 from utils import BatchList, log_failure
+from utils.metrics import metrics
 
 
 # -- code --
 log = logging.getLogger('server.core.endpoint')
 
 
-def _record_gamedata(client, tag, data):
+def _record_gamedata(client, frame):
     from server.core.game_manager import GameManager
     manager = GameManager.get_by_user(client)
-    manager.record_gamedata(client, tag, data)
+    manager.record_gamedata(client, frame)
 
 
 def _record_user_gamedata(client, tag, data):
@@ -35,7 +39,85 @@ def _record_user_gamedata(client, tag, data):
     manager.record_user_gamedata(client, tag, data)
 
 
+class IdleSweeper(object):
+    '''
+    Closes clients not heard from for `timeout` seconds.
+
+    Clients sit in per `granularity` seconds buckets of last activity,
+    touching a client only moves it when it enters a new bucket, and
+    a single greenlet closes whole expired buckets, so idle clients
+    go between timeout and timeout + granularity seconds.
+    '''
+
+    def __init__(self, timeout=90, granularity=5):
+        self.timeout     = timeout
+        self.granularity = granularity
+        self.buckets     = defaultdict(set)  # bucket -> {client, ...}
+        self.slots       = {}                # client -> bucket
+        self.sweeper     = None
+
+    def bucket(self):
+        return int(time.time() // self.granularity)
+
+    def add(self, client):
+        if not self.sweeper:
+            self.sweeper = gevent.spawn(self.sweep)
+            self.sweeper.gr_name = 'IdleSweeper'
+
+        self.touch(client)
+
+    def touch(self, client):
+        b = self.bucket()
+        old = self.slots.get(client)
+        if old == b:
+            return
+
+        if old is not None:
+            self.buckets[old].discard(client)
+
+        self.slots[client] = b
+        self.buckets[b].add(client)
+
+    def discard(self, client):
+        b = self.slots.pop(client, None)
+        if b is not None:
+            self.buckets[b].discard(client)
+
+    def expired(self):
+        cutoff = self.bucket() - self.timeout // self.granularity
+        rst = []
+        for b in [b for b in self.buckets if b < cutoff]:
+            for c in self.buckets.pop(b):
+                self.slots.pop(c, None)
+                rst.append(c)
+
+        return rst
+
+    def near_timeout(self, within=30):
+        '''
+        Number of clients to be closed within `within` seconds if they stay silent.
+        '''
+        cutoff = self.bucket() - (self.timeout - within) // self.granularity
+        return sum(len(l) for b, l in self.buckets.iteritems() if b < cutoff)
+
+    def sweep(self):
+        while True:
+            gevent.sleep(self.granularity)
+            expired = self.expired()
+            expired and log.info('Closing %d idle clients', len(expired))
+            for c in expired:
+                gevent.spawn(c.close)
+
+
+idle_sweeper = IdleSweeper()
+metrics.add_source('near_idle_timeout', lambda: idle_sweeper.near_timeout(30))
+
+
 class Client(Endpoint):
+    BULK_COMPRESS_BYTES = 16 * 1024
+    wire_format         = Endpoint.FMT_PACKED  # FMT_COMPACT if the client opted in
+    sync_batch          = False                # takes 'Sync:<first>:<last>' batched reveals
+
     def __init__(self, sock, addr, greenlet):
         Endpoint.__init__(self, sock, addr)
         self.observers = BatchList()
@@ -43,6 +125,7 @@ class Client(Endpoint):
         self.cmd_listeners = defaultdict(WeakSet)
         self.current_game = None
         self.greenlet = greenlet
+        self.lobby_version = None  # last lobby state version sent
 
         self.account = None
 
@@ -51,6 +134,7 @@ class Client(Endpoint):
         c = getcurrent()
         cli = cls(sock, addr, c)
         c.gr_name = repr(cli)
+        c.profile_label = cli.profile_label
         cli._serve()
 
     @log_failure(log)
@@ -61,18 +145,12 @@ class Client(Endpoint):
         # ------------------
 
         self.state = 'connected'
+        # client should send heartbeat periodically
+        idle_sweeper.add(self)
         while True:
             try:
-                hasdata = False
-                with Timeout(90, False):
-                    cmd, data = self.read()
-                    hasdata = True
-
-                if not hasdata:
-                    self.close()
-                    # client should send heartbeat periodically
-                    raise EndpointDied
-
+                cmd, data = self.read()
+                idle_sweeper.touch(self)
                 self.handle_command(cmd, data)
 
             except EndpointDied:
@@ -83,6 +161,7 @@ class Client(Endpoint):
                 log.exception("Error occurred when handling client command")
 
         # client died, do clean ups
+        idle_sweeper.discard(self)
         self.handle_drop()
 
     def close(self):
@@ -91,6 +170,9 @@ class Client(Endpoint):
         self.greenlet = None
         gr and gr.kill(EndpointDied)
 
+    def profile_label(self):
+        return ['lobby' if getattr(self, 'state', None) in ('hang', 'inroomwait', 'ready') else 'endpoint']
+
     def __repr__(self):
         acc = self.account
         if not acc:
@@ -124,8 +206,8 @@ class Client(Endpoint):
             self.gamedata.feed(data)
             return
 
-        f = getattr(self, 'command_' + str(cmd), None)
-        if not f:
+        command = self.commands.get(cmd)
+        if not command:
             listeners = self.cmd_listeners[cmd]
             if listeners:
                 [l.put(data) for l in listeners]
@@ -135,18 +217,11 @@ class Client(Endpoint):
             self.write(['invalid_command', [cmd, data]])
             return
 
-        if not isinstance(data, (list, tuple)):
-            log.error('Malformed command: %s %s', cmd, data)
+        if command.check(None, data):
+            log.error('Malformed command: %s %s, expecting %s args', cmd, data, command.nargs)
             return
 
-        n = f.__code__.co_argcount - 1
-        if n != len(data):
-            log.error(
-                'Command "%s" argcount mismatch, expect %s, got %s',
-                cmd, n, len(data)
-            )
-        else:
-            f(*data)
+        command(self, *data)
 
     def handle_drop(self):
         if self.state not in ('connected', 'hang'):
@@ -161,13 +236,14 @@ class Client(Endpoint):
         return tag, data
 
     def gwrite(self, tag, data):
-        log.debug('GAME_WRITE: %s -> %s', self.account.username, repr([tag, data]))
+        log.debug('GAME_WRITE: %s -> %r %r', self.account.username, tag, data)
 
-        _record_gamedata(self, tag, data)
+        # encoded once, shared by the wire, observers and game history
+        encoded = Gamedata.encode(tag, data, self.wire_format)
+        _record_gamedata(self, encoded)
 
-        encoded = self.encode(['gamedata', [tag, data]])
         self.raw_write(encoded)
-        self.observers and self.observers.raw_write(encoded)
+        self.observers and self.broadcast(self.observers, encoded)
 
     def gbreak(self):
         return self.gamedata.gbreak()
@@ -175,6 +251,34 @@ class Client(Endpoint):
     def gclear(self):
         self.gamedata = Gamedata()
 
+    _transcoded = (None, None, None)  # frame, (wire format, sync batch), frames to send
+
+    def queue_write(self, s):
+        # observers, game history and worker frames may be compact,
+        # and batched reveals go one by one to clients not taking them
+        compact = s.startswith(self._COMPACT_PREFIX) and self.wire_format != self.FMT_COMPACT
+        split = not self.sync_batch and Gamedata.is_sync_batch(s)
+        if not (compact or split):
+            return Endpoint.queue_write(self, s)
+
+        key = self.wire_format, self.sync_batch
+        src, k, frames = Client._transcoded
+        if src is not s or k != key:
+            p = self.decode(s)
+            if split:
+                fmt = self.wire_format
+                frames = [Gamedata.encode('Sync:%d' % st, data, fmt) for st, data in p[1][1]]
+            else:
+                frames = [self.encode(p)]
+
+            Client._transcoded = s, key, frames
+
+        for f in frames:
+            if not Endpoint.queue_write(self, f):
+                return False
+
+        return True
+
     # --------- Handlers ---------
     def command_auth(self, login, password):
         if self.state != 'connected' or self.account:
@@ -204,11 +308,28 @@ class Client(Endpoint):
     def command_heartbeat(self):
         pass
 
+    def command_wire_format(self, fmt, schema):
+        # clients knowing FMT_COMPACT ask for it after the greeting,
+        # older ones never do and keep getting FMT_PACKED
+        if fmt == Endpoint.FMT_COMPACT and schema == Endpoint.compact_schema():
+            self.wire_format = fmt
+        else:
+            self.wire_format = Endpoint.FMT_PACKED
+
+        self.write(['wire_format', [self.wire_format, Endpoint.compact_schema()]])
+
+    def command_sync_batch(self, enabled):
+        # clients knowing 'Sync:<first>:<last>' ask for it after the greeting
+        self.sync_batch = bool(enabled)
+
     # --------- End handlers ---------
 
 
+Client.commands = method_table('client', Client)
+
+
 class DroppedClient(Client):
-    read = write = raw_write = gclear = lambda *a, **k: None
+    read = write = raw_write = queue_write = gclear = lambda *a, **k: None
 
     def __init__(self, client=None):
         client and self.__dict__.update(client.__dict__)
@@ -220,7 +341,7 @@ class DroppedClient(Client):
         )
 
     def gwrite(self, tag, data):
-        _record_gamedata(self, tag, data)
+        _record_gamedata(self, Gamedata.encode(tag, data, self.wire_format))
 
     def gexpect(self, tag, blocking=True):
         raise EndpointDied
@@ -235,7 +356,7 @@ class DroppedClient(Client):
 
 
 class NPCClient(Client):
-    read = write = raw_write = gclear = lambda *a, **k: None
+    read = write = raw_write = queue_write = gclear = lambda *a, **k: None
     state = property(lambda: 'ingame')
 
     def __init__(self, name):
@@ -4,8 +4,6 @@ from __future__ import absolute_import
 # -- stdlib --
 from collections import defaultdict
 from weakref import WeakSet
-import gzip
-import json
 import logging
 import os
 import random
@@ -16,6 +14,7 @@ import sys
 import gevent
 
 # -- own --
+from game.archive import ArchiveWriter
 from game.base import GameItem
 from options import options
 from server import item
@@ -35,7 +34,7 @@ class ClientPlaceHolder(object):
     state     = 'left'
     account   = None
     observers = BatchList()
-    raw_write = write = lambda *a: False
+    raw_write = queue_write = write = lambda *a: False
 
     def __data__(self):
         return (None, None, 'left')
@@ -61,6 +60,8 @@ class GameManager(object):
         self.invite_only  = invite_only
         self.invite_list  = set()
         self.muted        = False
+        self.archiver     = None
+        self.worker       = None  # WorkerLink, when running in a game worker
 
         g.gameid    = gid
         g._manager  = self
@@ -79,6 +80,10 @@ class GameManager(object):
             'params':   self.game_params,
         }
 
+    @property
+    def lobby(self):
+        return Subsystem.lobby
+
     @classmethod
     def get_by_user(cls, user):
         '''
@@ -121,7 +126,7 @@ class GameManager(object):
             s = Client.encode(['player_change', pl])
             for cl in self.users:
                 cl.raw_write(s)
-                cl.observers and cl.observers.raw_write(s)
+                cl.observers and Client.broadcast(cl.observers, s)
 
     def next_free_slot(self):
         try:
@@ -129,34 +134,31 @@ class GameManager(object):
         except ValueError:
             return None
 
-    def archive(self):
+    def start_archive(self):
         g = self.game
         if not options.archive_path:
             return
 
-        data = []
-
-        data.append('# ' + ', '.join([
-            p.account.username.encode('utf-8')
-            for p in self.users
-        ]))
-
-        data.append('# Ver: ' + VERSION)
-        data.append('# GameId: ' + str(self.gameid))
-        s, e = int(self.start_time), int(time.time())
-        data.append('# Time: start = %d, end = %d, elapsed = %d' % (s, e, e - s))
+        path = os.path.join(options.archive_path, '%s-%s.gz' % (options.node, str(self.gameid)))
+        self.archiver = ArchiveWriter(path, {
+            'names':   [p.account.username for p in self.users],
+            'uids':    [p.account.userid for p in self.users],
+            'version': VERSION,
+            'gameid':  self.gameid,
+            'start':   int(self.start_time),
+            'mode':    self.gamecls.__name__,
+            'params':  self.game_params,
+            'items':   {k: list(v) for k, v in self.game_items.items()},
+            'seed':    g.rndseed,
+        })
+
+        # closed however the game greenlet ends, killed or crashed included,
+        # or the writer greenlet waits for records forever
+        g.link(lambda _: self.archive())
 
-        data.append(self.gamecls.__name__)
-        data.append(json.dumps(self.game_params))
-        game_items = {k: list(v) for k, v in self.game_items.items()}
-        data.append(json.dumps(game_items))
-        data.append(str(g.rndseed))
-        data.append(json.dumps(self.usergdhistory))
-        data.append(json.dumps(self.gdhistory))
-
-        f = gzip.open(os.path.join(options.archive_path, '%s-%s.gz' % (options.node, str(self.gameid))), 'wb')
-        f.write('\n'.join(data))
-        f.close()
+    def archive(self):
+        writer = self.archiver
+        writer and writer.close({'end': int(time.time())})
 
     def get_ready(self, user):
         if user.state not in ('inroomwait',):
@@ -175,7 +177,10 @@ class GameManager(object):
                 # race condition here.
                 # wrap in 'if g.started' to prevent double starting.
                 log.info("game starting")
-                g.start()
+                if options.workers:
+                    Subsystem.workers.start_game(self)
+                else:
+                    g.start()
 
     def cancel_ready(self, user):
         if user.state not in ('ready',):
@@ -251,7 +256,7 @@ class GameManager(object):
         s = Client.encode(['kick_request', [user, other, len(bl)]])
         for cl in self.users:
             cl.raw_write(s)
-            cl.observers and cl.observers.raw_write(s)
+            cl.observers and Client.broadcast(cl.observers, s)
 
         return len(bl) >= len(self.users) // 2
 
@@ -271,7 +276,7 @@ class GameManager(object):
         s = Client.encode(['ob_kick_request', [user, other, len(bl)]])
         for cl in self.users:
             cl.raw_write(s)
-            cl.observers and cl.observers.raw_write(s)
+            cl.observers and Client.broadcast(cl.observers, s)
 
         return len(bl) >= len(self.users) // 2
 
@@ -323,7 +328,7 @@ class GameManager(object):
             for obl in ul.observers:
                 obl and obl.write(['observer_enter', info])
 
-        if g.started:
+        if self.game_started:
             user.write(['observe_started', [
                 self.game_params,
                 self.consumed_game_items,
@@ -396,10 +401,10 @@ class GameManager(object):
 
         g.players = self.build_initial_players()
 
-        self.usergdhistory = []
-        self.gdhistory     = [list() for p in self.users]
-
+        self.gdhistory  = [list() for p in self.users]
         self.start_time = time.time()
+        self.start_archive()
+
         for u in self.users:
             u.write(["game_started", [self.game_params, self.consumed_game_items, g.players]])
             u.gclear()
@@ -447,18 +452,50 @@ class GameManager(object):
 
         return pl
 
-    def record_gamedata(self, user, tag, data):
+    def record_gamedata(self, user, frame):
+        '''
+        Record an encoded ['gamedata', [tag, data]] frame sent to user.
+        Frames are kept as is for replaying and archiving.
+        '''
         idx = self.users.index(user)
-        self.gdhistory[idx].append((tag, Client.decode(Client.encode(data))))
+        self.gdhistory[idx].append(frame)
+
+        writer = self.archiver
+        writer and writer.record_gamedata(idx, frame)
 
     def record_user_gamedata(self, user, tag, data):
+        writer = self.archiver
+        if not writer:
+            return
+
         idx = self.users.index(user)
-        self.usergdhistory.append((idx, tag, Client.decode(Client.encode(data))))
+        writer.record_user_gamedata(idx, tag, Client.encode(data))
+
+    def record_user_gamedata_raw(self, uid, tag, encoded):
+        writer = self.archiver
+        if not writer:
+            return
+
+        for idx, u in enumerate(self.users):
+            if u.account and u.account.userid == uid:
+                writer.record_user_gamedata(idx, tag, encoded)
+                break
+
+    def deliver_gamedata(self, uid, frame):
+        '''
+        Deliver a gamedata frame produced by the game worker.
+        '''
+        for u in self.users:
+            if u.account and u.account.userid == uid:
+                self.record_gamedata(u, frame)
+                u.raw_write(frame)
+                u.observers and Client.broadcast(u.observers, frame)
+                break
 
     def replay(self, observer, observee):
         idx = self.users.index(observee)
-        for data in self.gdhistory[idx]:
-            observer.write(['gamedata', data])
+        for frame in self.gdhistory[idx]:
+            observer.raw_write(frame)
 
     def squeeze_out(self, old, new):
         old.write(['others_logged_in', None])
@@ -484,6 +521,8 @@ class GameManager(object):
         else:
             assert False, 'Oops'
 
+        self.worker and self.worker.reconnect(self, new)
+
         new.write(['game_joined',  self])
         self.notify_playerchange()
 
@@ -501,7 +540,10 @@ class GameManager(object):
             i = g.players.client.index(user)
             p = g.players[i]
             log.info('player dropped')
-            can_leave = g.can_leave(p)
+            if self.worker:
+                can_leave = self.worker.exit_game(self, user, is_drop)
+            else:
+                can_leave = g.can_leave(p)
 
             if can_leave:
                 user.write(['game_left', None])
@@ -558,6 +600,8 @@ class GameManager(object):
             ))
 
         self.game.suicide = True  # game will kill itself in get_synctag()
+        self.archive()
+        self.worker and self.worker.kill_game(self)
 
     def get_bonus(self):
         assert self.get_online_users()
@@ -606,4 +650,6 @@ class GameManager(object):
             if isinstance(cl, Client):
                 logtraceback(cl)
 
+        g.trace.dump('Recent engine events')
+
         log.info('===========================')
@@ -5,6 +5,7 @@ from __future__ import absolute_import
 from collections import OrderedDict
 from copy import copy
 import logging
+import time
 
 # -- third party --
 from gevent import Greenlet, getcurrent
@@ -12,13 +13,14 @@ from gevent.pool import Group as GreenletGroup
 import gevent
 
 # -- own --
-from endpoint import EndpointDied
+from endpoint import Endpoint, EndpointDied
 from game.base import AbstractPlayer, GameEnded, InputTransaction, TimeLimitExceeded
+from options import options
 from server.core.event_hooks import ServerEventHooks
 from server.core.game_manager import GameManager
-from server.subsystem import Subsystem
 from utils import log_failure
 from utils.gevent_ext import iwait
+from utils.metrics import metrics
 from utils.stats import stats
 import game.base
 
@@ -37,6 +39,7 @@ def user_input(players, inputlet, timeout=25, type='single', trans=None):
     timeout = max(0, timeout)
 
     g = Game.getgame()
+    g.flush_reveals()  # clients may be waiting for them
     inputlet.timeout = timeout
     players = list(players)
 
@@ -53,6 +56,7 @@ def user_input(players, inputlet, timeout=25, type='single', trans=None):
 
     results = {p: None for p in players}
     synctags = {p: g.get_synctag() for p in players}
+    begin = time.time()
 
     orig_players = players[:]
     input_group = GreenletGroup()
@@ -116,6 +120,8 @@ def user_input(players, inputlet, timeout=25, type='single', trans=None):
                 rst = None
 
             rst = my.post_process(p, rst)
+            g.trace('user_input: %s%s by %r -> %r', tag, synctags[p], p, rst)
+            metrics.enabled and metrics.observe('user_input', inputlet.tag(), (time.time() - begin) * 1000)
 
             bottom_halves.append((
                 'R{}{}'.format(tag, synctags[p]), data, trans, my, rst
@@ -142,6 +148,7 @@ def user_input(players, inputlet, timeout=25, type='single', trans=None):
 
     # timed-out players
     for p in players:
+        metrics.enabled and metrics.observe('user_input', inputlet.tag(), (time.time() - begin) * 1000)
         my = ilets[p]
         rst = my.parse(None)
         rst = my.post_process(p, rst)
@@ -173,9 +180,11 @@ class Player(AbstractPlayer):
         self.client = client
 
     def reveal(self, obj_list):
+        # queued, see Game.flush_reveals. Snapshotted so later changes
+        # (a card reshuffled, say) don't leak into what's sent
         g = Game.getgame()
         st = g.get_synctag()
-        self.client.gwrite('Sync:%d' % st, obj_list)
+        g.pending_reveals.setdefault(self, []).append((st, Endpoint.snapshot(obj_list)))
 
     def set_dropped(self, v=True):
         self.dropped = v
@@ -251,6 +260,8 @@ class Game(Greenlet, game.base.Game):
     def __init__(self):
         Greenlet.__init__(self)
         game.base.Game.__init__(self)
+        self.pending_reveals = OrderedDict()  # Player -> [(synctag, data), ...]
+        self.YIELD_EVERY     = options.yield_every or 0
 
     @log_failure(log)
     def _run(g):
@@ -258,13 +269,18 @@ class Game(Greenlet, game.base.Game):
         g.event_observer = ServerEventHooks()
         g.game = getcurrent()
         mgr = GameManager.get_by_game(g)
-        Subsystem.lobby.start_game(mgr)
+        lobby = mgr.lobby
+        lobby.start_game(mgr)
         try:
             g.process_action(g.bootstrap(mgr.game_params, mgr.consumed_game_items))
         except GameEnded:
             pass
+        except Exception:
+            g.trace.dump('Game %r crashed' % g, logging.ERROR)
+            raise
         finally:
-            Subsystem.lobby.end_game(mgr)
+            g.flush_reveals()
+            lobby.end_game(mgr)
 
         assert g.ended
 
@@ -274,6 +290,9 @@ class Game(Greenlet, game.base.Game):
     def getgame():
         return getcurrent().game
 
+    def profile_label(self):
+        return [self.__class__.__name__, 'game %s' % getattr(self, 'gameid', 'X')]
+
     def __repr__(self):
         try:
             gid = str(self.gameid)
@@ -290,5 +309,26 @@ class Game(Greenlet, game.base.Game):
         self.synctag += 1
         return self.synctag
 
+    def flush_reveals(self):
+        '''
+        Send reveals queued since the last flush, one packet per player:
+        'Sync:<synctag>' for a single one as before, otherwise
+        'Sync:<first>:<last>' with [[synctag, data], ...], which
+        lobby endpoints split up again for clients not asking for it.
+        Must be called before waiting for anything from clients.
+        '''
+        pending = self.pending_reveals
+        if not pending:
+            return
+
+        self.pending_reveals = OrderedDict()
+        for p, l in pending.iteritems():
+            if len(l) == 1:
+                st, data = l[0]
+                p.client.gwrite('Sync:%d' % st, data)
+            else:
+                p.client.gwrite('Sync:%d:%d' % (l[0][0], l[-1][0]), l)
+
     def pause(self, time):
+        self.flush_reveals()
         gevent.sleep(time)
@@ -17,6 +17,7 @@ import gevent
 # -- own --
 from options import options
 from server.core.endpoint import Client, DroppedClient
+from server.command import command_table
 from server.core.game_manager import GameManager
 from server.subsystem import Subsystem
 from utils import BatchList, log_failure
@@ -47,7 +48,17 @@ class Lobby(object):
         self.admins = [2, 109, 351, 3044, 6573, 6584, 9783]
         self.bigbrothers = []
 
-        self.lobby_command_dispatch = {
+        # lobby state as last sent to clients, see update_lobby_state
+        self.lobby_version  = 0
+        self.lobby_games    = {}
+        self.lobby_users    = {}
+        self.lobby_delta    = None
+        self.lobby_snapshot = None
+
+        self.lobby_accounts_changed = set()  # userids with account data changed in the last delta
+
+        self.commands = command_table('lobby')
+        for cmd, f in {
             'create_game':      self.create_game_and_join,
             'quick_start_game': self.quick_start_game,
             'join_game':        self.join_game,
@@ -65,7 +76,9 @@ class Lobby(object):
             'cancel_ready':     self.cancel_ready,
             'chat':             self.chat,
             'speaker':          self.speaker,
-        }
+        }.items():
+            for_state, argstype = f._contract
+            self.commands.add(cmd, f, for_state, argstype)
 
     def _command(for_state, argstype):
         def decorate(f):
@@ -75,28 +88,26 @@ class Lobby(object):
         return decorate
 
     def process_command(self, user, cmd, args):
-        dispatch = self.lobby_command_dispatch
-
-        handler = dispatch.get(cmd)
+        command = self.commands.get(cmd)
 
-        if not handler:
+        if not command:
             log.info('Unknown command %s', cmd)
             user.write(['invalid_lobby_command', [cmd, args]])
             return
 
-        for_state, argstype = handler._contract
+        err = command.check(user.state, args)
 
-        if for_state and user.state not in for_state:
-            log.debug('Command %s is for state %s, called in %s', cmd, for_state, user.state)
+        if err == 'state':
+            log.debug('Command %s is for state %s, called in %s', cmd, command.states, user.state)
             user.write(['invalid_lobby_command', [cmd, args]])
             return
 
-        if not (len(argstype) == len(args) and all(isinstance(v, t) for t, v in zip(argstype, args))):
-            log.debug('Command %s with wrong args, expecting %r, actual %r', cmd, argstype, args)
+        if err == 'args':
+            log.debug('Command %s with wrong args, expecting %r, actual %r', cmd, command.argstypes, args)
             user.write(['invalid_lobby_command', [cmd, args]])
             return
 
-        handler(user, *args)
+        command(user, *args)
 
     def new_gid(self):
         self.current_gid += 1
@@ -104,21 +115,80 @@ class Lobby(object):
 
     @throttle(1.5)
     def refresh_status(self):
+        self.update_lobby_state()
         ul = [u for u in self.users.values() if u.state == 'hang']
         self.send_lobbyinfo(ul)
         Subsystem.interconnect.publish('current_users', self.users.values())
         Subsystem.interconnect.publish('current_games', self.games.values())
 
+    def update_lobby_state(self):
+        '''
+        Diff games and users against the state last sent to clients.
+        Bumps lobby_version and keeps the delta when anything changed.
+        '''
+        games = {}
+        for gid, manager in self.games.iteritems():
+            gi = manager.__data__()
+            gi['params'] = dict(gi['params'])  # mutated in place by the manager
+            games[gid] = gi
+
+        users = {uid: self.user_state(u) for uid, u in self.users.iteritems()}
+
+        old_games, old_users = self.lobby_games, self.lobby_users
+        delta = [
+            self.lobby_version,
+            self.lobby_version + 1,
+            [v for k, v in games.iteritems() if old_games.get(k) != v],
+            [k for k in old_games if k not in games],
+            [v for k, v in users.iteritems() if old_users.get(k) != v],
+            [k for k in old_users if k not in users],
+        ]
+
+        if not any(delta[2:]):
+            return
+
+        self.lobby_version += 1
+        self.lobby_games = games
+        self.lobby_users = users
+        self.lobby_delta = Client.encode(['lobby_delta', delta])
+        self.lobby_snapshot = None
+        self.lobby_accounts_changed = {
+            k for k, v in users.iteritems()
+            if k in old_users and old_users[k]['account'] != v['account']
+        }
+
+    @staticmethod
+    def user_state(u):
+        d = u.__data__()
+        acc = d['account']
+        if hasattr(acc, '__data__'):
+            # accounts compare by identity and change in place (credits, games ...),
+            # diff a copy of what goes on the wire instead
+            d['account'] = [dict(i) if isinstance(i, dict) else i for i in acc.__data__()]
+
+        return d
+
+    def get_lobby_snapshot(self):
+        if self.lobby_snapshot is None:
+            self.lobby_snapshot = self.lobby_version, Client.encode([
+                ['lobby_version', self.lobby_version],
+                ['current_games', self.lobby_games.values()],
+                ['current_users', self.lobby_users.values()],
+            ], Client.FMT_BULK_COMPRESSED)
+
+        return self.lobby_snapshot
+
     @_command(None, [])
     def get_lobbyinfo(self, user):
+        user.lobby_version = None
         self.send_lobbyinfo([user])
 
     def send_lobbyinfo(self, ul):
-        d = Client.encode([
-            ['current_games', self.games.values()],
-            ['current_users', self.users.values()],
-        ], Client.FMT_BULK_COMPRESSED)
-
+        '''
+        Users who saw the previous lobby version get the delta only,
+        others (just joined, back from a game, asked for it) a snapshot.
+        '''
+        version, delta = self.lobby_version, self.lobby_delta
         p = Pool(6)
 
         @p.spawn
@@ -126,8 +196,18 @@ class Lobby(object):
             for u in ul:
                 @p.spawn
                 def send_single(u=u):
-                    u.raw_write(d)
-                    self.send_account_info(u)
+                    if u.lobby_version == version:
+                        return
+
+                    if u.lobby_version == version - 1:
+                        u.raw_write(delta)
+                        u.lobby_version = version
+                        if u.account.userid in self.lobby_accounts_changed:
+                            self.send_account_info(u)
+                    else:
+                        u.lobby_version, snapshot = self.get_lobby_snapshot()
+                        u.raw_write(snapshot)
+                        self.send_account_info(u)
 
     def send_account_info(self, user):
         user.write(['your_account', user.account])
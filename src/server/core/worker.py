@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from weakref import WeakSet
+import itertools
+import logging
+import os
+import random
+
+# -- third party --
+from gevent import socket
+from gevent.event import AsyncResult
+import gevent
+
+# -- own --
+from account import Account
+from endpoint import Endpoint, EndpointDied
+from game.base import Gamedata
+from options import options
+from server.command import method_table
+from server.core.endpoint import NPCClient
+from server.core.game_server import NPCPlayer, Player
+from server.subsystem import Subsystem
+from utils import BatchList, log_failure
+from utils.metrics import metrics
+from utils.watchdog import watchdog
+
+
+# -- code --
+log = logging.getLogger('server.core.worker')
+'''
+Game worker processes.
+
+The lobby process owns every client connection and all the room
+bookkeeping. Started games are handed over to forked worker processes,
+each one running many game greenlets:
+
+    lobby -> worker
+        ['start_game', [gid, mode, params, items, seed, players]]
+        ['gamedata',   [gid, uid, packet]]     game data sent by user uid
+        ['exit_game',  [rid, gid, uid, is_drop]]
+        ['reconnect',  [gid, uid]]
+        ['kill_game',  [gid]]
+
+    worker -> lobby
+        ['gamedata',      [gid, uid, frame]]   encoded frame for user uid
+        ['user_gamedata', [gid, uid, tag, data]]
+        ['game_ended',    [gid, suicide, results]]
+        ['reply',         [rid, value]]
+        ['metrics',       [dump]]              metrics.dump() of the worker, periodically
+
+Players are identified by account userid on both sides, since the game
+reorders and wraps its player list as it runs.
+'''
+
+
+class WorkerLink(Endpoint):
+    '''
+    Lobby side end of a worker process.
+    '''
+    REPLY_TIMEOUT    = 10
+    SEND_QUEUE_LIMIT = None  # dropping the link would kill every game on the worker
+
+    def __init__(self, sock, pid):
+        Endpoint.__init__(self, sock, ('worker', pid))
+        self.pid     = pid
+        self.games   = {}
+        self.replies = {}
+        self.rids    = itertools.count(1)
+        self.metrics = None  # last published by the worker
+
+    @log_failure(log)
+    def serve(self):
+        while True:
+            try:
+                cmd, data = self.read()
+            except EndpointDied:
+                break
+
+            command = self.commands.get(cmd)
+            if not command:
+                log.error('Unknown worker command %r', cmd)
+                continue
+
+            try:
+                command(self, *data)
+            except Exception:
+                log.exception('Error handling worker command %s', cmd)
+
+        log.error('Worker %s died, killing %d games', self.pid, len(self.games))
+        for rst in self.replies.values():
+            rst.set(None)
+
+        for manager in self.games.values():
+            Subsystem.lobby.force_end_game(manager)
+
+    def request(self, cmd, *args):
+        if self.link_state != 'connected':
+            return None
+
+        rid = next(self.rids)
+        rst = self.replies[rid] = AsyncResult()
+        self.write([cmd, [rid] + list(args)])
+        try:
+            return rst.get(timeout=self.REPLY_TIMEOUT)
+        except gevent.Timeout:
+            log.error('Worker %s timed out on %s', self.pid, cmd)
+            return None
+        finally:
+            self.replies.pop(rid, None)
+
+    # -- lobby side api --
+    def start_game(self, manager):
+        g = manager.game
+        self.games[manager.gameid] = manager
+        for p in g.players:
+            if not p.is_npc:
+                p.client.gamedata = GamedataForwarder(self, manager.gameid, p.client)
+
+        self.write(['start_game', [
+            manager.gameid,
+            manager.gamecls.__name__,
+            manager.game_params,
+            manager.consumed_game_items,
+            g.rndseed,
+            [[p.account, p.is_npc] for p in g.players],
+        ]])
+
+    def exit_game(self, manager, user, is_drop):
+        return bool(self.request('exit_game', manager.gameid, user.account.userid, is_drop))
+
+    def reconnect(self, manager, user):
+        user.gamedata = GamedataForwarder(self, manager.gameid, user)
+        self.write(['reconnect', [manager.gameid, user.account.userid]])
+
+    def kill_game(self, manager):
+        self.write(['kill_game', [manager.gameid]])
+
+    # -- worker commands --
+    def command_gamedata(self, gid, uid, frame):
+        manager = self.games.get(gid)
+        manager and manager.deliver_gamedata(uid, frame)
+
+    def command_user_gamedata(self, gid, uid, tag, data):
+        manager = self.games.get(gid)
+        manager and manager.record_user_gamedata_raw(uid, tag, data)
+
+    def command_game_ended(self, gid, suicide, results):
+        manager = self.games.pop(gid, None)
+        if not manager:
+            return
+
+        g = manager.game
+        players = {p.account.userid: p for p in g.players}
+        winners = []
+        for uid, dropped, fleed, won in results:
+            p = players.get(uid)
+            if not p:
+                continue
+
+            p.set_dropped(dropped)
+            p.set_fleed(fleed)
+            won and winners.append(p)
+
+        g.winners = winners
+        g.suicide = suicide
+        Subsystem.lobby.end_game(manager)
+
+    def command_reply(self, rid, value):
+        rst = self.replies.get(rid)
+        rst and rst.set(value)
+
+    def command_metrics(self, dump):
+        self.metrics = dump
+
+
+WorkerLink.commands = method_table('worker_link', WorkerLink)
+
+
+class GamedataForwarder(object):
+    '''
+    Stands in for Client.gamedata on the lobby side while the game
+    runs in a worker: everything fed is passed along.
+    '''
+
+    def __init__(self, link, gid, client):
+        self.link   = link
+        self.gid    = gid
+        self.uid    = client.account.userid
+
+    def feed(self, packet):
+        self.link.write(['gamedata', [self.gid, self.uid, packet]])
+
+    def gexpect(self, tag, blocking=True):
+        raise EndpointDied
+
+    def gbreak(self):
+        # dropping is forwarded through exit_game
+        pass
+
+
+class WorkerPool(object):
+    def __init__(self):
+        self.links = []
+
+    def spawn(self, n):
+        '''
+        Fork n workers. Only returns in the lobby process.
+        '''
+        for i in xrange(n):
+            a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            pid = os.fork()
+            if not pid:
+                a.close()
+                for link in self.links:
+                    link.close()
+
+                GameWorker(b).serve()
+                os._exit(0)
+
+            b.close()
+            link = WorkerLink(a, pid)
+            gevent.spawn(link.serve).gr_name = 'WorkerLink:%s' % pid
+            self.links.append(link)
+            log.info('Game worker %s started', pid)
+
+        metrics.add_source('workers', self.worker_metrics)
+
+    def worker_metrics(self):
+        return {l.pid: l.metrics for l in self.links}
+
+    def start_game(self, manager):
+        links = [l for l in self.links if l.link_state == 'connected']
+        if not links:
+            log.error('No game worker available, running game in lobby process')
+            manager.game.start()
+            return
+
+        link = min(links, key=lambda l: len(l.games))
+        manager.worker = link
+        Subsystem.lobby.start_game(manager)
+        link.start_game(manager)
+
+
+class WorkerClient(object):
+    '''
+    Worker side stand in of a lobby Client.
+    '''
+    state   = 'ingame'
+    dropped = False
+
+    def __init__(self, worker, gid, account):
+        self.worker    = worker
+        self.gid       = gid
+        self.account   = account
+        self.gamedata  = Gamedata()
+        self.observers = BatchList()
+
+    def __repr__(self):
+        return 'WorkerClient:%s:%s' % (self.gid, self.account.username.encode('utf-8'))
+
+    def gexpect(self, tag, blocking=True):
+        if self.dropped:
+            raise EndpointDied
+
+        tag, data = self.gamedata.gexpect(tag, blocking)
+        tag and self.worker.write(['user_gamedata', [
+            self.gid, self.account.userid, tag, Endpoint.encode(data),
+        ]])
+        return tag, data
+
+    def gwrite(self, tag, data):
+        # the lobby transcodes for clients not talking FMT_COMPACT
+        frame = Gamedata.encode(tag, data, Endpoint.FMT_COMPACT)
+        self.worker.write(['gamedata', [self.gid, self.account.userid, frame]])
+
+    def gbreak(self):
+        return self.gamedata.gbreak()
+
+    def gclear(self):
+        self.gamedata = Gamedata()
+
+
+class HostedGame(object):
+    '''
+    What a game running in a worker sees as its GameManager.
+    '''
+
+    def __init__(self, lobby, game, params, items):
+        self.lobby               = lobby
+        self.game                = game
+        self.gameid              = game.gameid
+        self.game_params         = params
+        self.consumed_game_items = items
+
+
+class GameWorker(Endpoint):
+    '''
+    Worker process side. Acts as the lobby of the games it hosts,
+    which report back through start_game/end_game.
+    '''
+    SEND_QUEUE_LIMIT = None  # see WorkerLink
+    METRICS_INTERVAL = 10
+
+    def __init__(self, sock):
+        Endpoint.__init__(self, sock, ('lobby', os.getppid()))
+        self.games = {}
+
+    def serve(self):
+        log.info('Game worker %s serving', os.getpid())
+
+        # threads don't survive fork, the lobby's watchdog can't see us
+        options.block_threshold and watchdog.start(options.block_threshold / 1000.0)
+        metrics.enabled and gevent.spawn(self.publish_metrics)
+        while True:
+            try:
+                cmd, data = self.read()
+            except EndpointDied:
+                break
+
+            command = self.commands.get(cmd)
+            if not command:
+                log.error('Unknown lobby command %r', cmd)
+                continue
+
+            try:
+                command(self, *data)
+            except Exception:
+                log.exception('Error handling lobby command %s', cmd)
+
+        log.info('Lobby gone, game worker %s exiting', os.getpid())
+        for g in self.games.values():
+            g.kill()
+
+    def find_player(self, gid, uid):
+        g = self.games.get(gid)
+        if not g:
+            return None
+
+        for p in g.players:
+            if p.client.account.userid == uid:
+                return p
+
+        return None
+
+    def publish_metrics(self):
+        while self.link_state == 'connected':
+            gevent.sleep(self.METRICS_INTERVAL)
+            self.write(['metrics', [metrics.dump()]])
+
+    # -- lobby commands --
+    def command_start_game(self, gid, mode, params, items, seed, players):
+        from thb import modes
+        g = modes[mode]()
+
+        g.gameid    = gid
+        g.rndseed   = seed
+        g.random    = random.Random(seed)
+        g.gr_groups = WeakSet()
+        g._manager  = HostedGame(self, g, params, {int(k): v for k, v in items.items()})
+
+        npcs = iter(g.npc_players)
+        pl = BatchList()
+        for acc, is_npc in players:
+            acc = Account.parse(acc)
+            if is_npc:
+                i = next(npcs)
+                p = NPCPlayer(NPCClient(i.name), i.input_handler)
+                p.client.account = acc
+            else:
+                p = Player(WorkerClient(self, gid, acc))
+
+            pl.append(p)
+
+        g.players = pl
+        self.games[gid] = g
+        g.start()
+
+    def command_gamedata(self, gid, uid, packet):
+        p = self.find_player(gid, uid)
+        p and p.client.gamedata.feed(packet)
+
+    def command_exit_game(self, rid, gid, uid, is_drop):
+        g = self.games.get(gid)
+        p = self.find_player(gid, uid)
+        if not p:
+            self.write(['reply', [rid, True]])
+            return
+
+        can_leave = g.can_leave(p)
+        if can_leave:
+            p.set_fleed(False)
+        else:
+            p.set_dropped()
+            p.set_fleed(not is_drop)
+
+        p.client.gbreak()
+        p.client.dropped = True
+        self.write(['reply', [rid, can_leave]])
+
+    def command_reconnect(self, gid, uid):
+        p = self.find_player(gid, uid)
+        if not p:
+            return
+
+        p.client.gclear()
+        p.client.dropped = False
+        p.reconnect(p.client)
+
+    def command_kill_game(self, gid):
+        g = self.games.get(gid)
+        if g:
+            g.suicide = True
+
+    # -- lobby interface for Game --
+    def start_game(self, manager):
+        pass
+
+    def end_game(self, manager):
+        g = self.games.pop(manager.gameid, None)
+        if not g:
+            return
+
+        winners = getattr(g, 'winners', [])
+        self.write(['game_ended', [manager.gameid, g.suicide, [
+            [p.client.account.userid, p.dropped, p.fleed, p in winners]
+            for p in g.players
+        ]]])
+
+
+GameWorker.commands = method_table('game_worker', GameWorker)
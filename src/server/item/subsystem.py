@@ -8,6 +8,7 @@ import sys
 # -- third party --
 
 # -- own --
+from server.command import command_table
 from server.item import backpack, exchange, lottery
 from utils import BusinessException
 
@@ -19,7 +20,8 @@ log = logging.getLogger('ItemSystem')
 class ItemSystem(object):
 
     def __init__(self):
-        self.command_dispatch = {
+        self.commands = command_table('item')
+        for cmd, f in {
             'backpack':    self.backpack,
             'use':         self.use,
             'drop':        self.drop,
@@ -28,7 +30,8 @@ class ItemSystem(object):
             'sell':        self.sell,
             'cancel_sell': self.cancel_sell,
             'lottery':     self.lottery,
-        }
+        }.items():
+            self.commands.add(cmd, f, argstypes=f._contract)
 
     def _command(*argstype):
         def decorate(f):
@@ -38,25 +41,22 @@ class ItemSystem(object):
         return decorate
 
     def process_command(self, user, cmd, args):
-        dispatch = self.command_dispatch
-        handler = dispatch.get(cmd)
+        command = self.commands.get(cmd)
 
         if not user.account:
             user.write(['message_err', 'not_logged_in'])
             return
 
-        if not handler:
+        if not command:
             log.info('Unknown item command %s', cmd)
             return
 
-        argstype = handler._contract
-
-        if not (len(argstype) == len(args) and all(isinstance(v, t) for t, v in zip(argstype, args))):
-            log.debug('Command %s with wrong args, expecting %r, actual %r', cmd, argstype, args)
+        if command.check(None, args):
+            log.debug('Command %s with wrong args, expecting %r, actual %r', cmd, command.argstypes, args)
             return
 
         try:
-            handler(user, *args)
+            command(user, *args)
         except BusinessException as e:
             log.info("Command %s execution failed, user: %s, args: %s",
                      user.account.userid, args,
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from collections import deque
+from weakref import WeakSet
+import itertools
+import logging
+import random
+import time
+
+# -- third party --
+from gevent import GreenletExit
+from gevent.event import Event
+import gevent
+
+# -- own --
+from account import Account
+from endpoint import Endpoint, EndpointDied
+from game.archive import ArchiveWriter
+from server.core.endpoint import NPCClient
+from server.core.game_server import NPCPlayer, Player
+from settings import VERSION
+from utils import BatchList, ObjectDict
+
+
+# -- code --
+log = logging.getLogger('server.sim')
+
+
+class SimulatedGame(object):
+    '''
+    What a simulated game sees as its GameManager.
+    '''
+
+    def __init__(self, lobby, game, params, items=None):
+        self.lobby               = lobby
+        self.game                = game
+        self.gameid              = game.gameid
+        self.game_params         = params
+        self.consumed_game_items = items or {}
+
+
+class ArrivalOrder(object):
+    '''
+    Makes input waiters of one user_input finish in the order their
+    input arrived in the original game, which decides who wins an 'any'
+    input. Waiters wait for every waiter holding earlier input.
+    '''
+
+    def __init__(self):
+        self.waiting = {}  # seq -> Event
+
+    def wait(self, seq):
+        waiting = self.waiting
+        evt = waiting[seq] = Event()
+        try:
+            gevent.sleep(0)  # let the other waiters of this user_input show up
+            if min(waiting) != seq:
+                evt.wait()
+        finally:
+            del waiting[seq]
+            waiting and waiting[min(waiting)].set()
+
+
+class ArchiveClient(object):
+    '''
+    Feeds the input recorded in a game archive back to the game,
+    in the order it originally arrived.
+    Input never recorded is treated as a timed out player.
+    '''
+    state = 'ingame'
+
+    def __init__(self, name, uid, recorded, order):
+        acc = Account.build_npc_account(name)
+        if uid is not None:
+            acc.userid = uid
+
+        self.account   = acc
+        self.recorded  = recorded  # tag -> deque([(seq, data), ...])
+        self.order     = order
+        self.observers = BatchList()
+
+    def gexpect(self, tag, blocking=True):
+        q = self.recorded.get(tag)
+        if not q:
+            raise EndpointDied
+
+        seq, data = q.popleft()
+        self.order.wait(seq)
+        return tag, data
+
+    def gwrite(self, tag, data):
+        pass
+
+    def gbreak(self):
+        pass
+
+    def gclear(self):
+        pass
+
+
+class PolicyClient(object):
+    '''
+    Answers input through the network code path with an input policy,
+    recording everything sent and received to an ArchiveWriter.
+    '''
+    state = 'ingame'
+
+    def __init__(self, idx, name, policy, writer):
+        self.idx       = idx
+        self.account   = Account.build_npc_account(name)
+        self.policy    = policy
+        self.writer    = writer
+        self.pending   = None  # (trans, ilet), see Simulator.record_game
+        self.observers = BatchList()
+
+    def gexpect(self, tag, blocking=True):
+        if not self.pending:
+            raise EndpointDied
+
+        trans, ilet = self.pending
+        self.pending = None
+        self.policy(trans, ilet)
+        data = ilet.data()
+        self.writer.record_user_gamedata(self.idx, tag, Endpoint.encode(data))
+        return tag, data
+
+    def gwrite(self, tag, data):
+        self.writer.record_gamedata(self.idx, Endpoint.encode(['gamedata', [tag, data]]))
+
+    def gbreak(self):
+        pass
+
+    def gclear(self):
+        pass
+
+
+class Simulator(object):
+    '''
+    Runs complete server side games in process, without sockets.
+
+    In self-play every seat is an NPC player driven by an input policy,
+    a callable taking (trans, ilet) and filling in the inputlet like
+    CirnoAI.ai_main does. Input goes through Inputlet.data() and parse()
+    just like network input. Archived games can be replayed as well.
+    g.pause() is a no-op.
+
+    Needs game.autoenv.init('Server').
+    '''
+
+    def __init__(self, mode, policies=None, params=None):
+        from thb import modes
+
+        self.gamecls  = cls = modes[mode] if isinstance(mode, basestring) else mode
+        self.policies = policies  # None: a RandomAI per seat, seeded from the game seed
+        self.params   = {k: v[0] for k, v in cls.params_def.items()}
+        self.params.update(params or {})
+        self.gids     = itertools.count(1)
+
+        assert policies is None or len(policies) == cls.n_persons
+
+    def seat_policies(self, seed):
+        '''
+        Input policies for a game with seed, games with the same
+        seed get the same random choices.
+        '''
+        if self.policies:
+            return self.policies
+
+        from thb.ai import RandomAI
+        rnd = random.Random(seed)
+        return [
+            RandomAI.seeded(random.Random(rnd.getrandbits(63)))
+            for _ in xrange(self.gamecls.n_persons)
+        ]
+
+    # -- lobby interface for Game --
+    def start_game(self, manager):
+        pass
+
+    def end_game(self, manager):
+        pass
+
+    def make_game(self, seed, params=None, items=None):
+        g = self.gamecls()
+        g.gameid    = next(self.gids)
+        g.rndseed   = seed
+        g.random    = random.Random(seed)
+        g.gr_groups = WeakSet()
+        g.pause     = lambda t: None
+        g._manager  = SimulatedGame(self, g, params or self.params, items)
+        return g
+
+    def play(self, g, seats, timeout, hook=None):
+        '''
+        Run game g with human seats to the end, returns an ObjectDict with
+        gameid, mode, seed, winners (seat indices), synctag, actions,
+        events, duration and error (None if the game ended normally).
+        hook(evt_type, data) is called before each event is emitted.
+        '''
+        pl = BatchList(seats)
+        pl[:0] = [NPCPlayer(NPCClient(i.name), i.input_handler) for i in g.npc_players]
+        g.players = pl
+        seats = list(pl)
+
+        counts = {'actions': 0, 'events': 0}
+        started = time.time()
+        deadline = started + timeout
+        get_synctag, process_action, emit_event = g.get_synctag, g.process_action, g.emit_event
+
+        def get_synctag_before_deadline():
+            # a game fed by instant policies may never yield to the hub,
+            # so timers can't be relied on
+            if time.time() > deadline:
+                g.suicide = True
+                raise GreenletExit
+
+            return get_synctag()
+
+        def counted_process_action(*a, **k):
+            counts['actions'] += 1
+            return process_action(*a, **k)
+
+        def counted_emit_event(evt_type, data):
+            counts['events'] += 1
+            hook and hook(evt_type, data)
+            return emit_event(evt_type, data)
+
+        g.get_synctag    = get_synctag_before_deadline
+        g.process_action = counted_process_action
+        g.emit_event     = counted_emit_event
+
+        g.start()
+        g.join()
+
+        error = None
+        if g.suicide:
+            error = 'Timeout'
+        elif g.exception is not None:
+            error = repr(g.exception)
+
+        winners = []
+        for w in getattr(g, 'winners', None) or []:
+            w = getattr(w, 'player', w)
+            winners.extend(i for i, p in enumerate(seats) if p is w)
+
+        return ObjectDict(
+            gameid=g.gameid,
+            mode=self.gamecls.__name__,
+            seed=g.rndseed,
+            winners=winners,
+            synctag=g.synctag,
+            actions=counts['actions'],
+            events=counts['events'],
+            duration=time.time() - started,
+            error=error,
+        )
+
+    def run_game(self, seed=None, timeout=60):
+        '''
+        Self-play one game, see play().
+        '''
+        seed = random.getrandbits(63) if seed is None else seed
+        g = self.make_game(seed)
+        return self.play(g, [
+            NPCPlayer(NPCClient(u'Sim%d' % i), policy)
+            for i, policy in enumerate(self.seat_policies(seed))
+        ], timeout)
+
+    def record_game(self, path, seed=None, timeout=60):
+        '''
+        Self-play one game through the network code path of user_input,
+        writing a server style game archive to path. See play().
+        '''
+        seed = random.getrandbits(63) if seed is None else seed
+        g = self.make_game(seed)
+        policies = self.seat_policies(seed)
+        names = [u'Sim%d' % i for i in xrange(len(policies))]
+        writer = ArchiveWriter(path, {
+            'names':   names,
+            'uids':    None,
+            'version': VERSION,
+            'gameid':  g.gameid,
+            'start':   int(time.time()),
+            'mode':    self.gamecls.__name__,
+            'params':  g._manager.game_params,
+            'items':   {},
+            'seed':    seed,
+        })
+
+        clients = [PolicyClient(i, n, p, writer) for i, (n, p) in enumerate(zip(names, policies))]
+
+        def hook(evt_type, data):
+            if evt_type == 'user_input_start':
+                trans, ilet = data
+                cl = ilet.actor.client
+                if isinstance(cl, PolicyClient):
+                    cl.pending = (trans, ilet)
+
+        rst = self.play(g, [Player(c) for c in clients], timeout, hook)
+        writer.close({'end': int(time.time())})
+        writer.join()
+        return rst
+
+    def replay_archive(self, arc, timeout=60):
+        '''
+        Replay a game loaded by game.archive.load_archive, feeding
+        recorded user input back. See play(), the result additionally
+        has `leftover`: recorded input never asked for, non zero when
+        the replay diverged from the original game.
+        '''
+        assert arc.mode == self.gamecls.__name__
+        items = {int(k): v for k, v in (arc['items'] or {}).items()}
+        g = self.make_game(arc.seed, arc.params, items)
+
+        recorded = [{} for _ in arc.names]
+        for seq, (idx, tag, data) in enumerate(arc.usergdhistory):
+            recorded[idx].setdefault(tag, deque()).append((seq, data))
+
+        order = ArrivalOrder()
+        uids = arc.uids or [None] * len(arc.names)
+        clients = [ArchiveClient(n, uid, r, order) for n, uid, r in zip(arc.names, uids, recorded)]
+        rst = self.play(g, [Player(c) for c in clients], timeout)
+        rst.leftover = sum(len(q) for c in clients for q in c.recorded.values())
+        return rst
+
+    def run(self, n, seed=None, timeout=60):
+        '''
+        Run n games one after another, yielding results.
+        Given a seed, game seeds are derived from it.
+        '''
+        rnd = random.Random(seed)
+        for _ in xrange(n):
+            yield self.run_game(rnd.getrandbits(63), timeout)
+            gevent.sleep(0)  # let killed input greenlets go
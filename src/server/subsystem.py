@@ -7,4 +7,5 @@ class Subsystem(object):
         'lobby',
         'item',
         'interconnect',
+        'workers',
     )
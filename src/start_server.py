@@ -55,6 +55,14 @@ def start_server():
     parser.add_argument('--redis-url', default='redis://localhost:6379')
     parser.add_argument('--discuz-authkey', default='Proton rocks')
     parser.add_argument('--db', default='sqlite:////dev/shm/thb.sqlite3')
+    parser.add_argument('--workers', default=0, type=int, help='Run games in N forked worker processes')
+    parser.add_argument('--send-queue-limit', default=4096, type=int, help='Drop clients falling behind by N KiB')
+    parser.add_argument('--no-metrics', action='store_true')
+    parser.add_argument('--yield-every', default=0, type=int, help='Let other games run every N game events, 0 to disable')
+    parser.add_argument('--block-threshold', default=200, type=int, help='Log greenlets blocking the hub longer than this (ms), 0 to disable')
+    parser.add_argument('--metrics-port', default=0, type=int, help='Serve metrics as json on localhost:PORT')
+    parser.add_argument('--metrics-file', default='', help='Dump metrics to this file every minute')
+    parser.add_argument('--bulk-compress-bytes', default=16384, type=int, help='Compress bursts bigger than this, 0 to disable')
     options = parser.parse_args()
 
     import options as opmodule
@@ -65,15 +73,40 @@ def start_server():
 
     autoenv.init('Server')
 
+    import thb  # noqa, game modes and their FMT_COMPACT tables
+
     import settings
 
     utils.logging.init_server(getattr(logging, options.log.upper()), settings.SENTRY_DSN, settings.VERSION, options.logfile)
 
+    from utils.metrics import metrics
+    options.no_metrics or metrics.enable()  # before forking, workers inherit it
+
+    if options.workers:
+        # fork before anything starts serving, workers never return
+        from server.core.worker import WorkerPool
+        from server.subsystem import Subsystem
+        Subsystem.workers = WorkerPool()
+        Subsystem.workers.spawn(options.workers)
+
+    if not options.no_metrics:
+        options.metrics_file and metrics.start_dumper(options.metrics_file)
+        if options.metrics_port:
+            from gevent.pywsgi import WSGIServer
+            gevent.spawn(WSGIServer(('127.0.0.1', options.metrics_port), metrics.wsgi_app, log=None).serve_forever)
+
+    from utils.watchdog import watchdog
+    options.block_threshold and watchdog.start(options.block_threshold / 1000.0)  # workers start their own
+
     if not options.no_backdoor:
         from gevent.backdoor import BackdoorServer
-        gevent.spawn(BackdoorServer((options.backdoor_host, options.backdoor_port)).serve_forever)
+        from utils.profiler import profiler
+        backdoor = BackdoorServer((options.backdoor_host, options.backdoor_port), locals={'profiler': profiler, 'watchdog': watchdog})
+        gevent.spawn(backdoor.serve_forever)
 
     from server.core import Client
+    Client.SEND_QUEUE_LIMIT    = options.send_queue_limit * 1024
+    Client.BULK_COMPRESS_BYTES = options.bulk_compress_bytes
 
     root = logging.getLogger()
     root.info('=' * 20 + settings.VERSION + '=' * 20)
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 # -- stdlib --
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
 from copy import copy
 import logging
 
@@ -180,13 +180,22 @@ def skill_check(wrapped):
 
 
 class MigrateCardsTransaction(object):
+    '''
+    Card movements of an action, committed together.
+    Handlers see one card_migration event per movement,
+    and one post_card_migration with the whole transaction.
+    '''
     def __init__(self, action):
         self.action = action
         self.cancelled = False
         self.movements = []
+        self.cardlist_types = set()  # types of the card lists involved
 
     def move(self, cards, _from, to, is_bh, front):
         self.movements.append((cards, _from, to, is_bh, front))
+        types = self.cardlist_types
+        types.add(getattr(_from, 'type', None))
+        types.add(to.type)
 
     def __enter__(self):
         return self
@@ -283,17 +292,34 @@ def migrate_cards(cards, to, unwrap=False, is_bh=False, front=False, trans=None)
 
 
 class PostCardMigrationHandler(EventHandlerGroup):
+    '''
+    Calls its handlers with (player, trans) for every player.
+    Handlers may set `interested_cardlists` to the card list types
+    they care about, and are skipped if none is involved.
+    '''
     interested = ('post_card_migration',)
 
     def handle(self, evt_type, arg):
         if evt_type != 'post_card_migration': return arg
 
+        # only fan out handlers interested in the card lists involved,
+        # see `interested_cardlists`
+        types = arg.cardlist_types
+        handlers = []
+        for eh in self.handlers:
+            cls = getattr(eh, 'interested_cardlists', None)
+            if cls is None or not types.isdisjoint(cls):
+                handlers.append(eh)
+
+        if not handlers:
+            return arg
+
         g = Game.getgame()
         act = arg.action
         tgt = act.target or act.source or g.players[0]
 
         for p in g.players_from(tgt):
-            for eh in self.handlers:
+            for eh in handlers:
                 g.handle_single_event(eh, p, arg)
 
         return arg
@@ -667,6 +693,61 @@ class PutBack(GenericAction):
         return True
 
 
+class DistanceMap(dict):
+    '''
+    Player -> distance, iterating in seating order like the OrderedDict
+    it replaces, but copied at C speed: LaunchCard hands out a copy of a
+    cached one for every calc_distance.
+    '''
+    __slots__ = ('order',)
+
+    def __init__(self, order=(), items=()):
+        dict.__init__(self, items)
+        self.order = order
+
+    def copy(self):
+        return DistanceMap(self.order, self)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def keys(self):
+        return list(self.order)
+
+    def values(self):
+        return [self[p] for p in self.order]
+
+    def items(self):
+        return [(p, self[p]) for p in self.order]
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return (self[p] for p in self.order)
+
+    def iteritems(self):
+        return ((p, self[p]) for p in self.order)
+
+    def __setitem__(self, p, v):
+        if p not in self:
+            self.order += (p,)
+
+        dict.__setitem__(self, p, v)
+
+    def __delitem__(self, p):
+        dict.__delitem__(self, p)
+        self.order = tuple(i for i in self.order if i is not p)
+
+    def pop(self, p, *default):
+        if p in self:
+            self.order = tuple(i for i in self.order if i is not p)
+
+        return dict.pop(self, p, *default)
+
+    def __repr__(self):
+        return 'DistanceMap(%r)' % self.items()
+
+
 class LaunchCard(GenericAction):
     def __init__(self, source, target_list, card, action=None, bypass_check=False):
         self.force_action = action
@@ -801,14 +882,25 @@ class LaunchCard(GenericAction):
     @classmethod
     def calc_base_distance(cls, src):
         g = Game.getgame()
-        pl = [p for p in g.players if not p.dead or p is src]
-        loc = pl.index(src)
-        n = len(pl)
-        dist = OrderedDict([
-            (p, min(abs(i), n - abs(i)))
-            for p, i in zip(pl, xrange(-loc, -loc + n))
-        ])
-        return dist
+        players = g.players
+        key = tuple(players), tuple(p.dead for p in players)
+        cached = getattr(g, 'distance_matrix', None)
+        if not cached or cached[0] != key:
+            # seating changed: someone died, revived or got replaced
+            cached = g.distance_matrix = key, {}
+
+        matrix = cached[1]
+        dist = matrix.get(src)
+        if dist is None:
+            pl = [p for p in players if not p.dead or p is src]
+            loc = pl.index(src)
+            n = len(pl)
+            dist = matrix[src] = DistanceMap(tuple(pl), [
+                (p, min(abs(i), n - abs(i)))
+                for p, i in zip(pl, xrange(-loc, -loc + n))
+            ])
+
+        return dist.copy()
 
 
 class ActionStageLaunchCard(LaunchCard):
@@ -901,6 +993,7 @@ class ActionStage(BaseActionStage):
 @register_eh
 class ShuffleHandler(EventHandler):
     interested = ('action_after', 'action_before', 'action_stage_action', 'card_migration', 'user_input_start')
+    interested_actions = (ActionStage,)
 
     def handle(self, evt_type, arg):
         if evt_type == 'action_stage_action':
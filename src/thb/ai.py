@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from itertools import chain
+import logging
+import random
+
+# -- third party --
+# -- own --
+from thb.inputlets import ActionInputlet, ChooseGirlInputlet, ChooseIndividualCardInputlet
+from thb.inputlets import ChooseOptionInputlet, ChoosePeerCardInputlet, SortCharacterInputlet
+
+
+# -- code --
+log = logging.getLogger('thb.ai')
+
+
+class RandomAI(object):
+    '''
+    Makes random but legal choices, for headless self-play.
+    Same calling convention as CirnoAI: RandomAI.ai_main(trans, ilet),
+    or RandomAI.seeded(rnd) for a policy drawing from its own random.Random.
+    Never touches the game's own random, which must stay in sync
+    with what a replay of the game would draw.
+    '''
+
+    PASS_RATE = 0.15  # chance of ending the action stage / refusing a request
+    TRIES     = 8
+
+    def __init__(self, trans, ilet, rnd=random):
+        self.trans = trans
+        self.ilet = ilet
+        self.random = rnd
+
+    def entry(self):
+        ilet = self.ilet
+        for cls, f in self.dispatch:
+            if isinstance(ilet, cls):
+                f(self)
+                return
+
+    def choose_action(self):
+        ilet = self.ilet
+        rnd = self.random
+        if rnd.random() < self.PASS_RATE:
+            return
+
+        p = ilet.actor
+        initiator = ilet.initiator
+        verify = getattr(initiator, 'ask_for_action_verify', None)
+        cl = list(chain(*[getattr(p, i) for i in ilet.categories])) if ilet.categories else []
+        candidates = list(ilet.candidates or [])
+
+        for _ in xrange(self.TRIES):
+            cards = rnd.sample(cl, min(len(cl), rnd.randint(1, 2))) if cl else []
+            pl = rnd.sample(candidates, min(len(candidates), rnd.randint(0, 2)))
+
+            try:
+                if ilet.categories and not initiator.cond(cards):
+                    continue
+
+                if ilet.candidates:
+                    pl, valid = initiator.choose_player_target(pl)
+                    if not valid:
+                        continue
+
+                if verify and not verify(p, cards, pl):
+                    continue
+
+            except Exception:
+                # random inputs may break assumptions of cond functions
+                log.debug('RandomAI: rejected %r -> %r', cards, pl, exc_info=1)
+                continue
+
+            ilet.set_result(skills=[], cards=cards, players=pl)
+            return
+
+    def choose_option(self):
+        ilet = self.ilet
+        if ilet.options:
+            ilet.set_option(self.random.choice(list(ilet.options)))
+
+    def choose_individual_card(self):
+        ilet = self.ilet
+        if ilet.cards:
+            ilet.set_card(self.random.choice(list(ilet.cards)))
+
+    def choose_peer_card(self):
+        ilet = self.ilet
+        tgt = ilet.target
+        cl = list(chain(*[getattr(tgt, i) for i in ilet.categories]))
+        if cl:
+            ilet.set_card(self.random.choice(cl))
+
+    def choose_girl(self):
+        ilet = self.ilet
+        choices = [c for c in ilet.mapping.get(ilet.actor, []) if not c.chosen]
+        if choices:
+            ilet.set_choice(self.random.choice(choices))
+
+    def sort_character(self):
+        ilet = self.ilet
+        rst = range(ilet.num)
+        self.random.shuffle(rst)
+        ilet.set_result(rst)
+
+    dispatch = [
+        (ActionInputlet,               choose_action),
+        (ChooseOptionInputlet,         choose_option),
+        (ChooseIndividualCardInputlet, choose_individual_card),
+        (ChoosePeerCardInputlet,       choose_peer_card),
+        (ChooseGirlInputlet,           choose_girl),
+        (SortCharacterInputlet,        sort_character),
+    ]
+
+    @classmethod
+    def ai_main(cls, trans, ilet):
+        cls(trans, ilet).entry()
+
+    @classmethod
+    def seeded(cls, rnd):
+        def ai_main(trans, ilet):
+            cls(trans, ilet, rnd).entry()
+
+        return ai_main
@@ -9,6 +9,7 @@ import logging
 
 # -- third party --
 # -- own --
+from endpoint import CompactTable, Endpoint
 from game.autoenv import Game, GameError, GameObject, list_shuffle
 
 
@@ -63,6 +64,10 @@ class Card(GameObject):
             track_id=self.track_id,
         )
 
+    def __compact__(self):
+        cls_id = CARD_TABLE.id_or_name(self.__class__.__name__)
+        return [CARD_MARK, cls_id, self.suit, self.number, self.sync_id, self.track_id]
+
     def sync(self, data):  # this only executes at client side, let it crash.
         if data['sync_id'] != self.sync_id:
             logging.error(
@@ -178,6 +183,9 @@ class VirtualCard(Card):
             'params': self.action_params,
         }
 
+    def __compact__(self):
+        return [VCARD_MARK, self.__class__.__name__, self.sync_id, self.action_params]
+
     def check(self):  # override this
         return False
 
@@ -275,6 +283,7 @@ class CardList(GameObject, deque):
     def __init__(self, owner, type):
         self.owner = owner
         self.type = type
+        self.members = {}  # id(card) -> count, membership by identity in O(1)
         deque.__init__(self)
 
     def __eq__(self, rhs):
@@ -282,6 +291,83 @@ class CardList(GameObject, deque):
         # card list never equals to a deque.
         return self is rhs
 
+    def __contains__(self, c):
+        return id(c) in self.members
+
+    def _add(self, c):
+        k = id(c)
+        self.members[k] = self.members.get(k, 0) + 1
+
+    def _discard(self, c):
+        k = id(c)
+        n = self.members[k] - 1
+        if n:
+            self.members[k] = n
+        else:
+            del self.members[k]
+
+    def append(self, c):
+        self._add(c)
+        deque.append(self, c)
+
+    def appendleft(self, c):
+        self._add(c)
+        deque.appendleft(self, c)
+
+    def extend(self, cards):
+        cards = list(cards)
+        for c in cards:
+            self._add(c)
+
+        deque.extend(self, cards)
+
+    def extendleft(self, cards):
+        cards = list(cards)
+        for c in cards:
+            self._add(c)
+
+        deque.extendleft(self, cards)
+
+    def __iadd__(self, cards):
+        self.extend(cards)
+        return self
+
+    def pop(self):
+        c = deque.pop(self)
+        self._discard(c)
+        return c
+
+    def popleft(self):
+        c = deque.popleft(self)
+        self._discard(c)
+        return c
+
+    def remove(self, c):
+        if id(c) not in self.members:
+            raise ValueError('CardList.remove(x): x not in list')
+
+        # cards mostly leave from either end (drawing from the deck, using
+        # the last drawn card), otherwise find it by identity, not __eq__
+        if self[0] is c:
+            self.popleft()
+        elif self[-1] is c:
+            self.pop()
+        else:
+            del self[next(i for i, v in enumerate(self) if v is c)]
+
+    def clear(self):
+        self.members.clear()
+        deque.clear(self)
+
+    def __setitem__(self, i, c):
+        self._discard(self[i])
+        self._add(c)
+        deque.__setitem__(self, i, c)
+
+    def __delitem__(self, i):
+        self._discard(self[i])
+        deque.__delitem__(self, i)
+
     def __repr__(self):
         return "CardList(owner=%s, type=%s, len == %d)" % (self.owner, self.type, len(self))
 
@@ -309,14 +395,19 @@ class Deck(GameObject):
             dcl = self.droppedcards
 
             assert all(not c.is_card(VirtualCard) for c in dcl)
-            dropped = list(dcl)
-
-            dcl.clear()
-            dcl.extend(dropped[-10:])
 
+            # all but the last 10 dropped cards go back to the deck as
+            # fresh objects, the old ones may still be referenced elsewhere
+            # (finished actions, tags, the client ui, which also conceals
+            # the reshuffled ones) and must not alias hidden deck cards.
+            # Not recycling them is deliberate. Their ids are gone.
+            cr = self.cards_record
             tmpcl = CardList(None, 'temp')
-            l = [c.__class__(c.suit, c.number, cl, c.track_id) for c in dropped[:-10]]
-            tmpcl.extend(l)
+            for _ in xrange(len(dcl) - 10):
+                c = dcl.popleft()
+                cr.get(c.sync_id) is c and cr.pop(c.sync_id)
+                tmpcl.append(c.__class__(c.suit, c.number, cl, c.track_id))
+
             self.shuffle(tmpcl)
             cl.extend(tmpcl)
 
@@ -354,9 +445,15 @@ class Deck(GameObject):
         owner = cl.owner
         list_shuffle(cl, owner)
 
+        # new ids for all, allocated as one block,
+        # dropping records of the old ones
+        cr = self.cards_record
+        sid = Game.getgame().get_synctags(len(cl))
         for c in cl:
-            c.sync_id = 0
-            self.register_card(c)
+            cr.get(c.sync_id) is c and cr.pop(c.sync_id)
+            c.sync_id = sid
+            cr[sid] = c
+            sid += 1
 
     def inject(self, cls, suit, rank):
         cl = self.cards
@@ -488,3 +585,32 @@ class DummyCard(Card):  # another special thing....
     def __init__(self, suit=Card.NOTSET, number=0, resides_in=None, **kwargs):
         Card.__init__(self, suit, number, resides_in)
         self.__dict__.update(kwargs)
+
+
+# -- FMT_COMPACT, see Endpoint.register_compact --
+CARD_TABLE = CompactTable(lambda: sorted(Card.card_classes))
+
+
+def _decode_card(v):
+    cls_id, suit, number, sync_id, track_id = v
+    return dict(
+        type=cls_id if isinstance(cls_id, basestring) else CARD_TABLE.name_of(cls_id),
+        suit=suit,
+        number=number,
+        sync_id=sync_id,
+        track_id=track_id,
+    )
+
+
+def _decode_vcard(v):
+    clsname, sync_id, params = v
+    return {
+        'class':   clsname,
+        'sync_id': sync_id,
+        'vcard':   True,
+        'params':  params,
+    }
+
+
+CARD_MARK  = Endpoint.register_compact(1, _decode_card, CARD_TABLE)
+VCARD_MARK = Endpoint.register_compact(2, _decode_vcard)
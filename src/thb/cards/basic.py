@@ -83,6 +83,7 @@ class AttackCardRangeHandler(EventHandler):
 @register_eh
 class AttackCardVitalityHandler(EventHandler):
     interested = ('action_before', 'action_shootdown')
+    interested_actions = (ActionStageLaunchCard,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, ActionStageLaunchCard):
@@ -125,6 +126,7 @@ class AttackCardVitalityHandler(EventHandler):
 @register_eh
 class VitalityHandler(EventHandler):
     interested = ('action_before', )
+    interested_actions = (ActionStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, ActionStage):
@@ -253,6 +255,7 @@ class WineRevive(GenericAction):
 @register_eh
 class WineHandler(EventHandler):
     interested = ('action_apply', 'action_before', 'post_choose_target')
+    interested_actions = (BaseAttack, Damage, PrepareStage)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, BaseAttack):
@@ -50,6 +50,7 @@ class ReforgeWeapon(Reforge):
 @register_eh
 class WeaponReforgeHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (ActionStageLaunchCard,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, ActionStageLaunchCard):
@@ -299,6 +300,7 @@ class NenshaPhone(GenericAction):
 @register_eh
 class NenshaPhoneHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, Damage):
@@ -446,6 +448,7 @@ class RepentanceStick(GenericAction):
 @register_eh
 class RepentanceStickHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (Damage,)
     execute_before = ('WineHandler', )
 
     def handle(self, evt_type, act):
@@ -476,6 +479,7 @@ class IbukiGourdSkill(RedUFOSkill):
 @register_eh
 class IbukiGourdHandler(EventHandler):
     interested = ('action_apply', 'action_after', 'card_migration')
+    interested_actions = (Damage, FinalizeStage)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, Damage):
@@ -563,6 +567,7 @@ class UmbrellaEffect(GenericAction):
 class UmbrellaHandler(EventHandler):
     # 紫的阳伞
     interested = ('action_before',)
+    interested_actions = (Damage,)
     execute_before = ('RejectHandler', )
 
     def handle(self, evt_type, act):
@@ -733,6 +738,7 @@ class AyaRoundfanSkill(WeaponSkill):
 @register_eh
 class AyaRoundfanHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage,)
     execute_after = ('DyingHandler', )
     card_usage = 'drop'
 
@@ -837,6 +843,7 @@ class DeathSickle(GenericAction):
 @register_eh
 class DeathSickleHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (Damage,)
     execute_before = ('WineHandler', )
 
     def handle(self, evt_type, act):
@@ -958,6 +965,7 @@ class SuwakoHatEffect(UserAction):
 @register_eh
 class SuwakoHatHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (DropCardStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, DropCardStage):
@@ -1122,6 +1130,7 @@ class SinsackHat(ShieldSkill):
 @register_eh
 class SinsackHatHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (FatetellStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, FatetellStage):
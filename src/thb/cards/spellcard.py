@@ -68,6 +68,7 @@ class Reject(InstantSpellCardAction):
 @register_eh
 class RejectHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (SpellCardAction,)
     card_usage = 'launch'
 
     def handle(self, evt_type, act):
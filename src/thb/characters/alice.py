@@ -117,6 +117,7 @@ class LittleLegionControlAction(UserAction):
 
 class LittleLegionHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (ActionStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, ActionStage):
@@ -220,6 +221,7 @@ class DollBlastHandlerCommon(object):
 class DollBlastMigrationHandler(DollBlastHandlerCommon, EventHandler):
     interested = ('post_card_migration',)
     group = PostCardMigrationHandler
+    interested_cardlists = ('equips',)
 
     def handle(self, p, trans):
         if not p.has_skill(DollBlast) or p.dead:
@@ -249,6 +251,7 @@ class DollBlastMigrationHandler(DollBlastHandlerCommon, EventHandler):
 
 class DollBlastDropHandler(DollBlastHandlerCommon, EventHandler):
     interested = ('action_before', 'action_after')
+    interested_actions = (DropCards,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, DropCards):
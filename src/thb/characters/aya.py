@@ -24,6 +24,7 @@ class UltimateSpeedAction(UserAction):
 
 class UltimateSpeedHandler(EventHandler):
     interested = ('action_apply', 'choose_target', 'post_calcdistance')
+    interested_actions = (PlayerTurn,)
 
     def handle(self, evt_type, arg):
         def is_card(card):
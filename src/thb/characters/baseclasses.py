@@ -15,38 +15,92 @@ from utils.misc import partition
 characters_by_category = defaultdict(set)
 
 
+class SkillList(list):
+    '''
+    Character.skills. Keeps an index from every class in a skill's mro
+    to the skills deriving from it, dropped whenever the list changes.
+    '''
+    __slots__ = ('index',)
+
+    def __init__(self, skills=()):
+        list.__init__(self, skills)
+        self.index = None
+
+    def lookup(self, skill):
+        index = self.index
+        if index is None:
+            index = self.index = defaultdict(list)
+            for s in self:
+                for base in s.__mro__:
+                    index[base].append(s)
+
+        return index.get(skill, ())
+
+
+def _invalidating(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *a, **k):
+        self.index = None
+        return method(self, *a, **k)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _m in (
+    'append', 'extend', 'insert', 'remove', 'pop', 'sort', 'reverse',
+    '__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__', '__imul__',
+):
+    setattr(SkillList, _m, _invalidating(_m))
+
+del _m
+
+
 class Character(GameObject):
     character_classes = {}
 
     def __init__(self, player):
         self.player = player
         self.disabled_skills = defaultdict(set)
+        self.all_disabled_skills = frozenset()
 
     def get_skills(self, skill):
-        return [s for s in self.skills if issubclass(s, skill)]
+        return list(self.skills.lookup(skill))
 
     def has_skill(self, skill):
         if self.dead:
             return False
 
-        if any(issubclass(skill, s) for l in self.disabled_skills.values() for s in l):
+        if self.all_disabled_skills and not self.all_disabled_skills.isdisjoint(skill.__mro__):
             return False
 
-        return self.get_skills(skill)
+        return self.skills.lookup(skill)
 
     def disable_skill(self, skill, reason):
         self.disabled_skills[reason].add(skill)
+        self.all_disabled_skills = frozenset().union(*self.disabled_skills.values())
 
     def reenable_skill(self, reason):
         self.disabled_skills.pop(reason, '')
+        self.all_disabled_skills = frozenset().union(*self.disabled_skills.values())
 
     def __repr__(self):
         return '<Char: {}>'.format(self.__class__.__name__)
 
     def __getattr__(self, k):
-        return getattr(self.player, k)
+        # cards, life, dead and tags live on the character itself (see
+        # mixin_character and the modes' decorate), only the rest is delegated
+        player = self.player
+        try:
+            return player.__dict__[k]
+        except KeyError:
+            return getattr(player, k)
 
     def __setattr__(self, k, v):
+        if k == 'skills' and not isinstance(v, SkillList):
+            v = SkillList(v)
+
         GameObject.__setattr__(self, k, v)
         if not k.startswith('__') and k.endswith('__'):
             assert not hasattr(self.player, k)
@@ -122,6 +122,7 @@ class PerfectFreezeAction(UserAction):
 
 class PerfectFreezeHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (Damage,)
 
     execute_after = (
         'RepentanceStickHandler',
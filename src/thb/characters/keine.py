@@ -160,6 +160,7 @@ class DevotedHeal(Heal):
 
 class DevotedHandler(EventHandler):
     interested = ('action_before', 'action_after')
+    interested_actions = (Damage, DrawCards, Heal)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, Damage):
@@ -207,6 +208,7 @@ class DevotedAction(UserAction):
 
 class KeineGuardHandler(EventHandler):
     interested = ('action_apply',)
+    interested_actions = (ActionStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, ActionStage):
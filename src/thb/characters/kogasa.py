@@ -84,6 +84,7 @@ class JollyDrawCard(DrawCards):
 
 class JollyHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (DrawCardStage,)
     choose_player_target = t_One
 
     def handle(self, evt_type, act):
@@ -84,6 +84,7 @@ class ReturningAwake(GenericAction):
 
 class ReturningHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (PlayerTurn,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, PlayerTurn):
@@ -126,6 +127,7 @@ class FerryFeeEffect(UserAction):
 
 class FerryFeeHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, Damage):
@@ -54,6 +54,7 @@ class EchoAction(UserAction):
 
 class EchoHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage,)
     execute_after = (
         'DyingHandler',
         'AyaRoundfanHandler',
@@ -139,6 +140,7 @@ class ResonanceAction(AskForCard):
 
 class ResonanceHandler(EventHandler):
     interested = ('action_done',)
+    interested_actions = (Attack,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_done' and isinstance(act, Attack):
@@ -38,6 +38,7 @@ class CiguateraAction(UserAction):
 
 class CiguateraHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (FatetellStage,)
     card_usage = 'drop'
 
     def handle(self, evt_type, act):
@@ -105,6 +106,7 @@ class MelancholyAction(GenericAction):
 
 class MelancholyHandler(EventHandler):
     interested = ('action_after', 'action_shootdown')
+    interested_actions = (Damage, LaunchCard, UseCard)
     execute_after = (
         'DyingHandler',
         'AyaRoundfanHandler',
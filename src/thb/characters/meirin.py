@@ -68,6 +68,7 @@ class LoongPunchAction(GenericAction):
 
 class LoongPunchHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (LaunchGraze,)
     execute_after = ('DeathSickleHandler', )
 
     def handle(self, evt_type, act):
@@ -103,6 +104,7 @@ class RiverBehindAwake(GenericAction):
 
 class RiverBehindHandler(EventHandler):
     interested = ('action_apply',)
+    interested_actions = (PlayerTurn,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, PlayerTurn):
@@ -25,6 +25,7 @@ class FoisonDrawCardStage(DrawCardStage):
 
 class FoisonHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (DrawCardStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, DrawCardStage):
@@ -44,6 +44,7 @@ class DisarmReturningAction(GenericAction):
 
 class DisarmHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage, FinalizeStage)
     execute_after = ('DyingHandler',)
     execute_before = ('AyaRoundfanHandler',)
 
@@ -107,6 +108,7 @@ class SentryAction(AskForCard):
 
 class SentryHandler(EventHandler):
     interested = ('action_apply',)
+    interested_actions = (ActionStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, ActionStage):
@@ -176,6 +178,7 @@ class Telegnosis(Skill):
 
 class SolidShieldHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (ActionStageLaunchCard,)
     execute_after = ('AttackCardHandler',)
 
     def handle(self, evt_type, act):
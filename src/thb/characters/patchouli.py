@@ -39,6 +39,7 @@ class KnowledgeAction(GenericAction):
 
 class KnowledgeHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (SpellCardAction,)
     execute_before = ('RejectHandler', )
 
     def handle(self, evt_type, act):
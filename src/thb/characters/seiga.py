@@ -149,6 +149,7 @@ class SummonAction(UserAction):
 
 class SummonHandler(EventHandler):
     interested = ('action_apply', )
+    interested_actions = (PlayerDeath,)
     execute_after = ('DeathHandler', )
 
     def handle(self, evt_type, act):
@@ -229,6 +230,7 @@ class SummonKOFCollect(UserAction):
 
 class SummonKOFHandler(EventHandler):
     interested = ('action_apply',)
+    interested_actions = (PlayerDeath,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, PlayerDeath):
@@ -99,6 +99,7 @@ class ReversalDuel(TreatAs, VirtualCard):
 
 class ReversalHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (BaseAttack,)
     execute_before = (
         'HouraiJewelHandler',
         'RejectHandler',
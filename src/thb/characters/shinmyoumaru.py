@@ -95,6 +95,7 @@ class VengeOfTsukumogamiAction(FatetellAction):
 class VengeOfTsukumogamiHandler(EventHandler):
     interested = ('post_card_migration',)
     group = PostCardMigrationHandler
+    interested_cardlists = ('equips',)
 
     def handle(self, p, trans):
         if not p.has_skill(VengeOfTsukumogami) or p.dead:
@@ -82,6 +82,7 @@ class WindWalkTargetLimit(ActionShootdown):
 
 class WindWalkHandler(EventHandler):
     interested = ('action_apply', 'action_shootdown')
+    interested_actions = (LaunchCard, PlayerTurn)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, LaunchCard):
@@ -146,6 +147,7 @@ class DominanceAction(PlayerTurn):
 
 class DominanceHandler(EventHandler):
     interested = ('action_after', 'action_apply')
+    interested_actions = (LaunchCard, PlayerTurn)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, PlayerTurn):
@@ -34,6 +34,7 @@ class DestructionImpulseAction(GenericAction):
 
 class DestructionImpulseHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage, FinalizeStage)
     execute_before = ('CiguateraHandler', )
 
     def handle(self, evt_type, act):
@@ -103,6 +104,7 @@ class FourOfAKindAction(GenericAction):
 
 class FourOfAKindHandler(EventHandler):
     interested = ('action_before', )
+    interested_actions = (Damage,)
     execute_before = ('WineHandler', )
     execute_after = (
         'RepentanceStickHandler',
@@ -63,6 +63,7 @@ class MasochistAction(UserAction):
 
 class MasochistHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Damage,)
     execute_after = (
         'DyingHandler',
         'AyaRoundfanHandler',
@@ -104,6 +105,7 @@ class ScarletPerceptionAction(GenericAction):
 
 class ScarletPerceptionHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (Fatetell,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, Fatetell):
@@ -79,6 +79,7 @@ class FreakingPowerAction(FatetellAction):
 
 class FreakingPowerHandler(EventHandler):
     interested = ('action_after', 'action_before', )
+    interested_actions = (BaseAttack, Damage)
     execute_before = ('AyaRoundfanHandler',)
 
     def handle(self, evt_type, act):
@@ -57,6 +57,7 @@ class GuidedDeath(Skill):
 
 class GuidedDeathHandler(EventHandler):
     interested = ('action_apply',)
+    interested_actions = (FinalizeStage,)
     execute_before = ('SoulDrainHandler',)
 
     def handle(self, evt_type, act):
@@ -112,6 +113,7 @@ class SoulDrainEffect(GenericAction):
 
 class SoulDrainHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (TryRevive,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, TryRevive):
@@ -146,6 +148,7 @@ class SoulDrainHandler(EventHandler):
 
 class PerfectCherryBlossomHandler(EventHandler):
     interested = ('action_apply', 'action_before')
+    interested_actions = (DropCardStage, PlayerDeath)
     execute_after = ('DeathHandler', )
 
     def handle(self, evt_type, act):
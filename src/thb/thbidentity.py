@@ -38,6 +38,7 @@ def game_eh(cls):
 @game_eh
 class IdentityRevealHandler(EventHandler):
     interested = ('action_apply', )
+    interested_actions = (PlayerDeath,)
     execute_before = ('DeathHandler', )
 
     def handle(self, evt_type, act):
@@ -53,6 +54,7 @@ class IdentityRevealHandler(EventHandler):
 @game_eh
 class DeathHandler(EventHandler):
     interested = ('action_apply', 'action_after')
+    interested_actions = (PlayerDeath,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, PlayerDeath):
@@ -213,6 +215,7 @@ class AssistedUseAction(UserAction):
 
 class AssistedUseHandler(EventHandler):
     interested = ('action_apply',)
+    interested_actions = (AskForCard,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_apply' and isinstance(act, AskForCard):
@@ -270,6 +273,7 @@ class AssistedHealAction(UserAction):
 @game_eh
 class AssistedHealHandler(EventHandler):
     interested = ('action_after',)
+    interested_actions = (TryRevive,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_after' and isinstance(act, TryRevive):
@@ -300,6 +304,7 @@ class AssistedHeal(Skill):
 @game_eh
 class ExtraCardSlotHandler(EventHandler):
     interested = ('action_before',)
+    interested_actions = (DropCardStage,)
 
     def handle(self, evt_type, act):
         if evt_type == 'action_before' and isinstance(act, DropCardStage):
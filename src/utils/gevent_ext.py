@@ -6,6 +6,7 @@ import traceback
 
 # -- third party --
 from gevent.hub import Waiter, _NONE, get_hub
+import greenlet
 
 # -- own --
 # -- code --
@@ -57,3 +58,33 @@ def iwait(objects, timeout=None):
                     unlink(switch)
                 except:
                     traceback.print_exc()
+
+
+_switch_hooks = []
+
+
+def _switch_tracer(event, args):
+    if event in ('switch', 'throw'):
+        origin, target = args
+        for f in _switch_hooks:
+            f(origin, target)
+
+
+def add_switch_hook(f):
+    '''
+    Call f(origin, target) on every greenlet switch.
+    Hooks share a single greenlet tracer, installed while any is registered.
+    '''
+    if f in _switch_hooks:
+        return
+
+    _switch_hooks.append(f)
+    greenlet.settrace(_switch_tracer)
+
+
+def remove_switch_hook(f):
+    if f in _switch_hooks:
+        _switch_hooks.remove(f)
+
+    if not _switch_hooks:
+        greenlet.settrace(None)
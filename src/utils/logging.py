@@ -5,6 +5,7 @@ from __future__ import absolute_import
 import datetime
 import logging
 import sys
+import time
 
 # -- third party --
 from raven.transport.gevent import GeventedHTTPTransport
@@ -41,6 +42,8 @@ class ServerLogFormatter(logging.Formatter):
     def __init__(self, with_gr_name=True):
         logging.Formatter.__init__(self)
         self.with_gr_name = with_gr_name
+        self.last_sec = None
+        self.last_timestamp = ''
 
     def format(self, rec):
 
@@ -56,14 +59,9 @@ class ServerLogFormatter(logging.Formatter):
             return self._format(rec)
 
     def _format(self, rec):
-        from game.autoenv import Game
-        import time
-        try:
-            g = Game.getgame()
-        except:
-            g = gevent.getcurrent()
-
         if self.with_gr_name:
+            g = gevent.getcurrent()
+            g = getattr(g, 'game', None) or g
             gr_name = ' ' + (getattr(g, 'gr_name', None) or repr(g))
         else:
             gr_name = ''
@@ -75,11 +73,20 @@ class ServerLogFormatter(logging.Formatter):
 
         return u'[%s %s%s] %s' % (
             rec.levelname[0],
-            time.strftime('%y%m%d %H:%M:%S'),
+            self.timestamp(rec.created),
             gr_name.decode('utf-8'),
             msg,
         )
 
+    def timestamp(self, t):
+        # records come in bursts, strftime once a second
+        sec = int(t)
+        if sec != self.last_sec:
+            self.last_sec = sec
+            self.last_timestamp = time.strftime('%y%m%d %H:%M:%S', time.localtime(sec))
+
+        return self.last_timestamp
+
 
 def init(level, sentry_dsn, release, colored=False):
     patch_gevent_hub_print_exception()
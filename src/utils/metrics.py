@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from bisect import bisect_left
+import json
+import logging
+import os
+import time
+
+# -- third party --
+import gevent
+
+# -- own --
+
+# -- code --
+log = logging.getLogger('metrics')
+
+LATENCY_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]  # ms
+DEPTH_BOUNDS   = [1, 2, 3, 4, 6, 8, 12, 16, 24, 32]
+
+
+class Histogram(object):
+    '''
+    Fixed bucket histogram, buckets[i] counts values <= bounds[i],
+    the last one everything bigger.
+    '''
+    __slots__ = ('bounds', 'count', 'total', 'max', 'buckets')
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds  = bounds
+        self.count   = 0
+        self.total   = 0.0
+        self.max     = 0
+        self.buckets = [0] * (len(bounds) + 1)
+
+    def add(self, v):
+        self.count += 1
+        self.total += v
+        if v > self.max:
+            self.max = v
+
+        self.buckets[bisect_left(self.bounds, v)] += 1
+
+    def percentile(self, p):
+        '''
+        Upper bound of the bucket the p-th percentile falls in.
+        '''
+        n = self.count * p / 100.0
+        acc = 0
+        for i, c in enumerate(self.buckets):
+            acc += c
+            if acc >= n and c:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+
+        return 0
+
+    def dump(self):
+        return {
+            'count':   self.count,
+            'avg':     self.total / self.count if self.count else 0,
+            'max':     self.max,
+            'p50':     self.percentile(50),
+            'p99':     self.percentile(99),
+            'buckets': list(self.buckets),
+        }
+
+
+class Metrics(object):
+    '''
+    Named groups of histograms, e.g. metrics.observe('event', 'action_apply', ms).
+    Off unless enabled, so shared game code only pays a flag check,
+    and hot paths sample one in `sample_every` calls with sample().
+    '''
+
+    def __init__(self):
+        self.enabled      = False
+        self.sample_every = 8
+        self.groups       = {}  # group -> {key: Histogram}
+        self.bounds       = {}  # group -> bucket bounds
+        self.sources      = {}  # name -> callable returning extra data for dump()
+        self.tick         = 0
+
+    def enable(self, sample_every=8):
+        self.enabled = True
+        self.sample_every = sample_every
+
+    def sample(self):
+        self.tick += 1
+        if self.tick >= self.sample_every:
+            self.tick = 0
+            return True
+
+        return False
+
+    def set_bounds(self, group, bounds):
+        self.bounds[group] = bounds
+
+    def histogram(self, group, key):
+        g = self.groups.get(group)
+        if g is None:
+            g = self.groups[group] = {}
+
+        h = g.get(key)
+        if h is None:
+            h = g[key] = Histogram(self.bounds.get(group, LATENCY_BOUNDS))
+
+        return h
+
+    def observe(self, group, key, v):
+        self.histogram(group, key).add(v)
+
+    def add_source(self, name, f):
+        self.sources[name] = f
+
+    def reset(self):
+        self.groups = {}
+
+    def dump(self):
+        rst = {
+            'time':         time.time(),
+            'sample_every': self.sample_every,
+            'metrics': {
+                group: {k: h.dump() for k, h in g.iteritems()}
+                for group, g in self.groups.iteritems()
+            },
+        }
+
+        for name, f in self.sources.items():
+            try:
+                rst[name] = f()
+            except Exception:
+                log.exception('Metrics source %s failed', name)
+
+        return rst
+
+    def dump_to(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.dump(), f, default=repr)
+
+        os.rename(tmp, path)
+
+    def start_dumper(self, path, interval=60):
+        @gevent.spawn
+        def dumper():
+            while True:
+                gevent.sleep(interval)
+                try:
+                    self.dump_to(path)
+                except Exception:
+                    log.exception('Error dumping metrics')
+
+        dumper.gr_name = 'MetricsDumper'
+        return dumper
+
+    def wsgi_app(self, environ, start_response):
+        '''
+        Serves dump() as json, e.g. gevent.pywsgi.WSGIServer(addr, metrics.wsgi_app).
+        '''
+        data = json.dumps(self.dump(), default=repr)
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [data]
+
+
+metrics = Metrics()
+metrics.set_bounds('action_depth', DEPTH_BOUNDS)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from collections import defaultdict
+import logging
+import os
+import sys
+
+# -- third party --
+from gevent import getcurrent
+from gevent.hub import get_hub
+from gevent.monkey import get_original
+
+# -- own --
+from utils.gevent_ext import _switch_tracer, add_switch_hook, remove_switch_hook
+
+# -- code --
+log = logging.getLogger('profiler')
+
+allocate_lock, get_ident, start_new_thread = get_original('thread', ['allocate_lock', 'get_ident', 'start_new_thread'])
+real_sleep = get_original('time', 'sleep')
+
+
+def greenlet_label(gr):
+    '''
+    Root frames a sample is filed under, e.g. ['THBattleIdentity', 'game 123'].
+    Greenlets name themselves with a `profile_label()` method,
+    input waiters and such are filed under the game they belong to.
+    '''
+    if gr is None:
+        return ['unknown']
+
+    if gr is get_hub():
+        return ['hub']
+
+    f = getattr(gr, 'profile_label', None) or \
+        getattr(getattr(gr, 'game', None), 'profile_label', None)
+
+    if f:
+        return f()
+
+    name = getattr(gr, 'gr_name', None)
+    if name:
+        return [name.split(':', 1)[0]]
+
+    return [gr.__class__.__name__]
+
+
+class SamplingProfiler(object):
+    '''
+    Statistical profiler for the gevent server.
+
+    A real OS thread wakes up every `interval` seconds and records what the
+    main thread is running, filed under the label of the current greenlet
+    (tracked with a switch hook). Samples taken while a switch is in flight
+    are dropped rather than filed under the wrong greenlet. Output is folded stacks, one
+    `frame;frame;frame count` line per distinct stack, for flamegraph.pl.
+
+    Meant to be driven from the backdoor:
+
+        >>> from utils.profiler import profiler
+        >>> profiler.start()
+        >>> profiler.stop('/tmp/thb.folded')
+    '''
+
+    def __init__(self):
+        self.running   = False
+        self.interval  = 0.005
+        self.samples   = defaultdict(int)
+        self.dropped   = 0
+        self.current   = None  # (greenlet,), a fresh tuple per switch
+        self.thread_id = None
+        self.finished  = None
+
+    def start(self, interval=0.005):
+        if self.running:
+            return
+
+        self.interval  = interval
+        self.running   = True
+        self.current   = (getcurrent(),)
+        self.thread_id = get_ident()
+        self.finished  = allocate_lock()
+        self.finished.acquire()
+        add_switch_hook(self._switched)
+        start_new_thread(self._sampler, ())
+        log.info('Profiler started, interval %sms', interval * 1000)
+
+    def stop(self, path=None):
+        if not self.running:
+            return
+
+        self.running = False
+        remove_switch_hook(self._switched)
+        self.finished.acquire()  # sampler thread gone, at most one interval
+        log.info('Profiler stopped, %d samples', sum(self.samples.itervalues()))
+        path and self.dump(path)
+
+    def reset(self):
+        self.samples = defaultdict(int)
+        self.dropped = 0
+
+    def _switched(self, origin, target):
+        self.current = (target,)
+
+    def _frame(self):
+        return sys._current_frames().get(self.thread_id)
+
+    def _sampler(self):
+        try:
+            while True:
+                real_sleep(self.interval)
+                if not self.running:
+                    break
+
+                try:
+                    self.sample()
+                except Exception:
+                    log.exception('Error sampling')
+        finally:
+            self.finished.release()
+
+    def sample(self):
+        # label and frame must come from the same greenlet: a switch between
+        # the two reads replaces self.current, and the tracer runs as the root
+        # frame of the target with self.current possibly not yet updated
+        current = self.current
+        frame = self._frame()
+        if frame is None:
+            return
+
+        if current is not self.current:
+            self.dropped += 1
+            return
+
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code is _switch_tracer.func_code:
+                self.dropped += 1
+                return
+
+            stack.append('%s (%s:%d)' % (
+                code.co_name, os.path.basename(code.co_filename), code.co_firstlineno,
+            ))
+            frame = frame.f_back
+
+        stack.extend(reversed(greenlet_label(current[0])))
+        stack.reverse()
+        self.samples[';'.join(stack)] += 1
+
+    def folded(self):
+        return ''.join(
+            '%s %d\n' % (k, v) for k, v in sorted(self.samples.iteritems())
+        )
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.folded())
+
+
+profiler = SamplingProfiler()
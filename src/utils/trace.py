@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from collections import deque
+import logging
+import time
+
+# -- third party --
+# -- own --
+
+# -- code --
+
+
+class TraceBuffer(object):
+    '''
+    Ring buffer of recent (time, fmt, args) entries, formatted only in
+    lines()/dump(), so tracing on a hot path costs a tuple and an append.
+    Entries are echoed to the debug log if it was enabled at creation.
+    '''
+    __slots__ = ('entries', 'logger', 'echo')
+
+    def __init__(self, logger, maxlen=256):
+        self.entries = deque(maxlen=maxlen)
+        self.logger  = logger
+        self.echo    = logger.isEnabledFor(logging.DEBUG)
+
+    def __call__(self, fmt, *args):
+        self.entries.append((time.time(), fmt, args))
+        self.echo and self.logger.debug(fmt, *args)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def lines(self):
+        l = []
+        for t, fmt, args in self.entries:
+            try:
+                msg = fmt % args if args else fmt
+            except Exception:
+                msg = '%s %r' % (fmt, args)
+
+            l.append('%s.%03d %s' % (
+                time.strftime('%H:%M:%S', time.localtime(t)), int(t * 1000) % 1000, msg,
+            ))
+
+        return l
+
+    def dump(self, title='Trace', level=logging.INFO):
+        self.logger.log(level, '%s, last %d entries:\n%s', title, len(self.entries), '\n'.join(self.lines()))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from collections import deque
+import logging
+import sys
+import time
+import traceback
+
+# -- third party --
+from gevent.hub import get_hub
+from gevent.monkey import get_original
+from greenlet import greenlet
+import gevent
+
+# -- own --
+from utils.metrics import metrics
+from utils.profiler import greenlet_label
+
+# -- code --
+log = logging.getLogger('watchdog')
+
+allocate_lock, get_ident, start_new_thread = get_original('thread', ['allocate_lock', 'get_ident', 'start_new_thread'])
+real_sleep = get_original('time', 'sleep')
+
+
+class BlockingWatchdog(object):
+    '''
+    Finds greenlets running too long without yielding to the hub.
+
+    A hub timer stamps every loop iteration it gets to run in, a real OS
+    thread checks the stamp and snapshots the offender (label, game action
+    stack, current handler and python stack) once it exceeds `threshold`.
+    The offender is found from the blocked stack, nothing runs on greenlet
+    switches. Snapshots are logged from a greenlet, which also records hub
+    loop lag.
+    '''
+
+    def __init__(self):
+        self.running   = False
+        self.threshold = 0.2
+        self.interval  = 1
+        self.thread_id = None
+        self.ticker    = None
+        self.ticked_at = 0
+        self.ticks     = 0
+        self.reported  = -1  # self.ticks value already reported
+        self.reports   = deque(maxlen=64)
+        self.reporter  = None
+        self.finished  = None
+
+    def start(self, threshold=0.2, interval=1):
+        if self.running:
+            return
+
+        self.threshold = threshold
+        self.interval  = interval
+        self.running   = True
+        self.thread_id = get_ident()
+        self.ticked_at = time.time()
+        self.finished  = allocate_lock()
+        self.finished.acquire()
+        self.ticker = get_hub().loop.timer(threshold / 4, threshold / 4, ref=False)
+        self.ticker.start(self._tick)
+        start_new_thread(self._monitor, ())
+        self.reporter = gevent.spawn(self._report)
+        self.reporter.gr_name = 'BlockingWatchdog'
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        self.ticker.stop()
+        self.ticker = None
+        self.finished.acquire()  # monitor thread gone
+        self.reporter.kill()
+        self.reporter = None
+        self.flush()
+
+    def _tick(self):
+        self.ticked_at = time.time()
+        self.ticks    += 1
+
+    def _monitor(self):
+        try:
+            while self.running:
+                real_sleep(self.threshold / 2)
+                ticks = self.ticks
+                elapsed = time.time() - self.ticked_at
+                if elapsed < self.threshold or ticks == self.reported:
+                    continue
+
+                self.reported = ticks
+                try:
+                    self.reports.append(self.snapshot(elapsed))
+                except Exception:
+                    pass  # no logging from this thread
+        finally:
+            self.finished.release()
+
+    @staticmethod
+    def running_greenlet(frame):
+        '''
+        Greenlet a stack belongs to, `self` of its root frame (Greenlet.run, Hub.run).
+        '''
+        while frame.f_back is not None:
+            frame = frame.f_back
+
+        gr = frame.f_locals.get('self')
+        return gr if isinstance(gr, greenlet) else None
+
+    def snapshot(self, elapsed):
+        frame = sys._current_frames().get(self.thread_id)
+        gr = frame and self.running_greenlet(frame)
+        g = gr if hasattr(gr, 'action_stack') else getattr(gr, 'game', None)
+        actions = [a.__class__.__name__ for a in getattr(g, 'action_stack', ())]
+        handlers = getattr(g, 'hybrid_stack', None)
+
+        return {
+            'label':   ':'.join(greenlet_label(gr)),
+            'elapsed': elapsed,
+            'actions': actions,
+            'handler': handlers[-1].__class__.__name__ if handlers else None,
+            'stack':   ''.join(traceback.format_stack(frame)) if frame else '',
+        }
+
+    def _report(self):
+        while True:
+            begin = time.time()
+            gevent.sleep(self.interval)
+            lag = time.time() - begin - self.interval
+            metrics.enabled and metrics.observe('hub', 'loop_lag', lag * 1000)
+            self.flush()
+
+    def flush(self):
+        while self.reports:
+            r = self.reports.popleft()
+            metrics.enabled and metrics.observe('hub', 'blocked', r['elapsed'] * 1000)
+            log.warning(
+                'Greenlet %s blocked the hub for %.0fms+, actions: %s, handler: %s\n%s',
+                r['label'], r['elapsed'] * 1000,
+                ' > '.join(r['actions']) or '-', r['handler'], r['stack'],
+            )
+
+
+watchdog = BlockingWatchdog()
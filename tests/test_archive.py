@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+import os
+import shutil
+import tempfile
+
+# -- third party --
+from nose.tools import eq_
+import gevent
+
+# -- own --
+from endpoint import Endpoint
+from game.archive import ArchiveWriter, load_archive
+
+
+# -- code --
+class TestArchive(object):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test-1.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeArchive(self, close=True):
+        w = ArchiveWriter(self.path, {
+            'names': [u'文文', u'Proton'], 'version': 'dev', 'gameid': 1, 'start': 100,
+            'mode': 'THBattleKOF', 'params': {}, 'items': {}, 'seed': 2 ** 62,
+        })
+        w.FLUSH_SIZE = 1
+        for i in xrange(10):
+            w.record_gamedata(i % 2, Endpoint.encode(['gamedata', ['Sync:%d' % i, [i, u'卡']]]))
+            w.record_user_gamedata(i % 2, 'I:ChooseOption:%d' % i, Endpoint.encode(True))
+
+        if close:
+            w.close({'end': 200})
+        else:
+            w.flush()
+            w.chunks.put(None)
+
+        w.join()
+
+    def testRoundTrip(self):
+        self.writeArchive()
+        arc = load_archive(self.path)
+        eq_(arc.names, [u'文文', u'Proton'])
+        eq_(arc.seed, 2 ** 62)
+        eq_(arc.end, 200)
+        eq_(arc.gdhistory[1][0], ['Sync:1', [1, u'卡']])
+        eq_(len(arc.gdhistory[0]), 5)
+        eq_(arc.usergdhistory[3], [1, 'I:ChooseOption:3', True])
+
+    def testTruncated(self):
+        self.writeArchive(close=False)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        with open(self.path, 'wb') as f:
+            f.write(data[:-10])
+
+        arc = load_archive(self.path)
+        eq_(arc.end, None)
+        eq_(arc.gdhistory[0][0], ['Sync:0', [0, u'卡']])
+        eq_(len(arc.usergdhistory), 9)
+
+    def testPeriodicFlush(self):
+        w = ArchiveWriter(self.path, {'names': [u'文文'], 'gameid': 1})
+        w.FLUSH_INTERVAL = 0.02
+        w.record_gamedata(0, Endpoint.encode(['gamedata', ['Sync:1', 1]]))
+        gevent.sleep(0.1)  # no more records, no close
+
+        eq_(load_archive(self.path).gdhistory, [[['Sync:1', 1]]])
+        w.close({'end': 200})
+        w.join()
+
+    def testKilledGame(self):
+        from options import options
+        from server.core.game_manager import GameManager
+
+        class Stalled(gevent.Greenlet):
+            n_persons  = 0
+            params_def = {}
+
+            def _run(self):
+                gevent.sleep(100)
+
+        options.archive_path = self.dir
+        try:
+            mgr = GameManager(1, Stalled, 'test', False)
+            mgr.start_time = 100
+            mgr.start_archive()
+        finally:
+            del options.archive_path
+
+        g = mgr.game
+        g.start()
+        mgr.archiver.record_user_gamedata(0, 'I:ChooseOption:1', Endpoint.encode(True))
+        gevent.sleep(0)
+        g.kill()
+        mgr.archiver.join(1)
+
+        assert mgr.archiver.writer.dead
+        arc = load_archive(mgr.archiver.path)
+        assert arc.end
+        eq_(arc.usergdhistory, [[0, 'I:ChooseOption:1', True]])
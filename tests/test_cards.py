@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+import random
+
+# -- third party --
+from nose.tools import assert_raises, eq_
+
+# -- own --
+from thb.cards import Card, CardList
+
+
+# -- code --
+class TestCardList(object):
+    def make(self, n):
+        cl = CardList(None, 'deckcard')
+        cls = Card.card_classes['AttackCard']
+        cards = [cls(Card.SPADE, i, cl) for i in xrange(n)]
+        cl.extend(cards)
+        return cl, cards
+
+    def testMembership(self):
+        cl, cards = self.make(10)
+        a, b, c = cards[0], cards[5], cards[9]
+        assert all(i in cl for i in cards)
+
+        b.detach()
+        assert b.detached and b not in cl
+        assert not a.detached
+        eq_(len(cl), 9)
+
+        b.attach()
+        assert cl[-1] is b
+        a.move_to(None)
+        c.detach()
+        assert a not in cl and c not in cl
+        assert_raises(ValueError, cl.remove, a)
+
+        cl.appendleft(a)
+        cl.rotate(3)
+        random.shuffle(cl)
+        eq_(sorted(id(i) for i in cl), sorted(id(i) for i in cards if i is not c))
+        eq_(set(cl.members), set(id(i) for i in cl))
+
+        cl.clear()
+        assert b not in cl
+        eq_(cl.members, {})
+
+
+class TestMigrateCardsTransaction(object):
+    def testCardlistTypes(self):
+        from thb.actions import MigrateCardsTransaction
+
+        a, b, c = CardList(None, 'cards'), CardList(None, 'droppedcard'), CardList(None, 'equips')
+        trans = MigrateCardsTransaction(None)
+        trans.move([1], a, b, False, False)
+        trans.move([2, 3], a, b, False, False)
+        eq_(trans.cardlist_types, {'cards', 'droppedcard'})
+
+        trans.move([4], c, b, False, True)
+        eq_([m[0] for m in trans.movements], [[1], [2, 3], [4]])
+        eq_(trans.cardlist_types, {'cards', 'droppedcard', 'equips'})
+
+    def testPostMigrationFanOut(self):
+        from game import autoenv
+        from thb.actions import MigrateCardsTransaction, PostCardMigrationHandler
+        from thb.characters.alice import DollBlastMigrationHandler
+        from thb.characters.shinmyoumaru import VengeOfTsukumogamiHandler
+        from utils import BatchList, ObjectDict
+
+        autoenv.init('Server')
+        players = BatchList([ObjectDict(name=i) for i in xrange(5)])
+        calls = []
+        g = ObjectDict(
+            players=players,
+            players_from=lambda p: players,
+            handle_single_event=lambda eh, p, trans: calls.append((eh.__class__.__name__, p.name)),
+        )
+        autoenv.Game.getgame = staticmethod(lambda: g)
+
+        try:
+            group = PostCardMigrationHandler()
+            group.set_handlers([DollBlastMigrationHandler(), VengeOfTsukumogamiHandler()])
+            act = ObjectDict(target=players[0], source=None)
+            cards, equips, dropped = [CardList(None, t) for t in ('cards', 'equips', 'droppedcard')]
+
+            # hand cards dropped, nobody interested, no per player calls
+            trans = MigrateCardsTransaction(act)
+            trans.move([1], cards, dropped, False, False)
+            group.handle('post_card_migration', trans)
+            eq_(calls, [])
+
+            trans = MigrateCardsTransaction(act)
+            trans.move([1], cards, dropped, False, False)
+            trans.move([2], equips, dropped, False, False)
+            group.handle('post_card_migration', trans)
+            eq_(len(calls), 2 * len(players))
+        finally:
+            del autoenv.Game.getgame
+
+
+class TestDeck(object):
+    def setUp(self):
+        from game import autoenv
+        from game.base import Game
+        autoenv.init('Server')
+
+        class SyncGame(Game):
+            def __init__(self):
+                Game.__init__(self)
+                self.synctag = 0
+                self.random  = random.Random(1234)
+
+            def get_synctag(self):
+                self.synctag += 1
+                return self.synctag
+
+        self.SyncGame = SyncGame
+        self.g = g = SyncGame()
+        autoenv.Game.getgame = staticmethod(lambda: g)
+
+    def tearDown(self):
+        from game import autoenv
+        del autoenv.Game.getgame
+
+    def testReshuffle(self):
+        from thb.cards import Deck
+
+        deck = Deck([(Card.card_classes['AttackCard'], Card.SPADE, i) for i in xrange(1, 31)])
+        eq_(self.g.synctag, 30)
+        eq_(sorted(deck.cards_record), range(1, 31))
+
+        for c in list(deck.cards)[:25]:
+            c.move_to(deck.droppedcards)
+
+        old = list(deck.droppedcards)[:15]
+        kept = list(deck.cards) + list(deck.droppedcards)[15:]
+
+        # 5 left in the deck, 15 of the 25 dropped are reshuffled in
+        eq_(len(deck.getcards(10)), 10)
+        eq_(len(deck.cards), 20)
+        eq_(len(deck.droppedcards), 10)
+
+        ref = self.SyncGame()
+        ref.synctag = 30
+        fresh = list(deck.cards)[5:]
+        eq_([c.sync_id for c in fresh], [ref.get_synctag() for i in xrange(15)])
+        eq_(self.g.synctag, ref.synctag)
+        assert not any(c in old for c in fresh)
+
+        reachable = list(deck.cards) + list(deck.droppedcards)
+        eq_(set(map(id, reachable)), set(map(id, kept + fresh)))
+        eq_(deck.cards_record, {c.sync_id: c for c in reachable})
+        eq_(deck.lookupcards([c.sync_id for c in old]), [])
+
+
+class TestDistanceMap(object):
+    def testOrder(self):
+        from thb.actions import DistanceMap
+
+        order = ('c', 'a', 'd', 'b')
+        d = DistanceMap(order, zip(order, [0, 1, 2, 1]))
+        d2 = d.copy()
+        for k in d2:
+            d2[k] -= 1
+
+        eq_(d.items(), [('c', 0), ('a', 1), ('d', 2), ('b', 1)])
+        eq_(d2.values(), [-1, 0, 1, 0])
+        d2.pop('a')
+        del d2['d']
+        d2['e'] = 5
+        eq_(list(d2), ['c', 'b', 'e'])
+        eq_(d2.pop('x', ''), '')
+        eq_(list(d), list(order))
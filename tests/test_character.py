@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+# -- third party --
+from nose.tools import eq_
+
+# -- own --
+from thb.characters.baseclasses import Character
+
+
+# -- code --
+class FakePlayer(object):
+    def __init__(self):
+        self.account = 'meh'
+
+
+class Skill(object):
+    pass
+
+
+class Foo(Skill):
+    pass
+
+
+class FooChild(Foo):
+    pass
+
+
+class Bar(Skill):
+    pass
+
+
+class TestSkills(object):
+    def make(self, *skills):
+        ch = Character(FakePlayer())
+        ch.skills = list(skills)
+        ch.dead = False
+        return ch
+
+    def testLookup(self):
+        ch = self.make(FooChild, Bar)
+        eq_(ch.get_skills(Skill), [FooChild, Bar])
+        eq_(ch.get_skills(Foo), [FooChild])
+        assert ch.has_skill(FooChild)
+        assert ch.has_skill(Foo)
+
+        ch.skills.remove(FooChild)
+        assert not ch.has_skill(Foo)
+        ch.skills.append(Foo)
+        eq_(list(ch.has_skill(Skill)), [Bar, Foo])
+        ch.skills[:] = []
+        assert not ch.has_skill(Bar)
+
+    def testDisable(self):
+        ch = self.make(FooChild, Bar)
+        ch.disable_skill(Foo, 'roukanken')
+        assert not ch.has_skill(FooChild)
+        assert ch.has_skill(Bar)
+        ch.reenable_skill('roukanken')
+        assert ch.has_skill(FooChild)
+
+        ch.dead = True
+        assert not ch.has_skill(Bar)
+        eq_(ch.account, 'meh')
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+# -- third party --
+from nose.tools import eq_
+
+# -- own --
+from server.command import CommandTable, method_table
+
+
+# -- code --
+class Foo(object):
+    def command_add(self, a, b):
+        return a + b
+
+    def command_fail(self):
+        raise ValueError
+
+
+class TestCommandTable(object):
+    def testContract(self):
+        t = CommandTable('test')
+        t.add('join', lambda u, gid: gid, ['hang'], [int])
+        cmd = t.get('join')
+        eq_(t.get('nope'), None)
+        eq_(t.get(['unhashable']), None)
+        eq_(cmd.check('hang', [1]), None)
+        eq_(cmd.check('ingame', [1]), 'state')
+        eq_(cmd.check('hang', ['1']), 'args')
+        eq_(cmd.check('hang', [1, 2]), 'args')
+        eq_(cmd.check('hang', 1), 'args')
+        eq_(cmd(None, 3), 3)
+        eq_((cmd.calls, cmd.rejected), (1, 4))
+
+    def testMethodTable(self):
+        t = method_table('foo', Foo)
+        eq_(sorted(t.commands), ['add', 'fail'])
+        add = t.get('add')
+        eq_(add.nargs, 2)
+        eq_(add.check(None, [1]), 'args')
+        eq_(add(Foo(), 1, 2), 3)
+
+        fail = t.get('fail')
+        try:
+            fail(Foo())
+        except ValueError:
+            pass
+
+        eq_([(s['name'], s['calls'], s['failed']) for s in sorted(t.stats(), key=lambda s: s['name'])], [('add', 1, 0), ('fail', 1, 1)])
+        eq_(t.get('add').latency.count, 1)
+
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+# -- third party --
+from gevent import socket
+from nose.tools import assert_raises, eq_
+import gevent
+import msgpack
+
+# -- own --
+from endpoint import Endpoint, EndpointDied
+
+
+# -- code --
+def make_pair():
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    return Endpoint(a, ('a', 0)), Endpoint(b, ('b', 0))
+
+
+class TestBroadcast(object):
+    def testBroadcast(self):
+        fast = [make_pair() for _ in xrange(3)]
+        s = Endpoint.encode(['gamedata', [1, 'meh']])
+        Endpoint.broadcast([w for w, _ in fast], s)
+
+        for _, r in fast:
+            eq_(r.read(), ['gamedata', [1, 'meh']])
+
+    def testSlowPeerDropped(self):
+        w, r = make_pair()
+        w.SEND_QUEUE_LIMIT = 1024 * 1024
+        s = Endpoint.encode(['gamedata', 'x' * 4096])
+
+        ok = True
+        for _ in xrange(1000):  # never read from r
+            ok = w.queue_write(s) and ok
+
+        eq_(ok, False)
+        gevent.sleep(0.01)
+        eq_(w.link_state, 'disconnected')
+
+    def testOrdering(self):
+        w, r = make_pair()
+        w.queue_write(Endpoint.encode(1))
+        w.raw_write(Endpoint.encode(2))
+        w.write(3)
+        eq_([r.read() for _ in xrange(3)], [1, 2, 3])
+
+
+class TestSendQueue(object):
+    def testCoalesce(self):
+        w, r = make_pair()
+        w.BULK_COMPRESS_BYTES = 64
+        pkts = [['gamedata', [i, 'x' * 20]] for i in xrange(20)]
+        frames = [Endpoint.encode(p) for p in pkts]
+        s = w.coalesce(frames, sum(len(f) for f in frames))
+        eq_(msgpack.unpackb(s)[0], Endpoint.FMT_BULK_COMPRESSED)
+        eq_(w.coalesce(frames[:1], 64), frames[0])
+
+        for p in pkts:
+            w.write(p)
+
+        eq_([r.read() for _ in xrange(20)], pkts)
+
+        w.write(['bulk', None], Endpoint.FMT_BULK_COMPRESSED)
+        w.write('end')
+        eq_([r.read() for _ in xrange(3)], ['bulk', None, 'end'])
+
+    def testFlushOnClose(self):
+        w, r = make_pair()
+        w.write(['auth_result', 'not_available'])
+        w.close()
+        eq_(r.read(), ['auth_result', 'not_available'])
+
+    def testCloseDoesNotBlock(self):
+        w, r = make_pair()
+        w.CLOSE_FLUSH_TIMEOUT = 0.1
+        s = Endpoint.encode(['gamedata', 'x' * 65536])
+        for _ in xrange(20):  # more than the socket buffers, never read from r
+            w.queue_write(s)
+
+        gevent.sleep(0.01)
+        w.close()
+        eq_(w.link_state, 'connected')  # still flushing, caller not blocked
+        gevent.sleep(0.2)
+        eq_(w.link_state, 'disconnected')
+
+
+class TestCompact(object):
+    def testRoundTrip(self):
+        from game.base import Gamedata
+        from thb.cards import Card
+        import thb.inputlets  # noqa
+
+        c = Card.card_classes['AttackCard'](Card.SPADE, 3)
+        c.sync_id, c.track_id = 123, 45
+
+        for tag, data in [
+            ('Sync:1234', [c, c]),
+            ('RI&:ChooseOption:2345', [1, 2]),
+            ('I:NoSuchThing:1', None),
+            ('Whatever', 'meh'),
+        ]:
+            packed = Gamedata.encode(tag, data)
+            compact = Gamedata.encode(tag, data, Endpoint.FMT_COMPACT)
+            eq_(Endpoint.decode(compact), Endpoint.decode(packed))
+            assert len(compact) <= len(packed)
+
+    def testInline(self):
+        from game.base import Gamedata
+        from thb.cards import Card
+
+        c = Card.card_classes['AttackCard'](Card.SPADE, 3)
+        c.sync_id, c.track_id = 123, 45
+        frame = Gamedata.encode('Sync:1234', [c, {'card': c}], Endpoint.FMT_COMPACT)
+
+        # objects are inline field arrays headed by an empty ext, nothing packed twice
+        exts = []
+        msgpack.unpackb(frame, ext_hook=lambda code, data: exts.append((code, data)))
+        eq_(exts, [(3, ''), (1, ''), (1, '')])
+        eq_(Endpoint.decode(frame), ['gamedata', ['Sync:1234', [c.__data__(), {'card': c.__data__()}]]])
+
+        # ext packed objects, as in older compact frames, still decode
+        old = msgpack.packb([Endpoint.FMT_COMPACT, msgpack.ExtType(1, msgpack.packb(c.__compact__()[1:]))])
+        eq_(Endpoint.decode(old), c.__data__())
+
+    def testTranscode(self):
+        from game.base import Gamedata
+        from server.core.endpoint import Client
+
+        w, r = make_pair()
+        w.__class__ = Client
+        w.raw_write(Gamedata.encode('Sync:1', [1], Endpoint.FMT_COMPACT))
+        eq_(r.sock.recv(2), Endpoint._PACKED_PREFIXES[0])
+
+    def testSyncBatch(self):
+        from game.base import Gamedata
+        from server.core.endpoint import Client
+
+        batch = [[3, 'c'], [5, 'e']]
+        for fmt in (Endpoint.FMT_PACKED, Endpoint.FMT_COMPACT):
+            eq_(Gamedata.is_sync_batch(Gamedata.encode('Sync:3:5', batch, fmt)), True)
+            eq_(Gamedata.is_sync_batch(Gamedata.encode(u'Sync:3:5', batch, fmt)), True)
+            eq_(Gamedata.is_sync_batch(Gamedata.encode('Sync:3', 'c', fmt)), False)
+            eq_(Gamedata.is_sync_batch(Gamedata.encode('RI:ChooseOption:3', 'c', fmt)), False)
+
+        eq_(Gamedata.is_sync_batch(Endpoint.encode(['wire_format', [1, 'x']])), False)
+
+        # one 'Sync:<synctag>' per reveal unless the client asked for batches
+        frame = Gamedata.encode('Sync:3:5', batch, Endpoint.FMT_COMPACT)
+        w, r = make_pair()
+        w.__class__ = Client
+        w.raw_write(frame)
+        w.sync_batch = True
+        w.raw_write(frame)
+        eq_([r.read() for _ in xrange(3)], [
+            ['gamedata', ['Sync:3', 'c']],
+            ['gamedata', ['Sync:5', 'e']],
+            ['gamedata', ['Sync:3:5', batch]],
+        ])
+
+    def testSnapshot(self):
+        from thb.cards import Card
+
+        c = Card.card_classes['AttackCard'](Card.SPADE, 3)
+        c.sync_id, c.track_id = 123, 45
+        expected = c.__data__()
+
+        snap = Endpoint.snapshot([c, {'card': c}])
+        c.sync_id = 456
+        for fmt in (Endpoint.FMT_PACKED, Endpoint.FMT_COMPACT):
+            eq_(Endpoint.decode(Endpoint.encode(snap, fmt)), [expected, {'card': expected}])
+
+
+class TestRecv(object):
+    def testOversizedFrame(self):
+        w, r = make_pair()
+        r.MAX_PACKET_BYTES = 1024
+        r.unpacker = msgpack.Unpacker(max_buffer_size=1024)
+        w.write(['gamedata', 'x' * 100])
+        eq_(r.read(), ['gamedata', 'x' * 100])
+        w.write(['gamedata', 'x' * 4096])
+        assert_raises(EndpointDied, r.read)
+        eq_(r.link_state, 'disconnected')
+
+    def testBulkBomb(self):
+        w, r = make_pair()
+        w.write(['x' * 4096], Endpoint.FMT_BULK_COMPRESSED)
+        w.write('ok')
+
+        limit, Endpoint.MAX_PACKET_BYTES = Endpoint.MAX_PACKET_BYTES, 1024
+        try:
+            eq_(r.read(), 'ok')
+            eq_(w.read(), ['bad_format', None])
+        finally:
+            Endpoint.MAX_PACKET_BYTES = limit
+
+
+class TestIdleSweeper(object):
+    def testSweep(self):
+        from server.core.endpoint import IdleSweeper
+        import time
+
+        now = [1000.0]
+        orig, time.time = time.time, lambda: now[0]
+        try:
+            s = IdleSweeper(timeout=90, granularity=5)
+            a, b = object(), object()
+            s.touch(a)
+            s.touch(b)
+
+            now[0] += 60
+            s.touch(a)
+            eq_(s.near_timeout(30), 0)
+            now[0] += 10
+            eq_(s.near_timeout(30), 1)
+            eq_(s.expired(), [])
+
+            now[0] += 30
+            eq_(s.expired(), [b])
+            eq_(s.expired(), [])
+            s.discard(a)
+            now[0] += 1000
+            eq_(s.expired(), [])
+        finally:
+            time.time = orig
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+from collections import deque
+
+# -- third party --
+from nose.tools import assert_raises, eq_
+
+# -- own --
+from endpoint import EndpointDied
+from game.base import Action, EventHandler, Game, GameError, Gamedata
+
+
+# -- code --
+class Foo(Action):
+    pass
+
+
+class Bar(Action):
+    pass
+
+
+class FooChild(Foo):
+    pass
+
+
+def make_handler(name, interested_actions=None, transform=None):
+    def handle(self, evt_type, act):
+        self.seen.append((evt_type, act.__class__))
+        if transform:
+            act.__class__ = transform
+
+        return act
+
+    return type(name, (EventHandler,), {
+        'interested': ('action_before', 'some_event'),
+        'interested_actions': interested_actions,
+        'handle': handle,
+    })
+
+
+class TestEventDispatch(object):
+    def makeGame(self, *eh_classes):
+        g = Game()
+        ehs = EventHandler.make_list(eh_classes)
+        for eh in ehs:
+            eh.seen = []
+
+        g.set_event_handlers(ehs)
+        return g, {eh.__class__.__name__: eh for eh in ehs}
+
+    def testFilterByActionClass(self):
+        g, ehs = self.makeGame(
+            make_handler('AHandler'),
+            make_handler('BHandler', (Foo,)),
+            make_handler('CHandler', (Bar,)),
+        )
+
+        g.emit_event('action_before', FooChild(None, None))
+        g.emit_event('action_before', Bar(None, None))
+        eq_(ehs['AHandler'].seen, [('action_before', FooChild), ('action_before', Bar)])
+        eq_(ehs['BHandler'].seen, [('action_before', FooChild)])
+        eq_(ehs['CHandler'].seen, [('action_before', Bar)])
+
+    def testNonActionEventsNotFiltered(self):
+        g, ehs = self.makeGame(make_handler('AHandler', (Foo,)))
+        g.emit_event('some_event', Bar(None, None))
+        eq_(ehs['AHandler'].seen, [('some_event', Bar)])
+
+    def testTrace(self):
+        g, ehs = self.makeGame(make_handler('AHandler'))
+        g.trace.entries = deque(maxlen=2)
+        for i in xrange(3):
+            g.emit_event('some_event', Bar(None, None))
+
+        g.emit_event('other_event', 'meh')
+        lines = g.trace.lines()
+        eq_(len(lines), 2)
+        assert lines[0].endswith('emit_event: some_event Bar')
+        assert lines[1].endswith('emit_event: other_event meh')
+
+    def testActionTransformedDuringDispatch(self):
+        g, ehs = self.makeGame(
+            make_handler('AHandler', (Foo,), transform=Bar),
+            make_handler('BHandler', (Foo,)),
+            make_handler('CHandler', (Bar,)),
+        )
+
+        g.emit_event('action_before', Foo(None, None))
+        eq_(ehs['AHandler'].seen, [('action_before', Foo)])
+        eq_(ehs['BHandler'].seen, [])
+        eq_(ehs['CHandler'].seen, [('action_before', Bar)])
+
+
+class TestGamedata(object):
+    def makeGamedata(self, *packets):
+        gd = Gamedata()
+        for p in packets:
+            gd.feed(p)
+
+        return gd
+
+    def testOrdering(self):
+        gd = self.makeGamedata(['Sync:2', 2], ['Sync:1', 1], ['Sync:1', 11])
+        eq_(list(gd.gexpect('Sync:1', False)), ['Sync:1', 1])
+        eq_(list(gd.gexpect('Sync:1', False)), ['Sync:1', 11])
+        eq_(gd.gexpect('Sync:1', False), (None, Gamedata.NODATA))
+        eq_(list(gd.gexpect('Sync:2', False)), ['Sync:2', 2])
+        eq_(len(gd.inbox), 0)
+
+    def testGlob(self):
+        gd = self.makeGamedata(
+            ['Sync:1', 1],
+            ['RI:ChooseOption:5', True],
+            ['RI:ChooseOption:3', False],
+            ['RI&:ChooseOption:4', None],
+        )
+        eq_(list(gd.gexpect('RI:ChooseOption:*', False)), ['RI:ChooseOption:5', True])
+        eq_(gd.gexpect('RI:ChooseOption:5', False), (None, Gamedata.NODATA))
+        eq_(list(gd.gexpect('RI:*', False)), ['RI:ChooseOption:3', False])
+        eq_(list(gd.gexpect('RI&:ChooseOption:*', False)), ['RI&:ChooseOption:4', None])
+        eq_(list(gd.gexpect('Sync:*', False)), ['Sync:1', 1])
+
+    def testGlobMidSegment(self):
+        gd = self.makeGamedata(
+            ['Sync', 0],
+            ['RI:ChooseOption:5', True],
+            ['RI:ChooseGirl:3', 'x'],
+            ['RI:Action:1', None],
+            ['Ready', 1],
+        )
+        eq_(list(gd.gexpect('RI:Choose*', False)), ['RI:ChooseOption:5', True])
+        eq_(list(gd.gexpect('RI:Choose*', False)), ['RI:ChooseGirl:3', 'x'])
+        eq_(gd.gexpect('RI:Choose*', False), (None, Gamedata.NODATA))
+        eq_(list(gd.gexpect('R*', False)), ['RI:Action:1', None])
+        eq_(list(gd.gexpect('R*', False)), ['Ready', 1])
+        eq_(list(gd.gexpect('S*', False)), ['Sync', 0])
+        eq_(len(gd.inbox), 0)
+
+    def testSyncBatch(self):
+        from client.core.game_client import TheChosenOne
+
+        gd = self.makeGamedata(
+            ['RI:ChooseOption:2', True],
+            ['Sync:3:5', [[3, 'c'], [5, 'e']]],
+            ['Sync:7', 'g'],
+        )
+        me = TheChosenOne(gd)
+        eq_([me.expect_sync(i) for i in (3, 5, 7)], ['c', 'e', 'g'])
+        eq_(me.synced, {})
+        eq_(list(gd.gexpect('RI:ChooseOption:2', False)), ['RI:ChooseOption:2', True])
+
+    def testEndpointDied(self):
+        gd = self.makeGamedata(['Sync:1', 1])
+        gd.gbreak()
+        gd.feed(['Sync:2', 2])
+        eq_(list(gd.gexpect('Sync:1', False)), ['Sync:1', 1])
+        assert_raises(EndpointDied, gd.gexpect, 'Sync:2', False)
+        assert_raises(EndpointDied, gd.gexpect, 'Sync:3', False)
+
+
+class TestSyncTags(object):
+    def makeGame(self, killed=False):
+        class SyncGame(Game):
+            synctag = 0
+
+            def get_synctag(self):
+                if killed:
+                    return None
+
+                self.synctag += 1
+                return self.synctag
+
+        return SyncGame()
+
+    def testBlock(self):
+        g, ref = self.makeGame(), self.makeGame()
+        eq_(g.get_synctags(0), None)
+        eq_(g.get_synctags(3), 1)
+        eq_(g.get_synctag(), 4)
+        eq_([ref.get_synctag() for i in xrange(4)], [1, 2, 3, 4])
+
+    def testKilled(self):
+        g = self.makeGame(killed=True)
+        assert_raises(GameError, g.get_synctags, 3)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+# -- third party --
+from nose.tools import eq_
+import gevent
+import msgpack
+
+# -- own --
+from endpoint import Endpoint
+
+
+# -- code --
+class FakeGame(object):
+    def __init__(self, gid):
+        self.gameid = gid
+        self.started = False
+        self.params = {'x': 1}
+
+    def __data__(self):
+        return {'id': self.gameid, 'started': self.started, 'params': self.params}
+
+
+class FakeAccount(object):
+    def __init__(self, uid):
+        self.userid = uid
+        self.other = {'credits': 0}
+
+    def __data__(self):
+        return ['forum', self.userid, self.other]
+
+
+class FakeUser(object):
+    def __init__(self, uid, state='hang'):
+        self.uid = uid
+        self.account = FakeAccount(uid)
+        self.state = state
+        self.lobby_version = None
+        self.sent = []
+
+    def __data__(self):
+        return {'account': self.account, 'state': self.state}
+
+    def raw_write(self, s):
+        self.sent.append(s)
+
+    def write(self, p):
+        self.sent.append(Endpoint.encode(p))
+
+
+class TestLobbyDelta(object):
+    def lobby(self):
+        from server.core.lobby import Lobby
+        return Lobby()
+
+    def send(self, lobby):
+        lobby.update_lobby_state()
+        lobby.send_lobbyinfo([u for u in lobby.users.values() if u.state == 'hang'])
+        gevent.sleep(0.01)
+
+    def testDelta(self):
+        lobby = self.lobby()
+        a, b = FakeUser(1), FakeUser(2)
+        g = FakeGame(1)
+        lobby.users[1] = a
+        lobby.games[1] = g
+        self.send(lobby)
+
+        eq_(len(a.sent), 2)  # snapshot and your_account
+        eq_(a.lobby_version, 1)
+        a.sent = []
+
+        lobby.users[2] = b
+        g.params['x'] = 2
+        self.send(lobby)
+
+        eq_(len(a.sent), 1)
+        fmt, (cmd, delta) = msgpack.unpackb(a.sent[0], encoding='utf-8')
+        eq_(cmd, 'lobby_delta')
+        base, ver, games, removed_games, users, removed_users = delta
+        eq_((base, ver), (1, 2))
+        eq_(games, [{'id': 1, 'started': False, 'params': {'x': 2}}])
+        eq_(users, [{'account': ['forum', 2, {'credits': 0}], 'state': 'hang'}])
+        eq_((removed_games, removed_users), ([], []))
+        eq_(b.lobby_version, 2)
+        a.sent = []
+
+        # nothing changed, nothing sent
+        self.send(lobby)
+        eq_(a.sent, [])
+
+        # account data changed in place, delta and your_account
+        a.account.other['credits'] = 10
+        b.sent = []
+        self.send(lobby)
+        eq_(len(a.sent), 2)
+        fmt, (cmd, delta) = msgpack.unpackb(a.sent[0], encoding='utf-8')
+        eq_(delta[4], [{'account': ['forum', 1, {'credits': 10}], 'state': 'hang'}])
+        fmt, (cmd, acc) = msgpack.unpackb(a.sent[1], encoding='utf-8')
+        eq_((cmd, acc), ('your_account', ['forum', 1, {'credits': 10}]))
+        eq_(len(b.sent), 1)  # not b's account, delta only
+        a.sent, b.sent = [], []
+
+        # back from a game, gets a snapshot
+        b.state = 'ingame'
+        lobby.games.pop(1)
+        self.send(lobby)
+        b.state = 'hang'
+        self.send(lobby)
+        fmt, (cmd, delta) = msgpack.unpackb(a.sent[0], encoding='utf-8')
+        eq_(delta[3], [1])
+        eq_(delta[5], [])
+        eq_(len(b.sent), 2)  # snapshot and your_account
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+# -- third party --
+from nose.tools import eq_
+
+# -- own --
+from utils.metrics import Histogram, Metrics
+
+
+# -- code --
+class TestMetrics(object):
+    def testHistogram(self):
+        h = Histogram([1, 10, 100])
+        for v in [0.5, 5, 5, 50, 500]:
+            h.add(v)
+
+        eq_(h.buckets, [1, 2, 1, 1])
+        eq_(h.percentile(50), 10)
+        eq_(h.percentile(100), 500)
+
+        m = Metrics()
+        m.enable(sample_every=2)
+        eq_([m.sample() for _ in xrange(4)], [False, True, False, True])
+        m.observe('event', 'meh', 3)
+        eq_(m.dump()['metrics']['event']['meh']['count'], 1)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+import time
+
+# -- third party --
+from nose.tools import eq_
+import gevent
+import greenlet
+
+# -- own --
+from utils.gevent_ext import add_switch_hook, remove_switch_hook
+from utils.profiler import SamplingProfiler
+
+
+# -- code --
+class TestProfiler(object):
+    def makeProfiler(self):
+        from utils.profiler import get_ident
+
+        # sampled by hand from the main thread, no sampler thread timing involved
+        p = SamplingProfiler()
+        p.current   = (gevent.getcurrent(),)
+        p.thread_id = get_ident()
+        return p
+
+    def testSample(self):
+        p = self.makeProfiler()
+
+        class Busy(gevent.Greenlet):
+            def profile_label(self):
+                return ['Mode', 'game 1']
+
+            def _run(self):
+                for i in xrange(3):
+                    p.sample()
+                    gevent.sleep(0)
+
+        add_switch_hook(p._switched)
+        try:
+            Busy.spawn().join()
+            p.sample()
+        finally:
+            remove_switch_hook(p._switched)
+
+        eq_(p.dropped, 0)
+        eq_(sum(p.samples.values()), 4)
+        busy = [k for k in p.samples if k.startswith('Mode;game 1;')]
+        eq_(len(busy), 1)
+        assert '_run (test_profiler.py' in busy[0]
+        eq_(p.samples[busy[0]], 3)
+        eq_(p.folded().count('\n'), len(p.samples))
+
+    def testSwitchDuringSample(self):
+        p = self.makeProfiler()
+        other = gevent.spawn(lambda: None)
+        real_frame = p._frame
+
+        def switched_frame():
+            # greenlet switched after the label was read
+            p._switched(p.current[0], other)
+            return real_frame()
+
+        p._frame = switched_frame
+        p.sample()
+        eq_((p.dropped, len(p.samples)), (1, 0))
+        other.kill()
+
+    def testSampleInSwitchTracer(self):
+        p = self.makeProfiler()
+        seen = []
+
+        def hook(origin, target):
+            seen or (p.sample(), seen.append(1))
+
+        add_switch_hook(hook)
+        try:
+            gevent.sleep(0)
+        finally:
+            remove_switch_hook(hook)
+
+        eq_((p.dropped, len(p.samples)), (1, 0))
+
+
+class TestWatchdog(object):
+    def testBlocked(self):
+        from utils.watchdog import BlockingWatchdog
+
+        class Game(gevent.Greenlet):
+            action_stack = [1.0, 'x']
+            hybrid_stack = [1.0, 'x']
+
+            def profile_label(self):
+                return ['Mode', 'game 1']
+
+            def _run(self):
+                end = time.time() + 0.1
+                while time.time() < end:
+                    pass
+
+        w = BlockingWatchdog()
+        w.start(threshold=0.03, interval=10)
+        try:
+            eq_(greenlet.gettrace(), None)  # nothing runs on switches
+            Game.spawn().join()
+            gevent.sleep(0.01)  # a well behaved greenlet, not reported
+            eq_(len(w.reports), 1)
+            r = w.reports[0]
+            eq_(r['label'], 'Mode:game 1')
+            eq_(r['actions'], ['float', 'str'])
+            eq_(r['handler'], 'str')
+            assert '_run' in r['stack']
+        finally:
+            w.stop()
+
+        eq_(len(w.reports), 0)
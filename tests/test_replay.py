@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+import zlib
+
+# -- third party --
+from nose.tools import eq_
+import msgpack
+
+# -- own --
+from client.core.replay import Replay
+
+
+# -- code --
+class TestReplay(object):
+    def makeReplay(self, n):
+        rep = Replay()
+        rep.client_version = 'abc'
+        rep.game_mode = 'THBattle'
+        rep.users = [{'id': 1}]
+        rep.me_index = 0
+        rep.gamedata = [['Sync:%d' % i, i] for i in xrange(n)]
+        return rep
+
+    def testRoundTrip(self):
+        rep = self.makeReplay(1000)
+        rep2 = Replay.loads(rep.dumps())
+        eq_(rep2.game_mode, 'THBattle')
+        eq_(len(rep2.gamedata), 1000)
+        eq_(list(rep2.gamedata), rep.gamedata)
+        eq_(rep2.gamedata[700], ['Sync:700', 700])
+        eq_(list(rep2.gamedata.iter_from(998)), rep.gamedata[998:])
+        eq_(rep2.gamedata.locate(513), 513)
+        eq_(rep2.gamedata.locate(5000), 1000)
+
+    def testLegacy(self):
+        data = zlib.compress(msgpack.packb({
+            'ver': 1, 'cliver': 'abc', 'mode': 'THBattle', 'params': {},
+            'items': {}, 'users': [], 'index': 0, 'track_info': None,
+            'data': [['Sync:1', 1]],
+        }))
+        rep = Replay.loads(data)
+        eq_(rep.version, 1)
+        eq_(list(rep.gamedata), [['Sync:1', 1]])
+
+    def testSeek(self):
+        from client.core.endpoint import ReplayEndpoint
+
+        rep = Replay.loads(self.makeReplay(1000).dumps())
+        ep = ReplayEndpoint(rep, None)
+        ep.seek(600)
+        eq_(ep.seek_to, 600)
+        eq_(list(ep.gexpect('Sync:300')), ['Sync:300', 300])
+        assert ep.seeking
+        eq_(list(ep.gexpect('Sync:599')), ['Sync:599', 599])
+        assert not ep.seeking
+        ep.seek(10)  # backwards, ignored
+        assert not ep.seeking
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+import os
+import tempfile
+
+# -- third party --
+from nose.tools import eq_
+
+# -- own --
+
+
+# -- code --
+class TestSimulator(object):
+    @classmethod
+    def setUpClass(cls):
+        from game import autoenv
+        autoenv.init('Server')
+
+        # undo Game.getgame stubs left by other tests
+        from gevent import getcurrent
+        from server.core import Game
+        from thb import modes
+        Game.getgame = staticmethod(lambda: getcurrent().game)
+        for c in [autoenv.Game] + modes.values():
+            if 'getgame' in c.__dict__:
+                delattr(c, 'getgame')
+
+    def testKOFSelfPlay(self):
+        from server.sim import Simulator
+
+        sim = Simulator('THBattleKOF')
+        rst = sim.run_game(seed=1234)
+
+        eq_(rst.error, None)
+        eq_(rst.mode, 'THBattleKOF')
+        eq_(len(rst.winners), 1)
+        assert rst.synctag > 0
+
+    def testSameSeedSameGame(self):
+        from server.sim import Simulator
+
+        for mode in ('THBattleKOF', 'THBattleIdentity'):
+            a = Simulator(mode).run_game(seed=42)
+            b = Simulator(mode).run_game(seed=42)
+            eq_(a.error, None)
+            eq_((a.winners, a.synctag), (b.winners, b.synctag))
+
+    def testRecordAndReplay(self):
+        from game.archive import load_archive
+        from server.sim import Simulator
+
+        fd, path = tempfile.mkstemp('.gz')
+        os.close(fd)
+
+        try:
+            for mode in ('THBattleKOF', 'THBattle', 'THBattleIdentity', 'THBattle2v2'):
+                os.unlink(path)
+                sim = Simulator(mode)
+                rst = sim.record_game(path, seed=22)
+                eq_(rst.error, None)
+
+                arc = load_archive(path)
+                eq_(arc.mode, mode)
+                eq_(arc.seed, 22)
+                assert arc.usergdhistory
+
+                replayed = sim.replay_archive(arc)
+                eq_(replayed.error, None)
+                eq_(replayed.leftover, 0)
+                eq_((replayed.winners, replayed.synctag), (rst.winners, rst.synctag))
+        finally:
+            os.unlink(path)
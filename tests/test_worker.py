@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+# -- stdlib --
+# -- third party --
+from gevent import socket
+from nose.tools import eq_
+import gevent
+
+# -- own --
+from game.base import Action, GameEnded
+
+
+# -- code --
+class EchoAction(Action):
+    def apply_action(self):
+        from server.core.game_server import Game
+        g = Game.getgame()
+        p, q = g.players
+        tag, data = p.client.gexpect('Echo')
+        q.client.gwrite('Echoed', data)
+        q.client.gexpect('Done')
+        g.winners = [p]
+        g.ended = True
+        raise GameEnded
+
+
+class FakePlayer(object):
+    is_npc  = False
+    dropped = False
+    fleed   = False
+
+    def __init__(self, account):
+        self.account = account
+        self.client = FakeClient(account)
+
+    def set_dropped(self, v=True):
+        self.dropped = v
+
+    def set_fleed(self, v=True):
+        self.fleed = v
+
+
+class FakeClient(object):
+    def __init__(self, account):
+        self.account = account
+
+
+class FakeManager(object):
+    def __init__(self, gid, gamecls, players):
+        from utils import ObjectDict
+        self.gameid              = gid
+        self.gamecls             = gamecls
+        self.game_params         = {}
+        self.consumed_game_items = {}
+        self.game                = ObjectDict(players=players, rndseed=1234)
+        self.frames              = []
+        self.user_gamedata       = []
+
+    def deliver_gamedata(self, uid, frame):
+        self.frames.append((uid, frame))
+
+    def record_user_gamedata_raw(self, uid, tag, data):
+        self.user_gamedata.append((uid, tag))
+
+
+class FakeLobby(object):
+    def __init__(self):
+        self.ended = []
+
+    def end_game(self, manager):
+        self.ended.append(manager)
+
+    def force_end_game(self, manager):
+        self.ended.append(manager)
+
+
+class TestGameWorker(object):
+    def setUp(self):
+        from game import autoenv
+        autoenv.init('Server')
+
+        from server.core.game_server import Game
+        from server.subsystem import Subsystem
+        from thb import modes
+
+        class EchoGame(Game):
+            def bootstrap(self, params, items):
+                return EchoAction(None, None)
+
+            def get_stats(self):
+                return []
+
+            def can_leave(self, p):
+                return False
+
+        self.modes = modes
+        modes['EchoGame'] = EchoGame
+        self.gamecls = EchoGame
+
+        self.saved_lobby = getattr(Subsystem, 'lobby', None)
+        self.lobby = Subsystem.lobby = FakeLobby()
+
+    def tearDown(self):
+        from server.subsystem import Subsystem
+        self.modes.pop('EchoGame', None)
+        Subsystem.lobby = self.saved_lobby
+
+    def testGameLifecycle(self):
+        from account import Account
+        from server.core.worker import GameWorker, WorkerLink
+
+        a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        link = WorkerLink(a, 0)
+        worker = GameWorker(b)
+        gevent.spawn(link.serve)
+        gevent.spawn(worker.serve)
+
+        alice = FakePlayer(Account.build_npc_account('Alice'))
+        bob   = FakePlayer(Account.build_npc_account('Bob'))
+        mgr = FakeManager(1, self.gamecls, [alice, bob])
+        link.start_game(mgr)
+        gevent.sleep(0.05)
+
+        eq_(link.games, {1: mgr})
+        eq_(worker.games.keys(), [1])
+
+        # gamedata from lobby users reaches the game,
+        # what the game writes comes back as frames
+        alice.client.gamedata.feed(['Echo', 'hello'])
+        gevent.sleep(0.05)
+
+        eq_(mgr.user_gamedata, [(alice.account.userid, 'Echo')])
+        eq_(len(mgr.frames), 1)
+        uid, frame = mgr.frames[0]
+        eq_(uid, bob.account.userid)
+        eq_(link.decode(frame), ['gamedata', ['Echoed', 'hello']])
+
+        # game still running, leaving drops alice
+        eq_(link.exit_game(mgr, alice, False), False)
+
+        bob.client.gamedata.feed(['Done', None])
+        gevent.sleep(0.05)
+
+        eq_(self.lobby.ended, [mgr])
+        eq_(link.games, {})
+        eq_(worker.games, {})
+        eq_((alice.dropped, alice.fleed), (True, True))
+        eq_((bob.dropped, bob.fleed), (False, False))
+        eq_(mgr.game.winners, [alice])
+        eq_(mgr.game.suicide, False)
+
+        # metrics published by the worker
+        worker.write(['metrics', [{'metrics': {}}]])
+        gevent.sleep(0.05)
+        eq_(link.metrics, {'metrics': {}})
+
+        # unknown commands are logged and skipped
+        link.write(['no_such_command', []])
+        eq_(link.exit_game(mgr, bob, False), True)
+
+        link.close()
+        gevent.sleep(0.05)
+        eq_(worker.link_state, 'disconnected')
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+# -- prioritized --
+import sys
+sys.path.append('../src')
+
+from game import autoenv
+autoenv.init('Server')
+
+# -- stdlib --
+from argparse import ArgumentParser
+from collections import defaultdict
+import json
+import logging
+import os
+import random
+import resource
+
+# -- third party --
+# -- own --
+from game.archive import load_archive
+from server.sim import Simulator
+
+# -- code --
+'''
+Engine throughput benchmark.
+
+Replays a corpus of server game archives through the server side game
+logic as fast as possible, each game mode in its own forked process:
+
+    python benchmark.py run /path/to/archives [more archives or dirs ...]
+
+Without production archives at hand, a corpus can be made by self-play:
+
+    python benchmark.py record THBattleIdentity -n 50 -o /tmp/corpus
+
+Gamedata wire encoding, per format:
+
+    python benchmark.py codec
+'''
+
+parser = ArgumentParser('benchmark')
+sub = parser.add_subparsers(dest='cmd')
+
+p = sub.add_parser('run')
+p.add_argument('paths', nargs='+')
+p.add_argument('--repeat', type=int, default=1)
+p.add_argument('--timeout', type=float, default=120)
+p.add_argument('--json', action='store_true', help='Print results as json')
+
+p = sub.add_parser('record')
+p.add_argument('mode')
+p.add_argument('-n', type=int, default=20)
+p.add_argument('-o', '--output', required=True)
+p.add_argument('--seed', type=int, default=None)
+
+p = sub.add_parser('codec')
+p.add_argument('-n', type=int, default=5000)
+
+parser.add_argument('--log', default='ERROR')
+
+options = parser.parse_args()
+logging.basicConfig(stream=sys.stderr, level=getattr(logging, options.log.upper()))
+
+
+def collect(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for fn in sorted(os.listdir(path)):
+                yield os.path.join(path, fn)
+        else:
+            yield path
+
+
+def bench_mode(mode, archives):
+    sim = Simulator(mode)
+    rst = defaultdict(int)
+    rst['mode'] = mode
+    rst['baseline_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # failed or diverged replays didn't run the recorded game,
+    # they are counted but left out of the throughput numbers
+    rst['elapsed'] = 0.0
+    for _ in xrange(options.repeat):
+        for arc in archives:
+            r = sim.replay_archive(arc, options.timeout)
+            rst['games'] += 1
+            if r.error:
+                rst['failed'] += 1
+            elif r.leftover:
+                rst['diverged'] += 1
+            else:
+                rst['actions'] += r.actions
+                rst['events'] += r.events
+                rst['elapsed'] += r.duration
+
+    rst['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return dict(rst)
+
+
+def run_isolated(mode, archives):
+    # one process per mode, so peak memory is per mode
+    r, w = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(r)
+        try:
+            os.write(w, json.dumps(bench_mode(mode, archives)))
+        finally:
+            os._exit(0)
+
+    os.close(w)
+    data = []
+    while True:
+        s = os.read(r, 65536)
+        if not s:
+            break
+
+        data.append(s)
+
+    os.close(r)
+    os.waitpid(pid, 0)
+    return json.loads(''.join(data)) if data else {'mode': mode, 'error': 'crashed'}
+
+
+def cmd_run():
+    by_mode = defaultdict(list)
+    for fn in collect(options.paths):
+        try:
+            arc = load_archive(fn)
+        except Exception as e:
+            logging.warning('Skipping %s: %r', fn, e)
+            continue
+
+        by_mode[arc.mode].append(arc)
+
+    results = [run_isolated(mode, by_mode[mode]) for mode in sorted(by_mode)]
+
+    if options.json:
+        print json.dumps(results, indent=2)
+        return
+
+    fmt = '%-18s %6s %6s %6s %10s %10s %8s %10s %10s %9s'
+    print fmt % ('Mode', 'Games', 'Failed', 'Diverg', 'Actions', 'Events', 'Ev/Act', 'Actions/s', 'Events/s', 'PeakRSS')
+    for r in results:
+        if 'error' in r:
+            print '%-18s %s' % (r['mode'], r['error'])
+            continue
+
+        t = r['elapsed'] or 1e-9
+        print fmt % (
+            r['mode'], r['games'], r['failed'], r['diverged'],
+            r['actions'], r['events'],
+            '%.2f' % (float(r['events']) / max(r['actions'], 1)),
+            '%.0f' % (r['actions'] / t),
+            '%.0f' % (r['events'] / t),
+            '%.1fM' % (r['peak_rss'] / 1024.0),
+        )
+
+
+def cmd_record():
+    if not os.path.isdir(options.output):
+        os.makedirs(options.output)
+
+    rnd = random.Random(options.seed)
+    sim = Simulator(options.mode)
+    for i in xrange(options.n):
+        path = os.path.join(options.output, 'sim-%s-%d.gz' % (options.mode, i))
+        if os.path.exists(path):
+            os.unlink(path)
+
+        r = sim.record_game(path, rnd.getrandbits(63))
+        print '%s\t%s\t%.3fs' % (path, r.error or 'ok', r.duration)
+
+    # archives are written in the hub threadpool, stop it before exiting
+    from gevent.hub import get_hub
+    get_hub().threadpool.kill()
+
+
+def cmd_codec():
+    import timeit
+    import thb  # noqa, FMT_COMPACT tables
+    from endpoint import Endpoint
+    from game.base import Gamedata
+    from thb.cards import Card
+
+    cards = []
+    for i, (_, cls) in enumerate(sorted(Card.card_classes.items())[:20]):
+        c = cls(Card.SPADE, i % 13 + 1)
+        c.sync_id, c.track_id = 1000 + i, i
+        cards.append(c)
+
+    frames = [
+        ('reveal 20 cards', 'Sync:1234', cards),
+        ('input', 'RI:ChooseOption:2345', True),
+    ]
+
+    n = options.n
+    fmt = '%-16s %-8s %6s %10s %10s'
+    print fmt % ('Frame', 'Format', 'Bytes', 'Encode/us', 'Decode/us')
+    for name, tag, data in frames:
+        for fmt_name, wire in (('packed', Endpoint.FMT_PACKED), ('compact', Endpoint.FMT_COMPACT)):
+            s = Gamedata.encode(tag, data, wire)
+            enc = min(timeit.repeat(lambda: Gamedata.encode(tag, data, wire), number=n, repeat=5))
+            dec = min(timeit.repeat(lambda: Endpoint.decode(s), number=n, repeat=5))
+            print fmt % (name, fmt_name, len(s), '%.1f' % (enc / n * 1e6), '%.1f' % (dec / n * 1e6))
+
+
+{'run': cmd_run, 'record': cmd_record, 'codec': cmd_codec}[options.cmd]()
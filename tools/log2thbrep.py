@@ -7,13 +7,12 @@ sys.path.append('../src')
 # -- stdlib --
 from urlparse import urljoin
 import argparse
-import gzip
-import json
 
 # -- third party --
 # -- own --
 from client.core.replay import Replay
 from game import autoenv
+from game.archive import load_archive
 from settings import ACCOUNT_FORUMURL
 
 
@@ -43,26 +42,14 @@ def main():
     parser.add_argument('--freeplay', action='store_true', help='Use freeplay account module?')
     options = parser.parse_args()
 
-    if options.replay_file.endswith('.gz'):
-        data = gzip.open(options.replay_file, 'r').read()
-    else:
-        data = open(options.replay_file, 'r').read()
-
-    data = data.decode('utf-8').split('\n')
-    names = data.pop(0)[2:].split(', ')  # Names
-    data.pop(0)  # Ver
-    gid = int(data.pop(0).split()[-1])  # GameId
-    data.pop(0)  # Time
-
-    game_mode, game_params, game_items, rnd_seed, usergdhist, gdhist = data
-    gdhist = json.loads(gdhist)
-    game_params = json.loads(game_params)
+    arc = load_archive(options.replay_file)
+    names, gid, gdhist = arc.names, arc.gameid, arc.gdhistory
 
     rep = Replay()
     rep.client_version = options.client_version
-    rep.game_mode = game_mode
-    rep.game_params = game_params
-    rep.game_items = json.loads(game_items)
+    rep.game_mode = arc.mode
+    rep.game_params = arc.params
+    rep.game_items = arc['items']
     rep.users = [gen_fake_account(i, options.freeplay) for i in names]
 
     assert len(names) == len(gdhist), [names, len(gdhist)]
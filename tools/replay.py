@@ -10,8 +10,6 @@ Game.CLIENT_SIDE = 'blah'  # Hack: not loading ui resource
 
 # -- stdlib --
 from argparse import ArgumentParser
-import gzip
-import json
 import logging
 import pdb
 
@@ -21,6 +19,7 @@ from colorlog import ColoredFormatter
 # -- own --
 from account.freeplay import Account
 from client.core import PeerPlayer, TheLittleBrother
+from game.archive import load_archive
 from thb import modes
 from utils import BatchList, hook
 
@@ -102,27 +101,17 @@ class MockServer(object):
         pass
 
 
-if options.replay_file.endswith('.gz'):
-    data = gzip.open(options.replay_file, 'r').read()
-else:
-    data = open(options.replay_file, 'r').read()
+arc = load_archive(options.replay_file)
+print '# ' + ', '.join(arc.names).encode('utf-8')
+print '# Ver: %s' % arc.version
+print '# GameId: %s' % arc.gameid
 
-data = data.split('\n')
-
-while True:
-    last = data.pop(0)
-    if not last.startswith('#'):
-        break
-    print last
-
-mode = last
-params = json.loads(data.pop(0))
-items = json.loads(data.pop(0))
-data.pop(0)  # seed
-data.pop(0)  # server data
+mode = arc.mode
+params = arc.params
+items = arc['items']
 
 loc = options.location
-gdlist = json.loads(data.pop(0))[loc]
+gdlist = arc.gdhistory[loc]
 
 server = MockServer(gdlist)
 Executive = MockExecutive(server)
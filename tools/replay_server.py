@@ -7,8 +7,6 @@ autoenv.init('Server')
 # -- stdlib --
 from argparse import ArgumentParser
 from weakref import WeakSet
-import gzip
-import json
 import logging
 import random
 import sys
@@ -21,7 +19,8 @@ import gevent
 # -- own --
 from account.freeplay import Account
 from endpoint import EndpointDied
-from game import Gamedata
+from game.archive import load_archive
+from game.base import Gamedata
 from server.core import Player, NPCPlayer, NPCClient
 from utils import BatchList
 
@@ -92,20 +91,13 @@ class MockClient(object):
     def gclear(self):
         pass
 
-if options.replay_file.endswith('.gz'):
-    data = gzip.open(options.replay_file, 'r').read().split('\n')
-else:
-    data = open(options.replay_file, 'r').read().split('\n')
+arc = load_archive(options.replay_file)
+mode = arc.mode
+params = arc.params
+items = arc['items']
+rndseed = arc.seed
 
-while data[0].startswith('#'):
-    print data.pop(0)
-
-mode = data.pop(0)
-params = json.loads(data.pop(0))
-items = json.loads(data.pop(0))
-rndseed = long(data.pop(0))
-
-gdlist = json.loads(data.pop(0))
+gdlist = arc.usergdhistory
 gdlist_tag = set(tuple(i[:2]) for i in gdlist)
 print gdlist_tag
 
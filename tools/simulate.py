@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# -- prioritized --
+import sys
+sys.path.append('../src')
+
+from gevent import monkey
+monkey.patch_all()
+
+from game import autoenv
+autoenv.init('Server')
+
+# -- stdlib --
+from argparse import ArgumentParser
+from collections import Counter
+import logging
+import time
+
+# -- third party --
+# -- own --
+from server.sim import Simulator
+
+# -- code --
+parser = ArgumentParser('simulate')
+parser.add_argument('mode', type=str)
+parser.add_argument('-n', type=int, default=100)
+parser.add_argument('--seed', type=int, default=None)
+parser.add_argument('--game-seed', type=int, default=None, help='rerun a single game, as reported by Failed:')
+parser.add_argument('--timeout', type=float, default=60)
+parser.add_argument('--log', default='ERROR')
+parser.add_argument('--quiet', action='store_true')
+
+options = parser.parse_args()
+
+logging.basicConfig(stream=sys.stderr, level=getattr(logging, options.log.upper()))
+
+sim = Simulator(options.mode)
+wins = Counter()
+errors = []
+durations = []
+
+begin = time.time()
+if options.game_seed is not None:
+    options.n = 1
+    games = [sim.run_game(options.game_seed, options.timeout)]
+else:
+    games = sim.run(options.n, options.seed, options.timeout)
+
+for rst in games:
+    options.quiet or sys.stdout.write('%(gameid)d\t%(seed)d\t%(winners)s\t%(synctag)d\t%(duration).3f\t%(error)s\n' % rst)
+    durations.append(rst.duration)
+    if rst.error:
+        errors.append(rst)
+    else:
+        wins.update(rst.winners)
+
+elapsed = time.time() - begin
+finished = options.n - len(errors)
+
+print '-' * 40
+print 'Mode:       %s' % options.mode
+print 'Games:      %d, %d failed' % (options.n, len(errors))
+print 'Elapsed:    %.2fs, %.1f games/min' % (elapsed, options.n * 60 / elapsed)
+print 'Per game:   avg %.3fs, max %.3fs' % (sum(durations) / len(durations), max(durations))
+for seat in sorted(wins):
+    print 'Seat %d:     %.1f%% wins' % (seat, wins[seat] * 100.0 / max(finished, 1))
+
+for rst in errors:
+    print 'Failed:     game %(gameid)d, seed %(seed)d, %(error)s' % rst